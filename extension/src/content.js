@@ -311,6 +311,9 @@ console.log("GitHub Code Explainer extension loaded!");
 let tooltip = null;
 let currentSelection = null;
 let isLoading = false;
+// Ties /prefetch warm-ups to the /select calls from this tab
+const sessionId = crypto.randomUUID();
+let lastPrefetched = null;
 
 // Check if we're on a GitHub page
 function isGitHubPage() {
@@ -698,6 +701,7 @@ export async function explainCode(
       file: repoInfo.file,
       selected_text: selectedText,
       language: getLanguageFromFile(repoInfo.file),
+      session_id: sessionId,
     });
 
     console.log("[explain] POST", `${base}/select`, {
@@ -841,6 +845,32 @@ function getLanguageFromFile(filename) {
   return langMap[ext] || "text";
 }
 
+// Warm server-side retrieval for the file being viewed, before any selection
+async function prefetchFile() {
+  if (!isGitHubPage()) return;
+  const repoInfo = getRepoInfo();
+  if (!repoInfo || !repoInfo.file) return;
+
+  const key = `${repoInfo.owner}/${repoInfo.repo}@${repoInfo.sha}:${repoInfo.file}`;
+  if (key === lastPrefetched) return;
+  lastPrefetched = key;
+
+  try {
+    const { serverUrl } = await chrome.storage.local.get(["serverUrl"]);
+    const base = serverUrl || "http://localhost:8787";
+    const resp = await fetch(`${base}/prefetch`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ ...repoInfo, session_id: sessionId }),
+    });
+    const result = await resp.json();
+    console.log("[prefetch]", key, result);
+  } catch (error) {
+    // Only a warm-up; /select works without it
+    console.warn("[prefetch] failed:", error);
+  }
+}
+
 // Handle text selection with improved UX
 async function handleSelection() {
   if (!isGitHubPage()) {
@@ -1002,6 +1032,10 @@ function init() {
   // Add a "Clone" button to the page
   addCloneButton();
 
+  // Warm retrieval for this file, and again after GitHub's in-page navigation
+  prefetchFile();
+  document.addEventListener("turbo:load", prefetchFile);
+
   console.log("Event listeners attached successfully");
 }
 
@@ -1,15 +1,32 @@
+import os
 import uuid
 import logging
 from fastapi import FastAPI, Depends, HTTPException, Request
 from dotenv import load_dotenv
-from app.schemas import IngestReq, HoverReq, HoverResp, SelectReq, SelectResp, CloneReq, CloneResp
+from app.schemas import (
+    IngestReq, HoverReq, HoverResp, SelectReq, SelectResp, CloneReq, CloneResp,
+    IngestRepoReq, IngestRepoResp, IngestStatusResp, PrefetchReq, PrefetchResp,
+)
 # from app.deps import require_auth, jobs_store
 from app import vectordb as retrieval
 from app import prompt
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
+from starlette.background import BackgroundTask
+from fastapi.concurrency import run_in_threadpool
 from app import stream
+from app.response_cache import response_cache, cache_key as response_cache_key
+from app.singleflight import Flight, select_flights
+from app.prefetch import warm_cache, PREFETCH_TTL
+from app.embeddings import query_embedding_cache
 import json
-from app.ingest import ingest_repo
+from app.ingest import get_ingestion_status, index_version
+from app import repos
+from app import jobs
+from app import metrics
+from app import timing
+from app.profiler import ProfilingMiddleware
+import time
+from typing import Optional
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -32,82 +49,132 @@ def status(repo: str, prNumber: int, commit: str):
         return {"status": "indexing"}
 
 
-@app.post("/select")
-async def select_code(req: SelectReq, request: Request):
+NDJSON_HEADERS = {
+    "X-Accel-Buffering": "no",
+    "Cache-Control": "no-cache, no-transform",
+}
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "response_cache": response_cache.stats(),
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "select_single_flight": select_flights.stats(),
+        "prefetch_warm_cache": warm_cache.stats(),
+    }
+
+
+metrics.register_cache_stats("response-cache", response_cache.stats)
+metrics.register_cache_stats("query-embedding-cache", query_embedding_cache.stats)
+metrics.register_cache_stats("prefetch-warm-cache", warm_cache.stats)
+
+def timing_trailer(request_timing: timing.RequestTiming) -> bytes:
+    """Final NDJSON line with the full per-stage breakdown in milliseconds"""
+    return (json.dumps({"timing": request_timing.as_dict()}) + "\n").encode("utf-8")
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text-format metrics"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.post("/prefetch", response_model=PrefetchResp)
+async def prefetch_file(req: PrefetchReq, response: Response):
+    """Warm retrieval for a file the user is viewing, before anything is selected.
+
+    Loads the file's chunks and their nearest neighbours into this session's
+    warm cache; a later /select in the file skips the query embedding and
+    vector search.
+    """
+    request_timing = timing.start()
+    key = warm_cache.key(req.session_id, req.owner, req.repo, req.sha, req.file)
+    warm = warm_cache.get(key)
+    if warm is not None:
+        response.headers["Server-Timing"] = request_timing.header()
+        return PrefetchResp(success=True, message="Already warm", chunks=len(warm.chunks),
+                            cached=True, expires_in=PREFETCH_TTL)
     try:
-        # Fetch related context from ChromaDB
-        related_snippets = []
-        try:
-            # Generate collection name based on repo info
-            coll_name = retrieval.collection_name(f"{req.owner}/{req.repo}", 1, "main")
-            
-            # Search for similar code snippets using the selected text as query
-            search_results = retrieval.search_similar_code(
-                collection_name=coll_name,
-                query=req.selected_text,
-                n_results=5
+        with timing.stage('warm_build'):
+            warm = await run_in_threadpool(
+                retrieval.warm_file,
+                retrieval.repo_collection_name(req.owner, req.repo),
+                req.file,
             )
-            
-            if search_results and 'documents' in search_results:
-                # Format search results for the prompt
-                for i in range(len(search_results['documents'])):
-                    if i < len(search_results['documents']):
-                        snippet = {
-                            'documents': [search_results['documents'][i]],
-                            'metadatas': [search_results['metadatas'][i]] if search_results.get('metadatas') and i < len(search_results['metadatas']) else [{}]
-                        }
-                        related_snippets.append(snippet)
-                        
-            logging.info(f"Found {len(related_snippets)} related code snippets for context")
-            
-        except Exception as e:
-            logging.warning(f"Failed to fetch context from ChromaDB: {e}")
-            # Continue without context if vector search fails
-        
-        # Build messages with context
-        messages = prompt.build_messages(
-            repo=f"{req.owner}/{req.repo}",
-            file=req.file,
-            lang=req.language,
-            selected=req.selected_text,
-            related_snips=related_snippets if related_snippets else None
-        )
+    except Exception as e:
+        response.headers["Server-Timing"] = request_timing.header()
+        return PrefetchResp(success=False, message=f"Failed to prefetch {req.file}: {str(e)}")
+    response.headers["Server-Timing"] = request_timing.header()
+    if not warm.chunks:
+        return PrefetchResp(success=False, message=f"No indexed chunks for {req.file}")
+    warm_cache.put(key, warm)
+    return PrefetchResp(success=True, message=f"Prefetched {req.file}", chunks=len(warm.chunks),
+                        expires_in=PREFETCH_TTL)
+
+
+# Seconds an index version read from the state store is reused for
+INDEX_VERSION_TTL = float(os.getenv("INDEX_VERSION_TTL", "1"))
+_index_versions = {}
+
+def current_index_version(owner: str, repo: str) -> str:
+    """ingest.index_version, re-read at most every INDEX_VERSION_TTL seconds per repo"""
+    now = time.monotonic()
+    cached = _index_versions.get((owner, repo))
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    version = index_version(owner, repo)
+    _index_versions[(owner, repo)] = (version, now + INDEX_VERSION_TTL)
+    return version
+
+
+@app.post("/select")
+async def select_code(req: SelectReq, request: Request):
+    request_timing = timing.start()
+    cache_key = response_cache_key(req.owner, req.repo, req.sha, req.file, req.selected_text, req.language,
+                                   current_index_version(req.owner, req.repo))
+    with timing.stage('cache'):
+        cached_lines = await response_cache.get(cache_key)
+    if cached_lines is not None:
+        request_timing.descriptions['cache'] = 'hit'
+
+        # Replay the finished NDJSON stream without touching retrieval or the model
+        async def replay():
+            for line in cached_lines:
+                yield line
+            yield timing_trailer(request_timing)
+            metrics.select_results.inc(outcome='cache_hit')
 
-        # 3) return streaming response
-        async def gen():
-            try:
-                # Stream model responses and wrap in NDJSON
-                async for chunk in stream.stream_model(messages, temperature=0.2, max_tokens=700):
-                    # chunk is already bytes from stream_model
-                    piece = chunk.decode("utf-8", errors="ignore") if isinstance(chunk, bytes) else str(chunk)
-                    line = json.dumps({"delta": piece}) + "\n"
-                    yield line.encode("utf-8")
-
-                    # Cooperative cancellation if client disconnects
-                    if await request.is_disconnected():
-                        break
-
-                # Emit an explicit done sentinel
-                yield (json.dumps({"done": True}) + "\n").encode("utf-8")
-
-            except Exception as e:
-                # Send error as NDJSON so the client can handle it uniformly
-                err_line = json.dumps({"error": str(e)}) + "\n"
-                yield err_line.encode("utf-8")
-
-        # >>> CHANGED: use NDJSON + anti-buffering headers
-        headers = {
-            "X-Accel-Buffering": "no",
-            "Cache-Control": "no-cache, no-transform",
-        }
         return StreamingResponse(
-            gen(),
+            replay(),
             media_type="application/x-ndjson; charset=utf-8",
-            headers=headers,
+            headers={**NDJSON_HEADERS, "X-Aura-Cache": "hit", "Server-Timing": request_timing.header()},
         )
-        
-    except Exception as e:
-        # Fallback explanation if Cerebras stream model fails
+
+    flight, leader = select_flights.join(cache_key)
+    released = False
+
+    def release():
+        # Once per request, whichever of gen() and the response's close gets here first
+        nonlocal released
+        if not released:
+            released = True
+            flight.release()
+
+    try:
+        if leader:
+            # Retrieval and the model stream run detached so identical requests can share them
+            select_flights.start(flight, explain_selection(req, flight, cache_key))
+            await flight.wait_ready()
+        else:
+            with timing.stage('coalesced'):
+                await flight.wait_ready()
+    except BaseException:
+        release()
+        raise
+
+    if flight.error is not None:
+        release()
+        # Fallback explanation if context or prompt building fails
         fallback_explanation = f"""**Code Analysis for {req.file}**
 
 **Selected Code:**
@@ -117,88 +184,258 @@ async def select_code(req: SelectReq, request: Request):
 
 **Repository:** {req.owner}/{req.repo}
 
-**Note:** Unable to generate AI explanation due to error: {str(e)}
+**Note:** Unable to generate AI explanation due to error: {flight.error}
 
 This appears to be code from the {req.owner}/{req.repo} repository. 
 Please review the selected code manually for its functionality and purpose.
 """
         
+        metrics.select_results.inc(outcome='fallback')
         return SelectResp(
             explanation=fallback_explanation,
             related_code=None
         )
 
-@app.post("/clone", response_model=CloneResp)
-def clone_repository(req: CloneReq):
-    """Clone a GitHub repository to the server - updated"""
+    async def gen():
+        # Replays what the flight already streamed, then follows it live
+        subscription = flight.subscribe()
+        try:
+            async for line in subscription:
+                yield line
+                # Cooperative cancellation if client disconnects
+                if await request.is_disconnected():
+                    return
+        finally:
+            await subscription.aclose()
+            release()
+        if not leader:
+            metrics.select_results.inc(outcome='coalesced')
+        # Timings that were not known when the headers went out
+        yield timing_trailer(request_timing)
+
+    return StreamingResponse(
+        gen(),
+        media_type="application/x-ndjson; charset=utf-8",
+        headers={**NDJSON_HEADERS, "X-Aura-Cache": "miss" if leader else "coalesced",
+                 "Server-Timing": request_timing.header()},
+        # Runs even if the client left before gen() ever started
+        background=BackgroundTask(release),
+    )
+
+
+def selection_lines(context: Optional[dict]):
+    """(start_line, end_line) of the selection if the client sent them in `context`"""
+    if not context:
+        return None
     try:
-        import subprocess
-        import os
-        import shutil
-        from pathlib import Path
-        
-        # Use ~/.aura directory (works both locally and in Docker)
-        home_dir = Path.home()
-        repos_dir = home_dir / ".aura"
-        repos_dir.mkdir(exist_ok=True)
-        
-        # Construct repository path
-        repo_path = repos_dir / f"{req.owner}_{req.repo}"
-        
-        # Remove existing directory if it exists
-        if repo_path.exists():
-            shutil.rmtree(repo_path)
-        
-        # Clone the repository
-        clone_url = f"https://github.com/{req.owner}/{req.repo}.git"
-        
-        # Use git from PATH (works in Docker container)
-        git_path = shutil.which("git")
-        if not git_path:
-            raise Exception("Git executable not found. Please ensure git is installed and in PATH.")
-        
-        result = subprocess.run(
-            ["git", "clone", clone_url, str(repo_path)],
-            capture_output=True,
-            text=True,
-            timeout=300,  # 5 minute timeout
-            cwd=str(repos_dir.parent)  # Set working directory to home
-        )
-        
-        if result.returncode != 0:
-            raise Exception(f"Git clone failed: {result.stderr}")
+        start = int(context['start_line'])
+        end = int(context.get('end_line', start))
+    except (KeyError, TypeError, ValueError):
+        return None
+    return (start, end) if 0 < start <= end else None
+
+
+async def explain_selection(req: SelectReq, flight: Flight, cache_key: str):
+    """Retrieve context, build the prompt and stream the model answer into `flight`.
+
+    Runs as the flight's own task (see singleflight), so it keeps going while
+    any identical request is still reading and is cancelled once none is.
+    Stages are recorded into the leading request's timing.
+    """
+    request_timing = timing.current()
+    # Precomputed neighbours if this session prefetched the file
+    warm = warm_cache.get(warm_cache.key(req.session_id, req.owner, req.repo, req.sha, req.file))
+    # Fetch related context from ChromaDB
+    related_snippets = []
+    # Answers built without repo context (e.g. not indexed yet) are not cached
+    context_ok = False
+    try:
+        # Generate collection name based on repo info
+        coll_name = retrieval.repo_collection_name(req.owner, req.repo)
         
-        print(f"Repository cloned to {repo_path}")
-        # Extract owner and repo from the request for proper collection naming
-        success = ingest_repo(
-            repo_path=str(repo_path),
-            repo_name=f"{req.owner}/{req.repo}",
-            pr_number=1,  # Default PR number for initial clone
-            commit="main"  # Default commit
+        # Search for similar code snippets using the selected text as query
+        # Embedding + Chroma calls are blocking; keep them off the event loop
+        search_results = await run_in_threadpool(
+            retrieval.search_similar_code,
+            collection_name=coll_name,
+            query=req.selected_text,
+            n_results=prompt.CONTEXT_CANDIDATES,
+            warm=warm,
+            relative_path=req.file,
+            line_range=selection_lines(req.context)
         )
         
-        if not success:
-            raise Exception("Failed to ingest repository into vector database")
-        print(f"Repository ingested successfully")
-        
-        return CloneResp(
-            success=True,
-            message=f"Repository {req.owner}/{req.repo} cloned successfully",
-            local_path=str(repo_path)
-        )
+        context_ok = search_results is not None
+        if search_results and search_results.get('documents'):
+            # Results are nested per query; we sent a single query
+            documents = search_results['documents'][0]
+            metadatas = (search_results.get('metadatas') or [[]])[0] or []
+            distances = (search_results.get('distances') or [[]])[0] or []
+            for i, document in enumerate(documents):
+                snippet = {
+                    'documents': [document],
+                    'metadatas': [metadatas[i] if i < len(metadatas) else {}],
+                    'distance': distances[i] if i < len(distances) else None
+                }
+                related_snippets.append(snippet)
+                    
+        logging.info(f"Found {len(related_snippets)} related code snippets for context")
         
-    except subprocess.TimeoutExpired:
-        return CloneResp(
-            success=False,
-            message="Repository cloning timed out (5 minutes)",
-            local_path=None
+    except Exception as e:
+        logging.warning(f"Failed to fetch context from ChromaDB: {e}")
+        # Continue without context if vector search fails
+    
+    # Definitions of what the selection calls or references, by direct lookup
+    definitions = await run_in_threadpool(
+        retrieval.find_definitions,
+        retrieval.repo_collection_name(req.owner, req.repo),
+        req.selected_text,
+        relative_path=req.file,
+        limit=prompt.CONTEXT_DEFINITIONS
+    )
+    if definitions and definitions['documents'][0]:
+        # Ahead of the search hits so a chunk found both ways keeps its definition label
+        related_snippets = [
+            {'documents': [document], 'metadatas': [metadata], 'symbol': symbol}
+            for document, metadata, symbol in zip(definitions['documents'][0], definitions['metadatas'][0],
+                                                  definitions['symbols'][0])
+        ] + related_snippets
+        logging.info(f"Found {len(definitions['documents'][0])} definitions for names in the selection")
+    
+    # Build messages with context
+    metrics.select_context_snippets.observe(len(related_snippets))
+    with timing.stage('prompt_build', metrics.select_stage):
+        messages = prompt.build_messages(
+            repo=f"{req.owner}/{req.repo}",
+            file=req.file,
+            lang=req.language,
+            selected=req.selected_text,
+            related_snips=related_snippets if related_snippets else None
         )
+    flight.mark_ready()
+
+    stream_state = {}
+    stream_start = time.perf_counter()
+    outcome = 'disconnected'  # unless we get to the end
+    # No is_disconnected here: the flight is cancelled when its last reader leaves
+    model_stream = stream.stream_model(
+        messages,
+        temperature=0.2,
+        max_tokens=700,
+        state=stream_state,
+    )
+    try:
+        # Stream model responses and wrap in NDJSON
+        async for chunk in model_stream:
+            # chunk is already bytes from stream_model
+            piece = chunk.decode("utf-8", errors="ignore") if isinstance(chunk, bytes) else str(chunk)
+            if not flight.lines:
+                ttft = time.perf_counter() - stream_start
+                request_timing.add('ttft', ttft)
+                metrics.select_stage.observe(ttft, stage='ttft')
+            flight.publish((json.dumps({"delta": piece}) + "\n").encode("utf-8"))
+
+        # Emit an explicit done sentinel
+        flight.publish((json.dumps({"done": True}) + "\n").encode("utf-8"), final=True)
+
+        # Only complete, error-free answers are worth replaying
+        if context_ok and not stream_state.get('error'):
+            await response_cache.set(cache_key, flight.lines)
+
+        outcome = 'error' if stream_state.get('error') else 'completed'
+
     except Exception as e:
+        outcome = 'error'
+        # Send error as NDJSON so the client can handle it uniformly
+        flight.publish((json.dumps({"error": str(e)}) + "\n").encode("utf-8"), final=True)
+
+    finally:
+        # Close the upstream completion right away instead of at GC time
+        await model_stream.aclose()
+        stream_seconds = time.perf_counter() - stream_start
+        request_timing.add('stream', stream_seconds)
+        metrics.select_stage.observe(stream_seconds, stage='stream')
+        metrics.select_results.inc(outcome=outcome)
+
+@app.post("/clone", response_model=CloneResp)
+def clone_repository(req: CloneReq, response: Response):
+    """Queue a clone + index job for a GitHub repository.
+
+    Returns right away with a job ID; progress is reported by /ingest/status.
+    See jobs.clone_and_ingest for `mode` and `strategy`.
+    """
+    if req.strategy and req.strategy not in repos.CLONE_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown clone strategy '{req.strategy}'")
+    request_timing = timing.start()
+    try:
+        with timing.stage('submit'):
+            job = jobs.submit("clone", req.owner, req.repo, mode=req.mode, strategy=req.strategy)
+    except Exception as e:
+        response.headers["Server-Timing"] = request_timing.header()
         return CloneResp(
             success=False,
-            message=f"Failed to clone repository: {str(e)}",
+            message=f"Failed to queue repository clone: {str(e)}",
             local_path=None
         )
+    response.headers["Server-Timing"] = request_timing.header()
+    return CloneResp(
+        success=True,
+        message=f"Repository {req.owner}/{req.repo} queued for cloning and indexing",
+        local_path=str(repos.checkout_path(req.owner, req.repo)),
+        job_id=job['job_id']
+    )
+
+
+@app.post("/ingest", response_model=IngestRepoResp)
+def ingest_repository(req: IngestRepoReq):
+    """Queue a full re-index of an already cloned repository"""
+    try:
+        job = jobs.submit("ingest", req.owner, req.repo)
+    except Exception as e:
+        return IngestRepoResp(success=False, message=f"Failed to queue ingestion: {str(e)}")
+    return IngestRepoResp(
+        success=True,
+        message=f"Repository {req.owner}/{req.repo} queued for ingestion",
+        collection_name=retrieval.repo_collection_name(req.owner, req.repo),
+        job_id=job['job_id']
+    )
+
+
+@app.get("/ingest/status", response_model=IngestStatusResp)
+def ingest_status(owner: Optional[str] = None, repo: Optional[str] = None, job_id: Optional[str] = None):
+    """Progress of the latest ingestion of a repository, or of a specific job"""
+    job = None
+    if job_id:
+        job = jobs.get_job(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+        owner, repo = job['owner'], job['repo']
+    elif not (owner and repo):
+        raise HTTPException(status_code=400, detail="Pass owner and repo, or job_id")
+    else:
+        job = jobs.find_active_job(owner, repo)
+    
+    status = get_ingestion_status(owner, repo)
+    if status is None:
+        return IngestStatusResp(status='not_started', job_id=job_id)
+    
+    fields = {k: v for k, v in status.items() if k in IngestStatusResp.model_fields}
+    if job is not None:
+        fields['job_id'] = job['job_id']
+        fields['job_state'] = job['state']
+        if job['state'] == 'failed' and not fields.get('error'):
+            fields['error'] = job['error']
+    return IngestStatusResp(**fields)
+
+
+@app.on_event("startup")
+def start_jobs():
+    jobs.start()
+
+
+@app.on_event("shutdown")
+def shutdown_jobs():
+    jobs.shutdown()
 
 # Add CORS middleware for extension
 from fastapi.middleware.cors import CORSMiddleware
@@ -208,4 +445,13 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the extension read per-request timings
+    expose_headers=["Server-Timing", "X-Aura-Cache"],
+)
+
+app.add_middleware(ProfilingMiddleware, routes=["/select", "/prefetch", "/clone"])
+
+app.add_middleware(
+    metrics.MetricsMiddleware,
+    routes=["/select", "/prefetch", "/clone", "/ingest", "/ingest/status", "/status", "/cache/stats"],
 )
\ No newline at end of file
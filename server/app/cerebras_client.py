@@ -1,5 +1,6 @@
 import os
-from cerebras.cloud.sdk import Cerebras
+import logging
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
 from dotenv import load_dotenv
 
 # Load environment variables from .env file (project root)
@@ -7,6 +8,8 @@ load_dotenv(dotenv_path="../.env")
 
 # CEREBRAS_MODEL = os.getenv("CEREBRAS_MODEL", "gpt-oss-120b")
 
+logger = logging.getLogger(__name__)
+
 _client = None
 def get_client() -> Cerebras:
     global _client
@@ -17,6 +20,17 @@ def get_client() -> Cerebras:
         _client = Cerebras(api_key=api_key)
     return _client
 
+_async_client = None
+def get_async_client() -> AsyncCerebras:
+    global _async_client
+    if _async_client is None:
+        api_key = os.environ.get("CEREBRAS_API_KEY")
+        if not api_key:
+            logger.error("Cannot create the async Cerebras client: CEREBRAS_API_KEY is not set")
+            raise ValueError("CEREBRAS_API_KEY environment variable is not set")
+        _async_client = AsyncCerebras(api_key=api_key)
+    return _async_client
+
 def stream_summary(messages, max_tokens=800, temperature=0.2, top_p=0.95):
     try:
         client = get_client()
@@ -35,3 +49,22 @@ def stream_summary(messages, max_tokens=800, temperature=0.2, top_p=0.95):
         print(f"Model: {model}")
         print(f"API Key present: {bool(os.environ.get('CEREBRAS_API_KEY'))}")
         raise
+
+
+async def astream_summary(messages, max_tokens=800, temperature=0.2, top_p=0.95):
+    """Async variant of stream_summary; returns an AsyncStream that must be closed."""
+    model = os.environ.get("CEREBRAS_MODEL", "qwen-3-235b-a22b-instruct-2507")
+    try:
+        client = get_async_client()
+        return await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            max_completion_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+        )
+    except Exception as e:
+        logger.exception(f"Cerebras API error for model {model} "
+                         f"(API key present: {bool(os.environ.get('CEREBRAS_API_KEY'))}): {e}")
+        raise
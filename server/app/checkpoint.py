@@ -0,0 +1,60 @@
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+from app.sqlite_util import open_db, transaction, PathCache
+
+logger = logging.getLogger(__name__)
+
+
+class IngestCheckpoint:
+    """Durable progress of an unfinished ingestion into one collection.
+
+    Records the commit and mode being indexed and every file whose chunks
+    have all been written, with its chunk count (chunk IDs are
+    `path::0..count-1`). A job restarted at the same commit skips those
+    files instead of rebuilding the collection. Cleared once the
+    ingestion completes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_db(path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS run (id INTEGER PRIMARY KEY CHECK (id = 0), "
+            "  commit_sha TEXT, mode TEXT NOT NULL, started_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS files (relative_path TEXT PRIMARY KEY, chunks INTEGER NOT NULL);"
+        )
+
+    def begin(self, commit: Optional[str], mode: str):
+        """Start recording a new ingestion, forgetting any earlier progress"""
+        with transaction(self._conn, self._lock):
+            self._conn.execute("DELETE FROM files")
+            self._conn.execute("INSERT OR REPLACE INTO run VALUES (0, ?, ?, ?)", (commit, mode, time.time()))
+
+    def run(self) -> Optional[Dict]:
+        """The unfinished ingestion ({'commit', 'mode', 'started_at'}), if any"""
+        with self._lock:
+            row = self._conn.execute("SELECT commit_sha, mode, started_at FROM run").fetchone()
+        return {'commit': row[0], 'mode': row[1], 'started_at': row[2]} if row else None
+
+    def mark_done(self, files: Dict[str, int]):
+        """Record files (relative path -> chunk count) whose chunks are all stored"""
+        if not files:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?)", list(files.items()))
+
+    def done_files(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT relative_path, chunks FROM files").fetchall())
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM files")
+            self._conn.execute("DELETE FROM run")
+
+
+get_checkpoint = PathCache(IngestCheckpoint).get
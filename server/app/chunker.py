@@ -0,0 +1,242 @@
+import os
+import ast
+import re
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+# A chunk is (text, start_line, end_line) with 1-based inclusive line numbers
+Chunk = Tuple[str, int, int]
+# A unit is a (start_line, end_line) span that should not be split if avoidable
+Span = Tuple[int, int]
+
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "1500"))
+
+BRACE_EXTENSIONS = {
+    '.js', '.ts', '.tsx', '.jsx', '.java', '.cpp', '.c', '.h', '.hpp', '.cs',
+    '.php', '.go', '.rs', '.swift', '.kt', '.scala', '.css', '.scss', '.less', '.json',
+}
+MARKDOWN_EXTENSIONS = {'.md'}
+# Everything else (.rb, .sh, .sql, .yaml, .html, .vue, ...) uses the indent scanner
+
+_LINE = re.compile(r"[^\n]*\n|[^\n]+$")
+
+# Lines at column 0 that close a block rather than open a new one
+_CLOSER = re.compile(r"^(end\b|fi\b|done\b|esac\b|[}\])]|</)")
+
+
+def _cover(spans: List[Span], start: int, end: int) -> List[Span]:
+    """Stretch sorted spans so they tile [start, end] without gaps.
+
+    Lines between units (comments, decorators, blank lines) are attached to
+    the unit that follows them; trailing lines go to the last unit.
+    """
+    if not spans:
+        return [(start, end)] if start <= end else []
+    tiled = []
+    cursor = start
+    for s, e in spans:
+        e = min(e, end)
+        if e < cursor:
+            continue
+        tiled.append((cursor, e))
+        cursor = e + 1
+    if cursor <= end:
+        last_start, _ = tiled[-1]
+        tiled[-1] = (last_start, end)
+    return tiled
+
+
+def _span_chars(lines: List[str], span: Span) -> int:
+    s, e = span
+    return sum(len(line) for line in lines[s - 1:e])
+
+
+def _split_lines(lines: List[str], span: Span, max_chars: int) -> List[Span]:
+    """Split an oversized span at line boundaries"""
+    pieces = []
+    s, e = span
+    start = s
+    size = 0
+    for n in range(s, e + 1):
+        length = len(lines[n - 1])
+        if size and size + length > max_chars:
+            pieces.append((start, n - 1))
+            start, size = n, 0
+        size += length
+    pieces.append((start, e))
+    return pieces
+
+
+def _pack(lines: List[str], spans: List[Span], max_chars: int,
+          split: Callable[[Span], List[Span]]) -> List[Span]:
+    """Greedily merge consecutive units into chunks of up to `max_chars`.
+
+    Units larger than the budget are handed to `split` first.
+    """
+    packed = []
+    current = None
+    size = 0
+    for span in spans:
+        length = _span_chars(lines, span)
+        if length > max_chars:
+            if current:
+                packed.append(current)
+                current, size = None, 0
+            packed.extend(split(span))
+            continue
+        if current and size + length > max_chars:
+            packed.append(current)
+            current, size = None, 0
+        current = (current[0], span[1]) if current else span
+        size += length
+    if current:
+        packed.append(current)
+    return packed
+
+
+# ---------------------------------------------------------------------------
+# Unit scanners
+# ---------------------------------------------------------------------------
+
+def _node_span(node) -> Span:
+    start = node.lineno
+    for decorator in getattr(node, 'decorator_list', []):
+        start = min(start, decorator.lineno)
+    return start, node.end_lineno
+
+
+def _python_spans(nodes, start: int, end: int, lines: List[str], max_chars: int) -> List[Span]:
+    """Top-level statements as units; oversized classes/functions recurse into their bodies"""
+    spans = _cover([_node_span(n) for n in nodes], start, end)
+    by_end = {min(_node_span(n)[1], end): n for n in nodes}
+    if by_end:
+        # _cover stretches the last unit over trailing lines
+        by_end[spans[-1][1]] = by_end[max(by_end)]
+
+    def split(span: Span) -> List[Span]:
+        node = by_end.get(span[1])
+        body = getattr(node, 'body', None)
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)) and body:
+            # The signature/docstring lines ride along with the first member
+            return _python_spans(body, span[0], span[1], lines, max_chars)
+        return _split_lines(lines, span, max_chars)
+
+    return _pack(lines, spans, max_chars, split)
+
+
+def _brace_units(lines: List[str]) -> List[Span]:
+    """Units end wherever brace depth returns to zero at the end of a line"""
+    spans = []
+    depth = 0
+    start = None
+    in_block_comment = False
+    for n, line in enumerate(lines, start=1):
+        if start is None and line.strip():
+            start = n
+        i = 0
+        quote = None
+        while i < len(line):
+            ch = line[i]
+            nxt = line[i:i + 2]
+            if in_block_comment:
+                if nxt == '*/':
+                    in_block_comment = False
+                    i += 1
+            elif quote:
+                if ch == '\\':
+                    i += 1
+                elif ch == quote:
+                    quote = None
+            elif nxt == '//':
+                break
+            elif nxt == '/*':
+                in_block_comment = True
+                i += 1
+            elif ch in '"\'`':
+                quote = ch
+            elif ch in '{([':
+                depth += 1
+            elif ch in '})]':
+                depth = max(0, depth - 1)
+            i += 1
+        if start is not None and depth == 0 and not in_block_comment:
+            spans.append((start, n))
+            start = None
+    if start is not None:
+        spans.append((start, len(lines)))
+    return spans
+
+
+def _indent_units(lines: List[str]) -> List[Span]:
+    """Units start at each non-blank, column-0 line that does not close a block"""
+    starts = [
+        n for n, line in enumerate(lines, start=1)
+        if line.strip() and not line[0].isspace() and not _CLOSER.match(line)
+    ]
+    if not starts:
+        return []
+    return [(s, e - 1) for s, e in zip(starts, starts[1:] + [len(lines) + 1])]
+
+
+def _markdown_units(lines: List[str]) -> List[Span]:
+    starts = [n for n, line in enumerate(lines, start=1) if line.startswith('#')]
+    if not starts or starts[0] != 1:
+        starts = [1] + starts
+    return [(s, e - 1) for s, e in zip(starts, starts[1:] + [len(lines) + 1])]
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+def _char_split(text: str, start_line: int, max_chars: int) -> List[Chunk]:
+    """Last resort for single lines longer than the budget (minified code, data)"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=max_chars, chunk_overlap=0)
+    return [(piece, start_line, start_line) for piece in splitter.split_text(text)]
+
+
+def chunk_text(text: str, path: str, max_chars: int = CHUNK_MAX_CHARS) -> List[Chunk]:
+    """Split a source file into chunks along syntactic units.
+
+    Python files are split on `ast` statement boundaries, brace languages on
+    top-level blocks, markdown on headings and everything else on column-0
+    lines. Adjacent small units are packed together up to `max_chars`;
+    chunks do not overlap.
+    """
+    # Split on \n only so line numbers agree with editors and `ast`
+    lines = _LINE.findall(text)
+    if not lines:
+        return []
+    if len(text) <= max_chars:
+        return [(text, 1, len(lines))]
+
+    split_lines = lambda span: _split_lines(lines, span, max_chars)
+    ext = Path(path).suffix.lower()
+    spans = None
+    if ext == '.py':
+        try:
+            tree = ast.parse(text)
+            spans = _python_spans(tree.body, 1, len(lines), lines, max_chars)
+        except (SyntaxError, ValueError):
+            spans = None
+    if spans is None:
+        if ext in BRACE_EXTENSIONS:
+            units = _brace_units(lines)
+        elif ext in MARKDOWN_EXTENSIONS:
+            units = _markdown_units(lines)
+        else:
+            units = _indent_units(lines)
+        spans = _pack(lines, _cover(units, 1, len(lines)), max_chars, split_lines)
+
+    chunks = []
+    for s, e in spans:
+        chunk = ''.join(lines[s - 1:e])
+        if not chunk.strip():
+            continue
+        if len(chunk) > max_chars:
+            chunks.extend(_char_split(chunk, s, max_chars))
+        else:
+            chunks.append((chunk, s, e))
+    return chunks
+
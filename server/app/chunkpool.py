@@ -0,0 +1,170 @@
+import os
+import time
+import atexit
+import hashlib
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple
+
+from app.chunker import chunk_text
+from app.symbols import Definition, Reference, extract_symbols
+
+logger = logging.getLogger(__name__)
+
+# Concurrent ingestion jobs (same setting as app.jobs), which share the cores
+_INGEST_JOBS = max(1, int(os.getenv("INGEST_WORKERS", "2")))
+# Processes reading and chunking files per ingestion job (1 = in the ingesting process)
+CHUNK_WORKERS = int(os.getenv("INGEST_CHUNK_WORKERS", str(max(1, (os.cpu_count() or 1) // _INGEST_JOBS))))
+# Files handed to a worker at a time
+CHUNK_BATCH_FILES = int(os.getenv("INGEST_CHUNK_BATCH_FILES", "16"))
+
+
+class ChunkRecord(NamedTuple):
+    """One chunk as it travels from a worker to the embedder and vector store"""
+    text: str
+    relative_path: str
+    chunk_index: int
+    start_line: int
+    end_line: int
+    content_hash: str
+
+    def metadata(self) -> Dict:
+        return {
+            'relative_path': self.relative_path,
+            'file_type': os.path.splitext(self.relative_path)[1],
+            'chunk_index': self.chunk_index,
+            'start_line': self.start_line,
+            'end_line': self.end_line,
+            'content_hash': self.content_hash,
+        }
+
+
+class FileRecord(NamedTuple):
+    relative_path: str
+    chunks: List[ChunkRecord]
+    definitions: List[Definition]
+    references: List[Reference]
+
+
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def read_and_chunk(file_paths: List[str], root_dir: str) -> Dict:
+    """Read, chunk and extract symbols from a batch of files (runs in a pool worker).
+
+    Returns the file records, the files that could not be read as
+    (path, error) pairs, and the seconds spent per step.
+    """
+    files = []
+    errors = []
+    seconds = {'load': 0.0, 'chunk': 0.0, 'symbols': 0.0}
+    for file_path in file_paths:
+        relative_path = Path(file_path).relative_to(root_dir).as_posix()
+        t0 = time.perf_counter()
+        try:
+            with open(file_path, encoding="utf-8") as f:
+                text = f.read()
+        except Exception as e:
+            errors.append((file_path, str(e)))
+            continue
+        t1 = time.perf_counter()
+        chunks = [
+            ChunkRecord(chunk, relative_path, chunk_index, start_line, end_line, content_hash(chunk))
+            for chunk_index, (chunk, start_line, end_line) in enumerate(chunk_text(text, relative_path))
+        ]
+        t2 = time.perf_counter()
+        try:
+            definitions, references = extract_symbols(text, relative_path)
+        except Exception as e:
+            logger.warning(f"Error extracting symbols of {relative_path}: {e}")
+            definitions, references = [], []
+        t3 = time.perf_counter()
+        seconds['load'] += t1 - t0
+        seconds['chunk'] += t2 - t1
+        seconds['symbols'] += t3 - t2
+        files.append(FileRecord(relative_path, chunks, definitions, references))
+    return {'files': files, 'errors': errors, 'seconds': seconds}
+
+
+_pool = None
+_pool_pid = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_pid, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid() or _pool_workers != workers:
+            if _pool is not None and _pool_pid == os.getpid():
+                _pool.shutdown(wait=False, cancel_futures=True)
+            else:
+                atexit.register(shutdown_pool)
+            # spawn keeps workers free of the ingesting process's threads and open files
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid, _pool_workers = os.getpid(), workers
+        return _pool
+
+
+def shutdown_pool(terminate: bool = False):
+    """Stop this process's chunking workers (killing them with `terminate`, e.g. when the process is killed)"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is None or _pool_pid != os.getpid():
+        return
+    if terminate:
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+    pool.shutdown(wait=not terminate, cancel_futures=True)
+
+
+def _reset_pool(broken: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def chunk_batches(batches: Iterable[List[str]], root_dir: str, workers: int = None) -> Iterator[Dict]:
+    """Yield `read_and_chunk` results for each batch of paths, in order.
+
+    With more than one worker the batches are spread over a process pool
+    of that many workers (kept for the life of the process, see
+    shutdown_pool), with at most two per worker in flight so memory stays
+    bounded however large the repository is. A batch whose worker died is
+    redone in this process.
+    """
+    workers = CHUNK_WORKERS if workers is None else workers
+    if workers <= 1:
+        for batch in batches:
+            yield read_and_chunk(batch, root_dir)
+        return
+
+    in_flight = deque()
+    source = iter(batches)
+    exhausted = False
+    while True:
+        while not exhausted and len(in_flight) < workers * 2:
+            batch = next(source, None)
+            if batch is None:
+                exhausted = True
+                break
+            pool = _get_pool(workers)
+            in_flight.append((batch, pool, pool.submit(read_and_chunk, batch, root_dir)))
+        if not in_flight:
+            return
+        batch, pool, future = in_flight.popleft()
+        try:
+            yield future.result()
+        except BrokenProcessPool:
+            logger.warning("Chunking worker pool was broken, restarting it")
+            _reset_pool(pool)
+            yield read_and_chunk(batch, root_dir)
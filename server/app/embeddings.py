@@ -0,0 +1,433 @@
+import os
+import re
+import sqlite3
+import time
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+
+from app.sqlite_util import open_db, transaction
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "mxbai-embed-large")
+
+# Batching knobs (all overridable from the environment)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_MIN_BATCH_SIZE = int(os.getenv("EMBED_MIN_BATCH_SIZE", "4"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "256"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_TARGET_LATENCY = float(os.getenv("EMBED_TARGET_LATENCY", "2.0"))  # seconds per request
+
+# Memory budget for cached query embeddings
+QUERY_EMBED_CACHE_MB = float(os.getenv("QUERY_EMBED_CACHE_MB", "32"))
+
+# On-disk cache of chunk embeddings shared by every repo and re-ingest (0 disables)
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".aura", "embeddings.sqlite"))
+EMBED_CACHE_MB = float(os.getenv("EMBED_CACHE_MB", "1024"))
+
+
+def parse_embeddings(response) -> List[List[float]]:
+    """Normalize an Ollama embed response into a list of vectors"""
+    if "embeddings" in response:
+        embeddings = response["embeddings"]
+        # A single input may come back as a flat vector
+        if embeddings and not isinstance(embeddings[0], list):
+            return [embeddings]
+        return embeddings
+    if "embedding" in response:
+        return [response["embedding"]]
+    raise ValueError(f"Unexpected embedding response format: {list(response.keys())}")
+
+
+class BatchSizer:
+    """Adapts the batch size so each embed request stays near a target latency.
+
+    Grows additively while requests are fast and halves when a request
+    overshoots the target or fails, so a slow or overloaded embedder is
+    backed off quickly while a fast one is filled up.
+    """
+
+    def __init__(self, initial: int = EMBED_BATCH_SIZE, min_size: int = EMBED_MIN_BATCH_SIZE,
+                 max_size: int = EMBED_MAX_BATCH_SIZE, target_latency: float = EMBED_TARGET_LATENCY):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.size = min(max(initial, self.min_size), self.max_size)
+        self.target_latency = target_latency
+
+    def observe(self, batch_len: int, latency: float):
+        """Feed back the latency of a completed batch"""
+        if batch_len < self.size // 2:
+            # Tail batches say little about capacity
+            return
+        if latency > self.target_latency:
+            self.size = max(self.min_size, self.size // 2)
+        elif latency < self.target_latency / 2:
+            self.size = min(self.max_size, self.size + max(1, self.size // 4))
+
+    def failed(self):
+        self.size = max(self.min_size, self.size // 2)
+
+
+def embed_in_batches(
+    client,
+    items: Iterable[T],
+    on_batch: Callable[[List[T], List[List[float]]], None],
+    text: Callable[[T], str] = lambda item: item,
+    model: str = EMBED_MODEL,
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    on_failure: Optional[Callable[[T, Exception], None]] = None,
+    cache: Optional["DiskEmbeddingCache"] = None,
+) -> Dict:
+    """Embed `items` with several batched requests in flight at once.
+
+    `items` may be any iterable, including a generator fed by an upstream
+    pipeline stage; it is consumed lazily, one batch at a time. `text(item)`
+    gives the string to embed. `on_batch(batch, embeddings)` is called from
+    the calling thread as each batch completes, in completion order. A
+    failing batch is split in half and retried so a single bad chunk does not
+    drop its neighbours; items that still fail on their own are reported via
+    `on_failure(item, error)`.
+
+    With a `cache`, items are looked up before batching: hits go straight to
+    `on_batch` and only misses are sent to the embedder (and then stored).
+    """
+    concurrency = max(1, concurrency or EMBED_CONCURRENCY)
+    sizer = BatchSizer(initial=batch_size or EMBED_BATCH_SIZE)
+
+    source = iter(items)
+    exhausted = False
+    pending: List[List[T]] = []  # retry queue of item lists
+    embedded = 0
+    failed = 0
+    batches = 0
+    cache_hits = 0
+    start = time.time()
+
+    def next_batch() -> List[T]:
+        nonlocal exhausted, cache_hits
+        batch = []
+        while len(batch) < sizer.size and not exhausted:
+            pulled = []
+            while len(batch) + len(pulled) < sizer.size:
+                try:
+                    pulled.append(next(source))
+                except StopIteration:
+                    exhausted = True
+                    break
+            if cache is None or not pulled:
+                batch.extend(pulled)
+                continue
+            cached = cache.get_many(model, [text(item) for item in pulled])
+            hits = [(item, vector) for item, vector in zip(pulled, cached) if vector is not None]
+            batch.extend(item for item, vector in zip(pulled, cached) if vector is None)
+            if hits:
+                cache_hits += len(hits)
+                on_batch([item for item, _ in hits], [vector for _, vector in hits])
+        return batch
+
+    def run(batch: List[T]):
+        t0 = time.time()
+        texts = [text(item) for item in batch]
+        response = client.embed(model=model, input=texts)
+        embeddings = parse_embeddings(response)
+        latency = time.time() - t0
+        if cache is not None and len(embeddings) == len(batch):
+            try:
+                cache.put_many(model, texts, embeddings)
+            except Exception as e:
+                logger.warning(f"Could not store embeddings in cache: {e}")
+        return embeddings, latency
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed") as pool:
+        in_flight = {}
+        while True:
+            # Keep the window full
+            while len(in_flight) < concurrency and (pending or not exhausted):
+                batch = pending.pop() if pending else next_batch()
+                if batch:
+                    in_flight[pool.submit(run, batch)] = batch
+
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                try:
+                    embeddings, latency = future.result()
+                    if len(embeddings) != len(batch):
+                        raise ValueError(f"Expected {len(batch)} embeddings, got {len(embeddings)}")
+                except Exception as e:
+                    sizer.failed()
+                    if len(batch) > 1:
+                        mid = len(batch) // 2
+                        pending.extend([batch[mid:], batch[:mid]])
+                        logger.warning(f"Embedding batch of {len(batch)} failed, splitting: {e}")
+                    else:
+                        failed += 1
+                        logger.error(f"Error embedding chunk: {e}")
+                        if on_failure:
+                            on_failure(batch[0], e)
+                    continue
+
+                sizer.observe(len(batch), latency)
+                batches += 1
+                embedded += len(batch)
+                on_batch(batch, embeddings)
+
+    duration = time.time() - start
+    looked_up = cache_hits + embedded + failed
+    stats = {
+        'embedded_chunks': embedded,
+        'cached_chunks': cache_hits,
+        'cache_hit_rate': cache_hits / looked_up if cache is not None and looked_up else 0.0,
+        'failed_chunks': failed,
+        'embed_batches': batches,
+        'embed_seconds': duration,
+        'chunks_per_second': (embedded + cache_hits) / duration if duration > 0 else 0.0,
+        'final_batch_size': sizer.size,
+        'concurrency': concurrency,
+    }
+    logger.info(
+        f"Embedded {embedded} chunks in {batches} batches in {duration:.2f}s "
+        f"({stats['chunks_per_second']:.1f} chunks/s, batch size {sizer.size}, concurrency {concurrency}, "
+        f"{cache_hits} from cache)"
+    )
+    return stats
+
+
+def normalize_query(text: str) -> str:
+    """Collapse whitespace so re-selections with different indentation share an entry"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingLRU:
+    """Thread-safe LRU of embeddings bounded by an approximate memory budget.
+
+    Keys are (model, sha1 of the normalized text); vectors are stored as
+    float32 arrays so the budget maps directly onto 4 bytes per dimension.
+    """
+
+    # Rough per-entry cost of the key, dict slot and array header
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, array]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(model: str, text: str) -> tuple:
+        digest = hashlib.sha1(normalize_query(text).encode("utf-8")).hexdigest()
+        return (model, digest)
+
+    def _entry_size(self, vector: array) -> int:
+        return vector.itemsize * len(vector) + self.ENTRY_OVERHEAD
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = self.key(model, text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector.tolist()
+
+    def put(self, model: str, text: str, embedding: List[float]):
+        key = self.key(model, text)
+        vector = array("f", embedding)
+        size = self._entry_size(vector)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= self._entry_size(old)
+            self._entries[key] = vector
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._entry_size(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class DiskEmbeddingCache:
+    """Persistent content-addressed embedding cache backed by SQLite.
+
+    Entries are keyed by sha256(model, text), so identical chunks are shared
+    across repositories, forks and re-ingests. Vectors are stored as float32
+    blobs. When the file grows past `max_bytes` the least recently used
+    entries are evicted down to 90% of the budget. WAL mode lets several
+    ingestion worker processes read and write the same file.
+    """
+
+    # Approximate per-row overhead of the key, timestamps and b-tree slots
+    ROW_OVERHEAD = 64
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = open_db(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._bytes = self._total_bytes()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(model: str, text: str) -> bytes:
+        return hashlib.sha256(model.encode("utf-8") + b"\0" + text.encode("utf-8")).digest()
+
+    def _total_bytes(self) -> int:
+        return int(self._conn.execute("SELECT total(size) FROM embeddings").fetchone()[0])
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up several texts at once; misses come back as None"""
+        keys = [self.key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            try:
+                # Stay well under SQLite's bound-parameter limit
+                for i in range(0, len(keys), 500):
+                    part = keys[i:i + 500]
+                    marks = ",".join("?" * len(part))
+                    found.update(self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                    ).fetchall())
+                if found:
+                    hit_keys = list(found)
+                    for i in range(0, len(hit_keys), 500):
+                        part = hit_keys[i:i + 500]
+                        marks = ",".join("?" * len(part))
+                        self._conn.execute(
+                            f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [time.time()] + part
+                        )
+            except sqlite3.Error as e:
+                # A locked or damaged cache file costs re-embedding, not the ingestion
+                logger.warning(f"Embedding cache lookup failed, treating {len(keys)} texts as misses: {e}")
+                found = {}
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        results = []
+        for key in keys:
+            blob = found.get(key)
+            if blob is None:
+                results.append(None)
+            else:
+                vector = array("f")
+                vector.frombytes(blob)
+                results.append(vector.tolist())
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        now = time.time()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            blob = array("f", embedding).tobytes()
+            rows.append((self.key(model, text), blob, len(blob) + self.ROW_OVERHEAD, now))
+        try:
+            with transaction(self._conn, self._lock):
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+                self._bytes += sum(row[2] for row in rows)
+                if self._bytes > self.max_bytes:
+                    self._evict()
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache write of {len(rows)} vectors failed: {e}")
+
+    def _evict(self):
+        # Other processes write to the same file, so re-measure before evicting
+        self._bytes = self._total_bytes()
+        target = int(self.max_bytes * 0.9)
+        while self._bytes > target:
+            deleted = self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT 1000) RETURNING size"
+            ).fetchall()
+            if not deleted:
+                break
+            self.evictions += len(deleted)
+            self._bytes -= sum(size for (size,) in deleted)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'path': self.path,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_disk_cache = None
+_disk_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[DiskEmbeddingCache]:
+    """Return the process-wide on-disk embedding cache, or None if disabled"""
+    global _disk_cache
+    if EMBED_CACHE_MB <= 0:
+        return None
+    if _disk_cache is None:
+        with _disk_cache_lock:
+            if _disk_cache is None:
+                try:
+                    _disk_cache = DiskEmbeddingCache(EMBED_CACHE_PATH, int(EMBED_CACHE_MB * 1024 * 1024))
+                except Exception as e:
+                    logger.warning(f"Embedding cache unavailable at {EMBED_CACHE_PATH}: {e}")
+                    return None
+    return _disk_cache
+
+
+query_embedding_cache = EmbeddingLRU(int(QUERY_EMBED_CACHE_MB * 1024 * 1024))
+
+
+def embed_query(client, text: str, model: str = EMBED_MODEL) -> List[float]:
+    """Embed a single search query, serving repeats from the LRU cache"""
+    cached = query_embedding_cache.get(model, text)
+    if cached is not None:
+        return cached
+    embedding = parse_embeddings(client.embed(model=model, input=text))[0]
+    query_embedding_cache.put(model, text, embedding)
+    return embedding
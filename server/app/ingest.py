@@ -1,19 +1,35 @@
 import os
+import sys
+import bisect
 import logging
+import resource
+import threading
 import time
-from typing import Dict, List, Optional
-from langchain_community.document_loaders import TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import ollama
-import chromadb
+from typing import Dict, Iterable, Iterator, List, Optional
 from pathlib import Path
+from app.embeddings import embed_in_batches, get_embedding_cache
+from app.chunkpool import CHUNK_BATCH_FILES, chunk_batches
+from app.pipeline import Pipeline, PipelineAborted
+from app.state import get_state_store
+from app import vectordb
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global store for ingestion status
-ingestion_status: Dict[str, Dict] = {}
+# Paths matched by one collection.delete when dropping stale chunks
+DELETE_BATCH_PATHS = int(os.getenv("INGEST_DELETE_BATCH_PATHS", "500"))
+
+# Items buffered between pipeline stages (batches of file paths; chunks use 4x)
+PIPELINE_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "64"))
+
+def update_status(repo_key: str, fields: Dict, replace: bool = False):
+    """Update (or with `replace`, reset) the status entry for a repository.
+
+    Entries live in the shared state store, so a status written by an
+    ingestion worker is visible to every server process.
+    """
+    get_state_store().update_status(repo_key, fields, replace=replace)
 
 def get_supported_file_extensions():
     """Return list of supported code file extensions"""
@@ -47,278 +63,543 @@ def should_process_file(file_path: str) -> bool:
     
     return True
 
-def load_code_files(root_dir: str, repo_key: str = None):
-    """Load code files with progress tracking and metadata"""
-    docs = []
-    processed_files = 0
-    skipped_files = 0
-    error_files = 0
-    
-    logger.info(f"Starting to load files from {root_dir}")
-    
-    # Count total files first for progress tracking
-    total_files = 0
-    for root, _, files in os.walk(root_dir):
+def iter_code_files(root_dir: str) -> Iterator[str]:
+    """Yield paths of files under `root_dir` that should be ingested (single walk)"""
+    ignore_dirs = {'.git', 'node_modules', '__pycache__', '.venv', 'venv', 'dist', 'build'}
+    for root, dirs, files in os.walk(root_dir):
+        # Prune ignored directories instead of walking and rejecting their files
+        dirs[:] = [d for d in dirs if d not in ignore_dirs]
         for file in files:
             file_path = os.path.join(root, file)
             if should_process_file(file_path):
-                total_files += 1
+                yield file_path
+
+# Collection metadata key recording the commit the index reflects
+INDEXED_COMMIT_KEY = 'indexed_commit'
+
+def chunk_id(relative_path: str, chunk_index: int) -> str:
+    """Stable chunk ID so a file's chunks can be replaced in place"""
+    return f"{relative_path}::{chunk_index}"
+
+def _chunk_locator(file_record):
+    """Map a line of the file to the ID of the chunk holding it"""
+    spans = sorted(
+        (chunk.start_line, chunk.end_line, chunk_id(chunk.relative_path, chunk.chunk_index))
+        for chunk in file_record.chunks
+    )
+    starts = [span[0] for span in spans]
+    
+    def chunk_for_line(line):
+        i = bisect.bisect_right(starts, line) - 1
+        return spans[i][2] if i >= 0 and line <= spans[i][1] else None
+    return chunk_for_line
+
+def index_symbols(symbol_index, file_records):
+    """Record the files' definitions and references against the chunks holding them"""
+    symbol_index.add_files(
+        (record.relative_path, record.definitions, record.references, _chunk_locator(record))
+        for record in file_records
+        if record.definitions or record.references
+    )
+
+def get_indexed_commit(collection_name: str) -> Optional[str]:
+    """Return the commit a collection was last fully indexed at, if known"""
+    try:
+        collection = vectordb.get_store().get_collection(name=collection_name)
+    except Exception:
+        return None
+    return (collection.metadata or {}).get(INDEXED_COMMIT_KEY)
+
+def _mark_indexed(collection, commit: Optional[str]):
+    if not commit:
+        return
+    metadata = dict(collection.metadata or {})
+    metadata[INDEXED_COMMIT_KEY] = commit
+    collection.modify(metadata=metadata)
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _index_files(collection, file_paths: Iterable[str], repo_path: str, repo_key: str,
+                 checkpoint=None) -> Dict:
+    """Stream files through walk -> read + chunk -> embed -> write.
+
+    The stages run concurrently and are connected by bounded queues, so
+    only a window of files and chunks is ever held in memory and the first
+    chunks become searchable while the rest of the repo is still being read.
+    Reading and chunking run in a process pool (see app.chunkpool) on
+    batches of files, and chunks travel as compact ChunkRecords.
+    Progress runs from 5% to 95% once the number of files is known.
+
+    With a `checkpoint`, each file is recorded in it once all of its chunks
+    are stored, so an interrupted run can be resumed without them. Files
+    with chunks that could not be embedded or stored are counted in
+    `incomplete_files`.
+    """
+    pipeline = Pipeline()
+    lexical_index = vectordb.lexical_index(collection.name)
+    locator_index = vectordb.locator_index(collection.name)
+    symbol_index = vectordb.symbol_index(collection.name)
+    path_queue = pipeline.make_queue(PIPELINE_QUEUE_SIZE)
+    chunk_queue = pipeline.make_queue(PIPELINE_QUEUE_SIZE * 4)
+    write_queue = pipeline.make_queue(8)
     
-    logger.info(f"Found {total_files} files to process")
+    start = time.time()
+    counts = {'files': 0, 'total_files': None, 'read_files': 0, 'error_files': 0,
+              'chunks': 0, 'written_chunks': 0, 'failed_batches': 0, 'first_write': None}
+    # Chunks of each file not yet stored, and each file's chunk count
+    unwritten: Dict[str, int] = {}
+    file_chunks: Dict[str, int] = {}
+    unwritten_lock = threading.Lock()
     
-    # Update status if repo_key provided
-    if repo_key and repo_key in ingestion_status:
-        ingestion_status[repo_key].update({
-            'stage': 'loading_files',
-            'total_files': total_files,
-            'processed_files': 0,
-            'progress_percent': 0
-        })
+    def stored(records) -> Dict[str, int]:
+        """Count stored chunks off their files; return the files now complete"""
+        complete = {}
+        with unwritten_lock:
+            for record in records:
+                unwritten[record.relative_path] -= 1
+                if not unwritten[record.relative_path]:
+                    del unwritten[record.relative_path]
+                    complete[record.relative_path] = file_chunks.pop(record.relative_path)
+        return complete
     
-    for root, _, files in os.walk(root_dir):
-        for file in files:
-            file_path = os.path.join(root, file)
+    def report():
+        fields = {
+            'processed_files': counts['read_files'],
+            'total_chunks': counts['chunks'],
+            'processed_chunks': counts['written_chunks'],
+        }
+        if counts['total_files']:
+            fields['total_files'] = counts['total_files']
+            done = counts['read_files'] / counts['total_files']
+            fields['progress_percent'] = 5 + int(done * 90 * (counts['written_chunks'] / max(counts['chunks'], 1)))
+        update_status(repo_key, fields)
+    
+    def walk():
+        try:
+            paths = iter(file_paths)
+            batch = []
+            while True:
+                # Directory listing happens lazily inside the iterator
+                with pipeline.timed('walk'):
+                    file_path = next(paths, None)
+                if file_path is None:
+                    break
+                counts['files'] += 1
+                batch.append(file_path)
+                if len(batch) >= CHUNK_BATCH_FILES:
+                    pipeline.put(path_queue, batch)
+                    batch = []
+            if batch:
+                pipeline.put(path_queue, batch)
+            counts['total_files'] = counts['files']
+            logger.info(f"Found {counts['files']} files to process")
+        finally:
+            pipeline.close(path_queue)
+    
+    def chunk():
+        # Reading, chunking and symbol extraction fan out over the chunk pool;
+        # their seconds are summed over workers and can exceed the wall time
+        try:
+            for result in chunk_batches(pipeline.iterate(path_queue), repo_path):
+                for name, seconds in result['seconds'].items():
+                    pipeline.record(name, seconds)
+                for file_path, error in result['errors']:
+                    counts['error_files'] += 1
+                    logger.warning(f"Error loading {file_path}: {error}")
+                try:
+                    with pipeline.timed('symbol_index'):
+                        index_symbols(symbol_index, result['files'])
+                except Exception as e:
+                    logger.warning(f"Error indexing symbols of {len(result['files'])} files: {e}")
+                previous = counts['read_files']
+                for file_record in result['files']:
+                    counts['read_files'] += 1
+                    if not file_record.chunks:
+                        if checkpoint is not None:
+                            checkpoint.mark_done({file_record.relative_path: 0})
+                        continue
+                    # Registered before any chunk can reach the writer
+                    with unwritten_lock:
+                        unwritten[file_record.relative_path] = len(file_record.chunks)
+                        file_chunks[file_record.relative_path] = len(file_record.chunks)
+                    for record in file_record.chunks:
+                        counts['chunks'] += 1
+                        pipeline.put(chunk_queue, record)
+                if counts['read_files'] // 50 > previous // 50:
+                    report()
+        finally:
+            pipeline.close(chunk_queue)
+    
+    def write():
+        for records, embeddings in pipeline.iterate(write_queue):
+            ids = []
+            metadatas = []
+            texts = [record.text for record in records]
+            for record in records:
+                # Prepare metadata
+                metadata = record.metadata()
+                metadata['repo_path'] = repo_path
+                metadatas.append(metadata)
+                ids.append(chunk_id(record.relative_path, record.chunk_index))
             
-            if not should_process_file(file_path):
-                skipped_files += 1
+            try:
+                with pipeline.timed('write'):
+                    collection.upsert(
+                        ids=ids,
+                        embeddings=embeddings,
+                        documents=texts,
+                        metadatas=metadatas
+                    )
+            except Exception as e:
+                logger.error(f"Error adding batch to ChromaDB: {e}")
+                counts['failed_batches'] += 1
                 continue
             
             try:
-                loader = TextLoader(file_path, encoding="utf-8")
-                file_docs = loader.load()
-                
-                # Add relative path metadata
-                for doc in file_docs:
-                    doc.metadata['relative_path'] = str(Path(file_path).relative_to(root_dir))
-                    doc.metadata['file_type'] = Path(file_path).suffix
-                
-                docs.extend(file_docs)
-                processed_files += 1
-                
-                # Update progress if repo_key provided
-                if repo_key and repo_key in ingestion_status:
-                    progress = int((processed_files / total_files) * 100)
-                    ingestion_status[repo_key].update({
-                        'processed_files': processed_files,
-                        'progress_percent': progress,
-                        'current_file': file_path
-                    })
-                
-                if processed_files % 10 == 0:  # Log every 10 files
-                    logger.info(f"Processed {processed_files}/{total_files} files ({progress if repo_key else 0}%)")
-                    
+                with pipeline.timed('lexical'):
+                    lexical_index.add(ids, texts, [metadata['relative_path'] for metadata in metadatas])
+            except Exception as e:
+                # Retrieval falls back to vectors alone for these chunks
+                logger.warning(f"Error adding batch to lexical index: {e}")
+            
+            try:
+                with pipeline.timed('locator'):
+                    locator_index.add(ids, texts, metadatas)
             except Exception as e:
-                error_files += 1
-                logger.warning(f"Error loading {file_path}: {e}")
+                # Selections in these chunks fall back to embedding the query
+                logger.warning(f"Error adding batch to chunk locator: {e}")
+            
+            complete = stored(records)
+            if checkpoint is not None and complete:
+                try:
+                    with pipeline.timed('checkpoint'):
+                        checkpoint.mark_done(complete)
+                except Exception as e:
+                    # These files are redone if the run has to be resumed
+                    logger.warning(f"Error recording ingestion checkpoint: {e}")
+            
+            if counts['first_write'] is None:
+                counts['first_write'] = time.time() - start
+                logger.info(f"First chunks searchable after {counts['first_write']:.2f}s")
+            previous = counts['written_chunks']
+            counts['written_chunks'] += len(records)
+            report()
+            if counts['written_chunks'] // 500 > previous // 500:
+                logger.info(f"Embedded {counts['written_chunks']} chunks so far")
     
-    logger.info(f"File loading complete: {processed_files} processed, {skipped_files} skipped, {error_files} errors")
-    return docs
-
-def ingest_repo(repo_path: str, owner: str, repo: str) -> Dict:
-    """Ingest repository with comprehensive logging and status tracking"""
-    repo_key = f"{owner}/{repo}"
+    pipeline.stage('walk', walk)
+    pipeline.stage('chunk', chunk)
+    pipeline.stage('write', write)
     
-    # Initialize status tracking
-    ingestion_status[repo_key] = {
+    update_status(repo_key, {'status': 'in_progress', 'stage': 'indexing', 'progress_percent': 5})
+    
+    # The embed stage runs here, pulling chunks as the upstream stages produce them
+    embed_stats = None
+    try:
+        embed_stats = embed_in_batches(
+            vectordb.get_ollama_client(),
+            pipeline.iterate(chunk_queue),
+            on_batch=lambda records, embeddings: pipeline.put(write_queue, (records, embeddings)),
+            text=lambda record: record.text,
+            cache=get_embedding_cache(),
+        )
+        pipeline.stage_seconds['embed'] = embed_stats['embed_seconds']
+    except PipelineAborted:
+        pass
+    except Exception as e:
+        pipeline.fail(e)
+    finally:
+        pipeline.close(write_queue)
+    pipeline.join()
+    report()
+    
+    stats = {
+        'total_files': counts['files'],
+        'processed_files': counts['read_files'],
+        'error_files': counts['error_files'],
+        'total_chunks': counts['chunks'],
+        'successful_chunks': counts['written_chunks'],
+        'failed_batches': counts['failed_batches'],
+        'incomplete_files': len(unwritten),
+        'time_to_first_chunk': counts['first_write'],
+        'peak_rss_mb': _peak_rss_mb(),
+        'stage_seconds': dict(pipeline.stage_seconds),
+        'embedding': embed_stats,
+    }
+    logger.info(f"Indexed {counts['written_chunks']}/{counts['chunks']} chunks from {counts['read_files']} files, "
+                f"peak RSS {stats['peak_rss_mb']:.0f} MB")
+    if unwritten:
+        logger.warning(f"{len(unwritten)} files were not fully stored ({counts['failed_batches']} failed write batches), "
+                       f"e.g. {', '.join(sorted(unwritten)[:5])}")
+    return stats
+
+def _start_status(repo_key: str, mode: str) -> float:
+    start_time = time.time()
+    update_status(repo_key, {
         'status': 'starting',
         'stage': 'initializing',
-        'start_time': time.time(),
+        'mode': mode,
+        'start_time': start_time,
         'progress_percent': 0,
         'logs': [],
         'error': None
+    }, replace=True)
+    return start_time
+
+def _fail_status(repo_key: str, error_msg: str) -> Dict:
+    logger.error(f"Ingestion failed for {repo_key}: {error_msg}")
+    
+    update_status(repo_key, {
+        'status': 'failed',
+        'stage': 'error',
+        'error': error_msg,
+        'end_time': time.time()
+    })
+    
+    return {
+        'success': False,
+        'error': error_msg
     }
+
+def resumable_commit(collection_name: str) -> Optional[str]:
+    """Commit of an interrupted full ingestion that `ingest_repo` can resume, if any"""
+    run = vectordb.ingest_checkpoint(collection_name).run()
+    return run['commit'] if run and run['mode'] == 'full' else None
+
+def ingest_repo(repo_path: str, owner: str, repo: str, commit: Optional[str] = None,
+                resume: bool = True) -> Dict:
+    """Ingest repository with comprehensive logging and status tracking.
+
+    If an earlier full ingestion of the same `commit` was interrupted, its
+    collection is kept and only the files it had not finished are indexed
+    (unless `resume` is False).
+    """
+    repo_key = f"{owner}/{repo}"
+    
+    # Initialize status tracking
+    start_time = _start_status(repo_key, 'full')
     
     try:
         logger.info(f"Starting ingestion for repository: {repo_key}")
         
-        # Stage 1: Load files
-        ingestion_status[repo_key]['stage'] = 'loading_files'
-        raw_documents = load_code_files(repo_path, repo_key)
-        
-        if not raw_documents:
-            raise Exception("No documents found to process")
-        
-        logger.info(f"Loaded {len(raw_documents)} documents")
+        # Stage 1: Connect to the vector store
+        update_status(repo_key, {'stage': 'connecting_chroma'})
         
-        # Stage 2: Chunk documents
-        ingestion_status[repo_key].update({
-            'stage': 'chunking',
-            'progress_percent': 30
-        })
-        
-        logger.info("Starting document chunking...")
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1500,  # Larger chunks for better code context
-            chunk_overlap=200,  # More overlap to preserve context
-            separators=["\n\n", "\n", " ", ""]  # Code-friendly separators
-        )
-        
-        documents = splitter.split_documents(raw_documents)
-        logger.info(f"Created {len(documents)} chunks")
+        client = vectordb.get_store()
         
-        # Stage 3: Connect to ChromaDB
-        ingestion_status[repo_key].update({
-            'stage': 'connecting_chroma',
-            'progress_percent': 40
-        })
+        # Create collection name
+        collection_name = vectordb.repo_collection_name(owner, repo)
+        checkpoint = vectordb.ingest_checkpoint(collection_name)
         
-        # Connect to ChromaDB - try HTTP client first, fallback to persistent client
-        client = None
-        try:
-            # Try HTTP client first
-            chroma_host = os.getenv('CHROMA_HOST', 'localhost:8000')
-            host, port = chroma_host.split(':')
-            client = chromadb.HttpClient(host=host, port=int(port))
-            client.heartbeat()
-            logger.info(f"Successfully connected to ChromaDB via HTTP client at {host}:{port}")
-        except Exception as http_error:
-            logger.warning(f"HTTP client failed: {http_error}, trying persistent client")
+        collection = None
+        done: Dict[str, int] = {}
+        if resume and commit and resumable_commit(collection_name) == commit:
             try:
-                # Fallback to persistent client
-                client = chromadb.PersistentClient(path="./chroma")
-                logger.info("Successfully connected to ChromaDB via persistent client")
-            except Exception as persistent_error:
-                logger.error(f"Both HTTP and persistent clients failed. HTTP: {http_error}, Persistent: {persistent_error}")
-                raise Exception(f"Could not connect to ChromaDB. HTTP error: {http_error}, Persistent error: {persistent_error}")
+                collection = client.get_collection(name=collection_name)
+                done = checkpoint.done_files()
+                logger.info(f"Resuming ingestion of {repo_key} at {commit}: {len(done)} files already indexed")
+            except Exception:
+                collection = None  # The collection went away; start over
         
-        # Create collection name
-        collection_name = f"{owner}_{repo}".replace("/", "_").replace("-", "_")
-        
-        # Delete existing collection if it exists
-        try:
-            client.delete_collection(name=collection_name)
-            logger.info(f"Deleted existing collection: {collection_name}")
-        except Exception:
-            pass  # Collection doesn't exist
+        if collection is None:
+            # Delete existing collection if it exists
+            try:
+                client.delete_collection(name=collection_name)
+                logger.info(f"Deleted existing collection: {collection_name}")
+            except Exception:
+                pass  # Collection doesn't exist
+            
+            vectordb.invalidate_collection(collection_name)
+            vectordb.lexical_index(collection_name).clear()
+            vectordb.locator_index(collection_name).clear()
+            vectordb.symbol_index(collection_name).clear()
+            
+            collection = client.create_collection(name=collection_name)
+            logger.info(f"Created collection: {collection_name} ({vectordb.VECTOR_BACKEND})")
+            checkpoint.begin(commit, 'full')
         
-        collection = client.create_collection(name=collection_name)
-        logger.info(f"Created ChromaDB collection: {collection_name}")
+        update_status(repo_key, {'resumed_files': len(done)})
         
-        # Stage 4: Generate embeddings
-        ingestion_status[repo_key].update({
-            'stage': 'generating_embeddings',
-            'progress_percent': 50,
-            'total_chunks': len(documents),
-            'processed_chunks': 0
-        })
+        # Stage 2: Stream files through chunking and embedding into the collection
+        file_paths = (
+            file_path for file_path in iter_code_files(repo_path)
+            if Path(file_path).relative_to(repo_path).as_posix() not in done
+        )
+        stats = _index_files(collection, file_paths, repo_path, repo_key, checkpoint=checkpoint)
+        # Neighbour lists stored while the collection was filling up miss what came after them
+        vectordb.locator_index(collection_name).clear_neighbors()
         
-        ollama_host = os.getenv('OLLAMA_HOST', 'localhost:11434')
-        ollama_client = ollama.Client(host=f'http://{ollama_host}')
+        if not stats['processed_files'] and not done:
+            raise Exception("No documents found to process")
         
-        logger.info(f"Starting embedding generation for {len(documents)} chunks...")
+        # With files missing chunks the checkpoint stays, so the next run of
+        # this commit resumes with just those files
+        partial = stats['incomplete_files'] > 0
+        if not partial:
+            _mark_indexed(collection, commit)
+            checkpoint.clear()
         
-        # Process documents in batches
-        batch_size = 10
-        successful_adds = 0
+        # Files and chunks stored by the interrupted run count towards the totals
+        stats['processed_files'] += len(done)
+        stats['total_chunks'] += sum(done.values())
+        stats['successful_chunks'] += sum(done.values())
         
-        for i in range(0, len(documents), batch_size):
-            batch = documents[i:i + batch_size]
-            batch_ids = []
-            batch_embeddings = []
-            batch_documents = []
-            batch_metadatas = []
-            
-            for j, doc in enumerate(batch):
-                doc_id = i + j
-                try:
-                    response = ollama_client.embed(model="mxbai-embed-large", input=doc.page_content)
-                    
-                    # Handle different response formats
-                    if "embeddings" in response:
-                        embedding = response["embeddings"]
-                        if isinstance(embedding, list) and len(embedding) > 0:
-                            # If embeddings is a list of embeddings, take the first one
-                            embedding = embedding[0] if isinstance(embedding[0], list) else embedding
-                    elif "embedding" in response:
-                        embedding = response["embedding"]
-                    else:
-                        logger.error(f"Unexpected embedding response format: {response.keys()}")
-                        continue
-                    
-                    batch_ids.append(str(doc_id))
-                    batch_embeddings.append(embedding)
-                    batch_documents.append(doc.page_content)
-                    
-                    # Prepare metadata
-                    metadata = dict(doc.metadata)
-                    metadata['chunk_index'] = doc_id
-                    metadata['repo_path'] = repo_path
-                    batch_metadatas.append(metadata)
-                    
-                except Exception as e:
-                    logger.error(f"Error embedding chunk {doc_id}: {e}")
-                    continue
-            
-            # Add batch to collection
-            if batch_ids:
-                try:
-                    collection.add(
-                        ids=batch_ids,
-                        embeddings=batch_embeddings,
-                        documents=batch_documents,
-                        metadatas=batch_metadatas
-                    )
-                    successful_adds += len(batch_ids)
-                    
-                    # Update progress
-                    progress = 50 + int((successful_adds / len(documents)) * 45)  # 50-95%
-                    ingestion_status[repo_key].update({
-                        'processed_chunks': successful_adds,
-                        'progress_percent': progress
-                    })
-                    
-                    if successful_adds % 50 == 0:
-                        logger.info(f"Embedded {successful_adds}/{len(documents)} chunks ({progress}%)")
-                        
-                except Exception as e:
-                    logger.error(f"Error adding batch to ChromaDB: {e}")
-                    continue
-        
-        # Stage 5: Complete
+        # Stage 3: Complete
         end_time = time.time()
-        duration = end_time - ingestion_status[repo_key]['start_time']
+        duration = end_time - start_time
         
-        ingestion_status[repo_key].update({
-            'status': 'completed',
-            'stage': 'completed',
+        update_status(repo_key, {
+            'status': 'partial' if partial else 'completed',
+            'stage': 'partial' if partial else 'completed',
             'progress_percent': 100,
             'end_time': end_time,
             'duration': duration,
             'collection_name': collection_name,
-            'total_documents': len(raw_documents),
-            'total_chunks': len(documents),
-            'successful_chunks': successful_adds
+            'indexed_commit': None if partial else commit,
+            'incomplete_files': stats['incomplete_files'],
+            'total_documents': stats['processed_files'],
+            'total_chunks': stats['total_chunks'],
+            'successful_chunks': stats['successful_chunks'],
+            'chunks_per_second': stats['embedding']['chunks_per_second'],
+            'embed_cache_hit_rate': stats['embedding']['cache_hit_rate'],
+            'time_to_first_chunk': stats['time_to_first_chunk'],
+            'peak_rss_mb': stats['peak_rss_mb']
         })
         
-        logger.info(f"Ingestion completed for {repo_key} in {duration:.2f} seconds")
-        logger.info(f"Collection: {collection_name}, Documents: {len(raw_documents)}, Chunks: {successful_adds}/{len(documents)}")
+        logger.info(f"Ingestion {'partially ' if partial else ''}completed for {repo_key} in {duration:.2f} seconds")
+        logger.info(f"Collection: {collection_name}, Documents: {stats['processed_files']}, "
+                    f"Chunks: {stats['successful_chunks']}/{stats['total_chunks']}")
         
         return {
             'success': True,
+            'mode': 'full',
+            'partial': partial,
             'collection_name': collection_name,
-            'total_documents': len(raw_documents),
-            'total_chunks': len(documents),
-            'successful_chunks': successful_adds,
-            'duration': duration
+            'resumed_files': len(done),
+            'incomplete_files': stats['incomplete_files'],
+            'total_documents': stats['processed_files'],
+            'error_files': stats['error_files'],
+            'total_chunks': stats['total_chunks'],
+            'successful_chunks': stats['successful_chunks'],
+            'duration': duration,
+            'time_to_first_chunk': stats['time_to_first_chunk'],
+            'peak_rss_mb': stats['peak_rss_mb'],
+            'stage_seconds': stats['stage_seconds'],
+            'embedding': stats['embedding']
         }
         
     except Exception as e:
-        error_msg = str(e)
-        logger.error(f"Ingestion failed for {repo_key}: {error_msg}")
+        return _fail_status(repo_key, str(e))
+
+def update_repo(repo_path: str, owner: str, repo: str, changed_files: List[str],
+                deleted_files: List[str], commit: str) -> Dict:
+    """Re-index only the files that changed since the collection's indexed commit.
+
+    `changed_files` (added or modified) and `deleted_files` are paths relative
+    to `repo_path`. Stale chunks of every touched file are deleted by their
+    `relative_path` metadata, then the current version is re-chunked and
+    upserted under stable per-file chunk IDs.
+    """
+    repo_key = f"{owner}/{repo}"
+    start_time = _start_status(repo_key, 'update')
+    
+    try:
+        collection_name = vectordb.repo_collection_name(owner, repo)
+        logger.info(f"Starting incremental update for {repo_key}: "
+                    f"{len(changed_files)} changed, {len(deleted_files)} deleted")
+        
+        collection = vectordb.get_store().get_collection(name=collection_name)
         
-        ingestion_status[repo_key].update({
-            'status': 'failed',
-            'stage': 'error',
-            'error': error_msg,
-            'end_time': time.time()
+        # An interrupted update to the same commit already re-indexed these files
+        checkpoint = vectordb.ingest_checkpoint(collection_name)
+        run = checkpoint.run()
+        if run and run['mode'] == 'update' and run['commit'] == commit:
+            done = checkpoint.done_files()
+            logger.info(f"Resuming update of {repo_key} to {commit}: {len(done)} files already indexed")
+        else:
+            done = {}
+            checkpoint.begin(commit, 'update')
+        update_status(repo_key, {'resumed_files': len(done)})
+        
+        # Stage 1: Drop chunks of every file that changed or disappeared
+        update_status(repo_key, {
+            'status': 'in_progress',
+            'stage': 'deleting_stale_chunks',
+            'progress_percent': 10
         })
+        stale_paths = [path for path in list(changed_files) + list(deleted_files) if path not in done]
+        for i in range(0, len(stale_paths), DELETE_BATCH_PATHS):
+            collection.delete(where={'relative_path': {'$in': stale_paths[i:i + DELETE_BATCH_PATHS]}})
+        vectordb.lexical_index(collection_name).delete_paths(stale_paths)
+        vectordb.locator_index(collection_name).delete_paths(stale_paths)
+        vectordb.symbol_index(collection_name).delete_paths(stale_paths)
+        
+        # Stage 2: Re-chunk, embed and upsert the current version of changed files
+        file_paths = (
+            os.path.join(repo_path, relative_path)
+            for relative_path in changed_files
+            if relative_path not in done
+            and os.path.isfile(os.path.join(repo_path, relative_path))
+            and should_process_file(os.path.join(repo_path, relative_path))
+        )
+        stats = _index_files(collection, file_paths, repo_path, repo_key, checkpoint=checkpoint)
+        # Left at the old commit with the checkpoint kept, the next update
+        # to this commit redoes only the files that were not fully stored
+        partial = stats['incomplete_files'] > 0
+        if not partial:
+            _mark_indexed(collection, commit)
+            checkpoint.clear()
+        vectordb.invalidate_collection(collection_name)
+        
+        end_time = time.time()
+        duration = end_time - start_time
+        update_status(repo_key, {
+            'status': 'partial' if partial else 'completed',
+            'stage': 'partial' if partial else 'completed',
+            'progress_percent': 100,
+            'end_time': end_time,
+            'duration': duration,
+            'collection_name': collection_name,
+            'indexed_commit': None if partial else commit,
+            'incomplete_files': stats['incomplete_files'],
+            'changed_files': len(changed_files),
+            'deleted_files': len(deleted_files),
+            'total_chunks': stats['total_chunks'],
+            'successful_chunks': stats['successful_chunks'],
+            'embed_cache_hit_rate': stats['embedding']['cache_hit_rate']
+        })
+        logger.info(f"Incremental update {'partially ' if partial else ''}completed for {repo_key} in {duration:.2f} seconds")
         
         return {
-            'success': False,
-            'error': error_msg
+            'success': True,
+            'mode': 'update',
+            'partial': partial,
+            'collection_name': collection_name,
+            'resumed_files': len(done),
+            'incomplete_files': stats['incomplete_files'],
+            'changed_files': len(changed_files),
+            'deleted_files': len(deleted_files),
+            'total_documents': stats['processed_files'],
+            'error_files': stats['error_files'],
+            'total_chunks': stats['total_chunks'],
+            'successful_chunks': stats['successful_chunks'],
+            'duration': duration,
+            'stage_seconds': stats['stage_seconds'],
+            'embedding': stats['embedding']
         }
+        
+    except Exception as e:
+        return _fail_status(repo_key, str(e))
 
 def get_ingestion_status(owner: str, repo: str) -> Optional[Dict]:
     """Get current ingestion status for a repository"""
     repo_key = f"{owner}/{repo}"
-    return ingestion_status.get(repo_key)
+    return get_state_store().get_status(repo_key)
+
+def index_version(owner: str, repo: str) -> str:
+    """Changes whenever the repository's index is rebuilt or updated, as seen by every server process"""
+    status = get_ingestion_status(owner, repo) or {}
+    return f"{status.get('indexed_commit') or ''}@{status.get('end_time') or status.get('start_time') or ''}"
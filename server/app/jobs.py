@@ -0,0 +1,383 @@
+import os
+import time
+import signal
+import uuid
+import logging
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+from app import ingest
+from app import metrics
+from app import repos
+from app import vectordb
+from app.chunkpool import shutdown_pool
+from app.state import ACTIVE_JOB_STATES, LEASE_TTL, get_state_store
+
+logger = logging.getLogger(__name__)
+
+# Number of ingestion worker processes; each runs one clone/ingest at a time
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Finished jobs kept around for status queries
+MAX_FINISHED_JOBS = int(os.getenv("MAX_FINISHED_JOBS", "200"))
+# Re-submit jobs whose server or worker went away mid-run; ingestion picks
+# up from its checkpoint (see app.checkpoint)
+RESUME_INTERRUPTED_JOBS = os.getenv("INGEST_RESUME_INTERRUPTED", "1") != "0"
+
+_lock = threading.Lock()
+_executor = None
+_watcher = None
+_shutting_down = False
+# Jobs submitted by this process that have not finished: job ID -> repo key.
+# Job records, ingestion status and repo leases live in the shared state
+# store (app.state) so any server process can answer for them.
+_pending: Dict[str, str] = {}
+
+
+# ---------------------------------------------------------------------------
+# Job bodies (run inside worker processes)
+# ---------------------------------------------------------------------------
+
+def clone_and_ingest(owner: str, repo: str, mode: str = "auto", strategy: Optional[str] = None) -> Dict:
+    """Clone (or fetch) a repository and index it.
+
+    With mode "auto" an existing checkout that has been indexed before is
+    fetched and only the files changed since the indexed commit are
+    re-embedded, and an interrupted ingestion of the checked-out commit is
+    resumed; "full" always re-clones and rebuilds the collection,
+    "update" requires the incremental path. `strategy` picks how a fresh
+    clone is made (see repos.CLONE_STRATEGIES).
+    """
+    repo_path = repos.checkout_path(owner, repo)
+    collection_name = vectordb.repo_collection_name(owner, repo)
+    transfer = None
+    result = None
+
+    if mode != "full":
+        indexed_commit = ingest.get_indexed_commit(collection_name)
+        try:
+            if not indexed_commit or not repos.is_checkout(repo_path):
+                raise Exception("repository has not been indexed yet")
+            new_head, transfer = repos.fetch_latest(repo_path)
+            changed, deleted = repos.changed_files(repo_path, indexed_commit, new_head)
+        except Exception as e:
+            if mode == "update":
+                raise Exception(f"Incremental update not possible: {e}")
+            logger.info(f"Falling back to full ingest for {owner}/{repo}: {e}")
+        else:
+            result = ingest.update_repo(
+                repo_path=str(repo_path),
+                owner=owner,
+                repo=repo,
+                changed_files=changed,
+                deleted_files=deleted,
+                commit=new_head
+            )
+
+    if result is None and mode == "auto" and repos.is_checkout(repo_path):
+        pending_commit = ingest.resumable_commit(collection_name)
+        if pending_commit and pending_commit == repos.head_commit(repo_path):
+            logger.info(f"Resuming interrupted ingest of {owner}/{repo} at {pending_commit} without re-cloning")
+            result = ingest.ingest_repo(
+                repo_path=str(repo_path),
+                owner=owner,
+                repo=repo,
+                commit=pending_commit
+            )
+
+    if result is None:
+        ingest.update_status(f"{owner}/{repo}", {'status': 'starting', 'stage': 'cloning'}, replace=True)
+        try:
+            transfer = repos.clone(repos.clone_url(owner, repo), repo_path,
+                                   strategy=strategy or repos.DEFAULT_CLONE_STRATEGY)
+        except subprocess.TimeoutExpired:
+            raise Exception(f"Repository cloning timed out ({repos.GIT_TIMEOUT // 60} minutes)")
+        logger.info(f"Repository cloned to {repo_path}")
+        result = ingest.ingest_repo(
+            repo_path=str(repo_path),
+            owner=owner,
+            repo=repo,
+            commit=repos.head_commit(repo_path),
+            resume=mode != "full"
+        )
+
+    if not result['success']:
+        raise Exception(f"Failed to ingest repository into vector database: {result.get('error')}")
+
+    result['local_path'] = str(repo_path)
+    result['transfer'] = transfer
+    return result
+
+
+def ingest_checkout(owner: str, repo: str) -> Dict:
+    """Fully re-index the existing checkout of a repository"""
+    repo_path = repos.checkout_path(owner, repo)
+    if not repos.is_checkout(repo_path):
+        raise Exception(f"Repository {owner}/{repo} has not been cloned")
+    result = ingest.ingest_repo(
+        repo_path=str(repo_path),
+        owner=owner,
+        repo=repo,
+        commit=repos.head_commit(repo_path)
+    )
+    if not result['success']:
+        raise Exception(f"Failed to ingest repository into vector database: {result.get('error')}")
+    result['local_path'] = str(repo_path)
+    return result
+
+
+JOB_KINDS = {
+    'clone': clone_and_ingest,
+    'ingest': ingest_checkout,
+}
+
+
+def _hold_lease(repo_key: str, job_id: str, stop: threading.Event):
+    store = get_state_store()
+    while not stop.wait(LEASE_TTL / 3):
+        try:
+            store.renew_lease(repo_key, job_id)
+        except Exception as e:
+            logger.warning(f"Could not renew ingestion lease for {repo_key}: {e}")
+
+
+def _terminate_worker(signum, frame):
+    # Take the chunking processes down too instead of orphaning them
+    shutdown_pool(terminate=True)
+    os._exit(128 + signum)
+
+
+def _init_worker():
+    # shutdown() terminates job workers without waiting for them
+    signal.signal(signal.SIGTERM, _terminate_worker)
+
+
+def _run_job(job_id: str, kind: str, kwargs: Dict) -> Dict:
+    store = get_state_store()
+    job = store.update_job(job_id, {'state': 'running', 'started_at': time.time()}, unless_finished=True)
+    # The lease may have lapsed while queued (e.g. the submitting server died)
+    # and been taken over; never clone or rebuild under another job's feet
+    if job is None or store.lease_holder(job['repo_key']) != job_id:
+        raise Exception(f"Job {job_id} no longer holds the ingestion lease")
+    # The worker keeps the lease itself, so it stays held exactly as long as
+    # the ingestion is really running, even if the submitting server is gone
+    stop = threading.Event()
+    threading.Thread(target=_hold_lease, args=(job['repo_key'], job_id, stop), daemon=True).start()
+    try:
+        return JOB_KINDS[kind](**kwargs)
+    finally:
+        stop.set()
+
+
+# ---------------------------------------------------------------------------
+# Server side
+# ---------------------------------------------------------------------------
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn keeps workers free of the server's threads and open sockets
+        ctx = multiprocessing.get_context("spawn")
+        _executor = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=ctx, initializer=_init_worker)
+    return _executor
+
+
+def _watch_leases():
+    """Keep the leases of this process's jobs alive and pick up interrupted jobs"""
+    while True:
+        time.sleep(LEASE_TTL / 3)
+        with _lock:
+            pending = dict(_pending)
+        store = get_state_store()
+        for job_id, repo_key in pending.items():
+            try:
+                if not store.renew_lease(repo_key, job_id):
+                    logger.warning(f"Job {job_id} lost the ingestion lease for {repo_key}")
+            except Exception as e:
+                logger.warning(f"Could not renew ingestion lease for {repo_key}: {e}")
+        try:
+            resume_interrupted()
+        except Exception as e:
+            logger.warning(f"Could not resume interrupted ingestion jobs: {e}")
+
+
+def start():
+    """Start the lease watcher (and resume jobs interrupted by a previous shutdown)"""
+    global _watcher
+    with _lock:
+        if _watcher is not None:
+            return
+        _watcher = threading.Thread(target=_watch_leases, name="ingest-leases", daemon=True)
+    _watcher.start()
+    resume_interrupted()
+
+
+def resume_interrupted() -> List[Dict]:
+    """Re-submit queued or running jobs that nothing is working on any more.
+
+    A job is interrupted once no one holds its repository's lease: its
+    server shut down or died, or its worker process did. The re-submitted
+    job resumes from the ingestion checkpoint; the old record is closed
+    with a pointer to it. Returns the new jobs.
+    """
+    if not RESUME_INTERRUPTED_JOBS or _shutting_down:
+        return []
+    store = get_state_store()
+    resumed = []
+    for job in store.active_jobs():
+        # Jobs younger than a renewal interval may still be taking their lease
+        if time.time() - job['submitted_at'] < LEASE_TTL / 3:
+            continue
+        holder = store.lease_holder(job['repo_key'])
+        if holder == job['job_id']:
+            continue
+        if holder is None:
+            kwargs = dict(job.get('kwargs') or {})
+            if kwargs.get('mode') == 'full':
+                # The rebuild already started; carry on with it rather than start over
+                kwargs['mode'] = 'auto'
+            replacement = submit(job['kind'], job['owner'], job['repo'], **kwargs)
+            resumed.append(replacement)
+            logger.info(f"Resuming interrupted job {job['job_id']} ({job['kind']} {job['repo_key']}) "
+                        f"as {replacement['job_id']}")
+        else:
+            replacement = store.get_job(holder) or {'job_id': holder}
+        store.update_job(job['job_id'], {
+            'state': 'failed',
+            'finished_at': time.time(),
+            'error': f"Interrupted; continued by job {replacement['job_id']}",
+        }, unless_finished=True)
+    return resumed
+
+
+def _finish(job_id: str, future):
+    store = get_state_store()
+    if _shutting_down:
+        # Cancelled or killed by shutdown: leave the job queued/running so the
+        # next server to start resumes it, and free the repository for it
+        with _lock:
+            repo_key = _pending.pop(job_id)
+        store.release_lease(repo_key, job_id)
+        return
+    fields = {'finished_at': time.time()}
+    try:
+        fields['result'] = future.result()
+        fields['state'] = 'completed'
+    except Exception as e:
+        fields['state'] = 'failed'
+        fields['error'] = str(e)
+    with _lock:
+        repo_key = _pending.pop(job_id)
+    job = store.update_job(job_id, fields)
+    if fields['state'] == 'failed':
+        # The worker may have died before reporting; make the failure visible
+        status = store.get_status(repo_key) or {}
+        if status.get('status') != 'failed':
+            store.update_status(repo_key, {'status': 'failed', 'stage': 'error', 'error': fields['error'],
+                                           'end_time': time.time()})
+    store.release_lease(repo_key, job_id)
+    store.prune_jobs(MAX_FINISHED_JOBS)
+    owner, _, repo = repo_key.partition("/")
+    # The worker re-created or modified the collection behind our cached handle
+    vectordb.invalidate_collection(vectordb.repo_collection_name(owner, repo))
+    if job is None:
+        # Pruned or deleted while it ran (e.g. by another process); nothing left to count it against
+        logger.warning(f"Job {job_id} ({repo_key}) {fields['state']}, but its record is gone")
+        return
+    # Ingestion counters live in the worker; fold in what it returned
+    metrics.record_ingest(job['kind'], job['state'], job['result'])
+    logger.info(f"Job {job_id} ({job['kind']} {repo_key}) {job['state']}")
+
+
+def find_active_job(owner: str, repo: str) -> Optional[Dict]:
+    """Return the queued or running job for a repository, if any (from any server process)"""
+    store = get_state_store()
+    holder = store.lease_holder(f"{owner}/{repo}")
+    if holder is None:
+        return None
+    job = store.get_job(holder)
+    if job is None or job['state'] not in ACTIVE_JOB_STATES:
+        return None
+    return job
+
+
+def submit(kind: str, owner: str, repo: str, **kwargs) -> Dict:
+    """Queue a clone/ingest job and return its record immediately.
+
+    A repository has at most one active job across all server processes:
+    the job must first take the repository's lease in the state store, and
+    submitting while another job holds it returns that job instead.
+    """
+    global _executor
+    store = get_state_store()
+    job_id = uuid.uuid4().hex
+    repo_key = f"{owner}/{repo}"
+    job = {
+        'job_id': job_id,
+        'kind': kind,
+        'owner': owner,
+        'repo': repo,
+        'repo_key': repo_key,
+        'state': 'queued',
+        'submitted_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+        'result': None,
+        'error': None,
+        'kwargs': dict(kwargs),
+    }
+    store.put_job(job)
+    if not store.acquire_lease(repo_key, job_id):
+        store.delete_job(job_id)
+        active = find_active_job(owner, repo)
+        if active is not None:
+            return active
+        raise Exception(f"Repository {repo_key} is being ingested by another server")
+    with _lock:
+        _pending[job_id] = repo_key
+    store.update_status(repo_key, {'status': 'queued', 'stage': 'queued', 'progress_percent': 0}, replace=True)
+
+    call_kwargs = dict(kwargs, owner=owner, repo=repo)
+    try:
+        try:
+            future = _get_executor().submit(_run_job, job_id, kind, call_kwargs)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool
+            logger.warning("Ingestion worker pool was broken, restarting it")
+            _executor = None
+            future = _get_executor().submit(_run_job, job_id, kind, call_kwargs)
+    except Exception:
+        with _lock:
+            _pending.pop(job_id, None)
+        store.release_lease(repo_key, job_id)
+        store.delete_job(job_id)
+        raise
+    future.add_done_callback(lambda f: _finish(job_id, f))
+    return job
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    return get_state_store().get_job(job_id)
+
+
+def shutdown():
+    """Stop all ingestion right away; unfinished jobs resume from their checkpoints on the next start"""
+    global _executor, _shutting_down
+    _shutting_down = True
+    if _executor is not None:
+        # Waiting for running ingestions would hold up every restart (e.g.
+        # --reload) for as long as the largest repository takes to index
+        workers = list((_executor._processes or {}).values())
+        _executor.shutdown(wait=False, cancel_futures=True)
+        for process in workers:
+            process.terminate()
+        _executor = None
+    # Let another server pick the repositories up right away
+    with _lock:
+        pending = dict(_pending)
+    store = get_state_store()
+    for job_id, repo_key in pending.items():
+        store.release_lease(repo_key, job_id)
@@ -0,0 +1,138 @@
+import os
+import re
+import math
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.sqlite_util import open_db, transaction, PathCache
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Query terms used per search, rarest first (long selections have hundreds)
+MAX_QUERY_TERMS = int(os.getenv("LEXICAL_MAX_QUERY_TERMS", "32"))
+# Selections up to this length that look like one identifier skip the embedder
+IDENTIFIER_MAX_CHARS = int(os.getenv("LEXICAL_IDENTIFIER_MAX_CHARS", "80"))
+
+_IDENTIFIER = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*")
+_QUALIFIED = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*(?:(?:\.|::|->)[A-Za-z_$][A-Za-z0-9_$]*)*(?:\(\))?")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Code-aware tokens: each identifier lowercased, plus its snake/camel parts.
+
+    `get_or_create_collection` yields itself and get/or/create/collection, and
+    `embedInBatches` yields itself and embed/in/batches, so both exact
+    identifiers and their words match.
+    """
+    tokens = []
+    for identifier in _IDENTIFIER.findall(text):
+        if len(identifier) < 2:
+            continue
+        whole = identifier.lower()
+        tokens.append(whole)
+        parts = [p.lower() for piece in identifier.split('_') for p in _CAMEL.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if len(p) > 1 and p != whole)
+    return tokens
+
+
+def is_identifier(text: str) -> bool:
+    """True for selections like `ingestion_status`, `vectordb.get_collection` or `Foo::bar()`"""
+    text = text.strip()
+    return 0 < len(text) <= IDENTIFIER_MAX_CHARS and _QUALIFIED.fullmatch(text) is not None
+
+
+class LexicalIndex:
+    """BM25 inverted index over chunk tokens, stored in SQLite next to a collection.
+
+    Documents are keyed by the same chunk IDs as the vector collection and
+    carry their `relative_path`, so incremental updates can drop a file's
+    chunks. WAL mode lets an ingestion worker write while the server reads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_db(path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "  id INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE NOT NULL,"
+            "  relative_path TEXT, length INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS docs_path ON docs (relative_path);"
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, doc INTEGER NOT NULL, tf INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS postings_term ON postings (term);"
+            "CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc);"
+        )
+
+    def _delete_docs(self, where: str, params: Iterable):
+        self._conn.execute(f"DELETE FROM postings WHERE doc IN (SELECT id FROM docs WHERE {where})", params)
+        self._conn.execute(f"DELETE FROM docs WHERE {where}", params)
+
+    def add(self, chunk_ids: List[str], texts: List[str], relative_paths: List[Optional[str]]):
+        """Index (or re-index) chunks under their IDs"""
+        with transaction(self._conn, self._lock):
+            for chunk_id, text, relative_path in zip(chunk_ids, texts, relative_paths):
+                self._delete_docs("chunk_id = ?", (chunk_id,))
+                counts = Counter(tokenize(text))
+                doc = self._conn.execute(
+                    "INSERT INTO docs (chunk_id, relative_path, length) VALUES (?, ?, ?)",
+                    (chunk_id, relative_path, sum(counts.values())),
+                ).lastrowid
+                self._conn.executemany(
+                    "INSERT INTO postings VALUES (?, ?, ?)", [(term, doc, tf) for term, tf in counts.items()]
+                )
+
+    def delete_paths(self, relative_paths: Iterable[str]):
+        with transaction(self._conn, self._lock):
+            for relative_path in relative_paths:
+                self._delete_docs("relative_path = ?", (relative_path,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """Top chunks by BM25 as (chunk_id, score), best first"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            total, avg_length = self._conn.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+            if not total:
+                return []
+            marks = ",".join("?" * len(terms))
+            df = dict(self._conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({marks}) GROUP BY term", list(terms)
+            ).fetchall())
+            if not df:
+                return []
+            # Rarest terms carry the signal; skip stop-word-like terms when there are others
+            ranked = sorted(df, key=df.get)[:MAX_QUERY_TERMS]
+            selective = [t for t in ranked if df[t] <= total / 2] or ranked[:1]
+            marks = ",".join("?" * len(selective))
+            rows = self._conn.execute(
+                f"SELECT p.term, p.tf, d.chunk_id, d.length FROM postings p JOIN docs d ON d.id = p.doc "
+                f"WHERE p.term IN ({marks})", selective
+            ).fetchall()
+
+        scores: Dict[str, float] = {}
+        avg_length = avg_length or 1.0
+        for term, tf, chunk_id, length in rows:
+            idf = math.log(1 + (total - df[term] + 0.5) / (df[term] + 0.5))
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+
+
+get_index = PathCache(LexicalIndex).get
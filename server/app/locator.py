@@ -0,0 +1,190 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.sqlite_util import open_db, transaction, PathCache
+
+logger = logging.getLogger(__name__)
+
+# Lines shorter than this (after whitespace folding) are too common to locate a chunk by
+MIN_LINE_CHARS = int(os.getenv("LOCATOR_MIN_LINE_CHARS", "12"))
+# Selection lines hashed per lookup
+MAX_LOOKUP_LINES = int(os.getenv("LOCATOR_MAX_LOOKUP_LINES", "16"))
+# A line found in more chunks than this is boilerplate; lookups ignore it
+MAX_LINE_POSTINGS = int(os.getenv("LOCATOR_MAX_LINE_POSTINGS", "50"))
+
+
+def squash(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def line_hash(line: str) -> int:
+    """Signed 64-bit hash of a whitespace-folded line (fits an SQLite INTEGER)"""
+    digest = hashlib.blake2b(line.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def _chunk_path(chunk_id: str) -> str:
+    # Chunk IDs are `relative_path::chunk_index`
+    return chunk_id.rpartition("::")[0]
+
+
+def _line_hashes(text: str) -> List[int]:
+    seen = []
+    for line in text.splitlines():
+        line = squash(line)
+        if len(line) >= MIN_LINE_CHARS:
+            h = line_hash(line)
+            if h not in seen:
+                seen.append(h)
+    return seen
+
+
+class LocatorIndex:
+    """Where each chunk of a collection lives, for finding a selection without embedding it.
+
+    Per chunk it keeps the file and line range, and a hash of every
+    non-trivial line, so a selection maps to its containing chunk either
+    by file and line numbers or by looking up the hashes of its own lines.
+    Nearest neighbours of located chunks are stored as they are first
+    computed. Writing or deleting a file drops the stored lists of its
+    chunks and every list that contains one of them; lists elsewhere may
+    miss a closer chunk the write added until the next full ingestion,
+    which drops them all (see clear_neighbors).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_db(path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "  chunk_id TEXT PRIMARY KEY, relative_path TEXT, start_line INTEGER, end_line INTEGER);"
+            "CREATE INDEX IF NOT EXISTS chunks_path ON chunks (relative_path, start_line);"
+            "CREATE TABLE IF NOT EXISTS lines (hash INTEGER NOT NULL, chunk_id TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS lines_hash ON lines (hash);"
+            "CREATE INDEX IF NOT EXISTS lines_chunk ON lines (chunk_id);"
+            "CREATE TABLE IF NOT EXISTS neighbors (chunk_id TEXT PRIMARY KEY, hits TEXT NOT NULL);"
+        )
+        migrating = not self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'neighbor_paths'").fetchone()
+        # The files each stored neighbour list depends on: its chunk's and its hits'
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS neighbor_paths (relative_path TEXT NOT NULL, chunk_id TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS neighbor_paths_path ON neighbor_paths (relative_path);"
+            "CREATE INDEX IF NOT EXISTS neighbor_paths_chunk ON neighbor_paths (chunk_id);"
+        )
+        if migrating:
+            # Lists stored before their files were tracked could never be invalidated
+            self._conn.execute("DELETE FROM neighbors")
+
+    def _delete_chunks(self, where: str, params: Iterable):
+        self._conn.execute(f"DELETE FROM lines WHERE chunk_id IN (SELECT chunk_id FROM chunks WHERE {where})", params)
+        self._conn.execute(f"DELETE FROM chunks WHERE {where}", params)
+
+    def _forget_neighbors(self, relative_paths: Iterable[str]):
+        """Drop stored neighbour lists that depend on these files"""
+        stale = set()
+        for relative_path in relative_paths:
+            stale.update(chunk_id for (chunk_id,) in self._conn.execute(
+                "SELECT chunk_id FROM neighbor_paths WHERE relative_path = ?", (relative_path,)))
+        rows = [(chunk_id,) for chunk_id in stale]
+        self._conn.executemany("DELETE FROM neighbors WHERE chunk_id = ?", rows)
+        self._conn.executemany("DELETE FROM neighbor_paths WHERE chunk_id = ?", rows)
+
+    def add(self, chunk_ids: List[str], texts: List[str], metadatas: List[Dict]):
+        """Record (or re-record) chunks under their IDs"""
+        with transaction(self._conn, self._lock):
+            for chunk_id, text, metadata in zip(chunk_ids, texts, metadatas):
+                self._delete_chunks("chunk_id = ?", (chunk_id,))
+                self._conn.execute(
+                    "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                    (chunk_id, metadata.get('relative_path'), metadata.get('start_line'), metadata.get('end_line')),
+                )
+                self._conn.executemany(
+                    "INSERT INTO lines VALUES (?, ?)", [(h, chunk_id) for h in _line_hashes(text)]
+                )
+            self._forget_neighbors({metadata.get('relative_path') for metadata in metadatas})
+
+    def delete_paths(self, relative_paths: Iterable[str]):
+        relative_paths = list(relative_paths)
+        with transaction(self._conn, self._lock):
+            for relative_path in relative_paths:
+                self._delete_chunks("relative_path = ?", (relative_path,))
+            self._forget_neighbors(relative_paths)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM lines")
+            self._conn.execute("DELETE FROM chunks")
+        self.clear_neighbors()
+
+    def clear_neighbors(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM neighbors")
+            self._conn.execute("DELETE FROM neighbor_paths")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def file_chunks(self, relative_path: str, start_line: Optional[int] = None,
+                    end_line: Optional[int] = None, covering: bool = False) -> List[str]:
+        """Chunk IDs of a file in line order, optionally only those overlapping a line range
+        (or with `covering`, those holding all of it)"""
+        with self._lock:
+            if start_line is None:
+                rows = self._conn.execute(
+                    "SELECT chunk_id FROM chunks WHERE relative_path = ? ORDER BY start_line", (relative_path,)
+                ).fetchall()
+            else:
+                end_line = end_line if end_line is not None else start_line
+                first, last = (start_line, end_line) if covering else (end_line, start_line)
+                rows = self._conn.execute(
+                    "SELECT chunk_id FROM chunks WHERE relative_path = ? AND start_line <= ? AND end_line >= ? "
+                    "ORDER BY start_line", (relative_path, first, last)
+                ).fetchall()
+        return [chunk_id for (chunk_id,) in rows]
+
+    def chunks_with_lines(self, text: str, relative_path: Optional[str] = None) -> List[str]:
+        """Chunks holding the most of `text`'s distinctive lines, best first, optionally only one file's"""
+        hashes = _line_hashes(text)[:MAX_LOOKUP_LINES]
+        if not hashes:
+            return []
+        marks = ",".join("?" * len(hashes))
+        in_file = "AND chunk_id IN (SELECT chunk_id FROM chunks WHERE relative_path = ?) " if relative_path else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id, COUNT(*) AS n FROM lines WHERE hash IN ({marks}) "
+                f"AND hash NOT IN (SELECT hash FROM lines WHERE hash IN ({marks}) "
+                f"GROUP BY hash HAVING COUNT(*) > ?) {in_file}"
+                f"GROUP BY chunk_id ORDER BY n DESC LIMIT 8",
+                hashes + hashes + [MAX_LINE_POSTINGS] + ([relative_path] if relative_path else []),
+            ).fetchall()
+        return [chunk_id for chunk_id, _ in rows]
+
+    def get_neighbors(self, chunk_ids: List[str]) -> Dict[str, List[Tuple[str, float]]]:
+        if not chunk_ids:
+            return {}
+        marks = ",".join("?" * len(chunk_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id, hits FROM neighbors WHERE chunk_id IN ({marks})", chunk_ids
+            ).fetchall()
+        return {chunk_id: [tuple(hit) for hit in json.loads(hits)] for chunk_id, hits in rows}
+
+    def put_neighbors(self, neighbors: Dict[str, List[Tuple[str, float]]]):
+        with transaction(self._conn, self._lock):
+            for chunk_id, hits in neighbors.items():
+                paths = {_chunk_path(chunk_id)} | {_chunk_path(hit_id) for hit_id, _ in hits}
+                self._conn.execute("INSERT OR REPLACE INTO neighbors VALUES (?, ?)", (chunk_id, json.dumps(hits)))
+                self._conn.execute("DELETE FROM neighbor_paths WHERE chunk_id = ?", (chunk_id,))
+                self._conn.executemany("INSERT INTO neighbor_paths VALUES (?, ?)",
+                                       [(path, chunk_id) for path in paths])
+
+
+get_index = PathCache(LocatorIndex).get
@@ -0,0 +1,268 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; covers cache hits (sub-millisecond) up to slow model streams
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        # Values read at scrape time, e.g. cache hit ratios owned by other modules
+        self._callback = callback
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        if self._callback is not None:
+            try:
+                items = sorted(self._callback().items())
+            except Exception:
+                items = []
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts, sum, count)
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+_registry: List[_Metric] = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ---------------------------------------------------------------------------
+# Server metrics
+# ---------------------------------------------------------------------------
+
+http_requests = _register(Counter(
+    "aura_http_requests_total", "HTTP requests by route and status code", ("route", "status")))
+http_in_flight = _register(Gauge(
+    "aura_http_requests_in_flight", "Requests currently being handled, including open streams", ("route",)))
+http_duration = _register(Histogram(
+    "aura_http_request_duration_seconds", "Time from request start to the end of the response body", ("route",)))
+
+select_stage = _register(Histogram(
+    "aura_select_stage_seconds",
+    "Time spent in each /select stage (lexical_query, warm_lookup, locate, query_embed, vector_query, "
+    "context_fetch, symbol_lookup, prompt_build, ttft, stream)", ("stage",)))
+select_results = _register(Counter(
+    "aura_select_results_total", "Finished /select requests by outcome", ("outcome",)))
+select_retrieval = _register(Counter(
+    "aura_select_retrieval_total",
+    "Context searches by retrieval path (lexical, warm and located skip the query embedding)", ("mode",)))
+select_context_snippets = _register(Histogram(
+    "aura_select_context_snippets", "Related snippets retrieved as prompt candidates per /select", (),
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20)))
+
+ingest_jobs = _register(Counter(
+    "aura_ingest_jobs_total", "Finished clone/ingest jobs by kind, mode and state", ("kind", "mode", "state")))
+ingest_files = _register(Counter(
+    "aura_ingest_files_total", "Files handled by ingestion jobs", ("result",)))
+ingest_chunks = _register(Counter(
+    "aura_ingest_chunks_total", "Chunks handled by ingestion jobs", ("result",)))
+ingest_embed_batches = _register(Counter(
+    "aura_ingest_embed_batches_total", "Embedding requests sent by ingestion jobs"))
+ingest_duration = _register(Histogram(
+    "aura_ingest_duration_seconds", "Wall time of completed ingestion jobs", ("mode",),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 3600)))
+ingest_stage = _register(Histogram(
+    "aura_ingest_stage_seconds", "Busy time per ingestion pipeline stage, per job", ("stage",),
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1200, 3600)))
+
+
+def record_ingest(kind: str, state: str, result: Optional[Dict]):
+    """Fold the stats of a finished job (returned from its worker process) into the counters"""
+    result = result or {}
+    ingest_jobs.inc(kind=kind, mode=result.get('mode', 'unknown'), state=state)
+    if state != 'completed':
+        return
+    ingest_files.inc(result.get('total_documents', 0), result='processed')
+    ingest_files.inc(result.get('error_files', 0), result='error')
+    chunks = result.get('total_chunks', 0)
+    written = result.get('successful_chunks', 0)
+    embedding = result.get('embedding') or {}
+    ingest_chunks.inc(written, result='written')
+    ingest_chunks.inc(max(0, chunks - written), result='failed')
+    ingest_chunks.inc(embedding.get('cached_chunks', 0), result='embed_cache_hit')
+    ingest_embed_batches.inc(embedding.get('embed_batches', 0))
+    if result.get('duration') is not None:
+        ingest_duration.observe(result['duration'], mode=result.get('mode', 'unknown'))
+    for stage, seconds in (result.get('stage_seconds') or {}).items():
+        ingest_stage.observe(seconds, stage=stage)
+
+
+def register_cache_stats(name: str, stats: Callable[[], Dict]):
+    """Export a cache's hit ratio and hit/miss counts, read from `stats()` at scrape time"""
+    metric = name.replace('-', '_')
+    _register(Gauge(f"aura_{metric}_hit_ratio", f"Hit ratio of the {name}",
+                    callback=lambda: {(): stats().get('hit_ratio', 0.0)}))
+    _register(Gauge(f"aura_{metric}_lookups", f"Hits and misses of the {name} since start", ("result",),
+                    callback=lambda: {('hit',): stats().get('hits', 0), ('miss',): stats().get('misses', 0)}))
+
+
+# ---------------------------------------------------------------------------
+# ASGI middleware
+# ---------------------------------------------------------------------------
+
+class MetricsMiddleware:
+    """Counts requests and tracks in-flight requests until the body is fully sent.
+
+    A plain ASGI wrapper (rather than an @app.middleware function) so that
+    streaming responses stay "in flight" until their last chunk.
+    """
+
+    def __init__(self, app, routes: Sequence[str] = ()):
+        self.app = app
+        self.routes = set(routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope.get("path", "")
+        route = path if path in self.routes else "other"
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_in_flight.inc(route=route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec(route=route)
+            http_duration.observe(time.perf_counter() - start, route=route)
+            http_requests.inc(route=route, status=str(status["code"]))
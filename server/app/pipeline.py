@@ -0,0 +1,106 @@
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    """Raised inside a stage when another stage has failed."""
+
+
+class Pipeline:
+    """Stages running in threads, connected by bounded queues.
+
+    Each stage reads from its input queue with `iterate` and writes with
+    `put`; both block while the neighbouring stage is behind, so at most
+    `maxsize` items per queue are ever buffered. When any stage raises,
+    the others are stopped and `join` re-raises the first error.
+    """
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self):
+        self.stop = threading.Event()
+        self.errors: List[BaseException] = []
+        self.stage_seconds: Dict[str, float] = {}
+        self._threads: List[threading.Thread] = []
+        self._timing_lock = threading.Lock()
+
+    def make_queue(self, maxsize: int) -> queue.Queue:
+        return queue.Queue(maxsize=maxsize)
+
+    def put(self, q: queue.Queue, item):
+        while True:
+            if self.stop.is_set():
+                raise PipelineAborted()
+            try:
+                q.put(item, timeout=self.POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def close(self, q: queue.Queue):
+        """Signal end of stream to the consumer of `q`"""
+        while not self.stop.is_set():
+            try:
+                q.put(_DONE, timeout=self.POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def iterate(self, q: queue.Queue) -> Iterator:
+        while True:
+            if self.stop.is_set():
+                raise PipelineAborted()
+            try:
+                item = q.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+    @contextmanager
+    def timed(self, name: str):
+        """Accumulate time spent doing `name` work (excluding queue waits)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        """Add `seconds` of `name` work done elsewhere (e.g. in a worker process)"""
+        with self._timing_lock:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+
+    def fail(self, error: BaseException):
+        self.errors.append(error)
+        self.stop.set()
+
+    def stage(self, name: str, fn: Callable, *args):
+        """Run `fn(*args)` in its own thread as a pipeline stage"""
+        def run():
+            try:
+                fn(*args)
+            except PipelineAborted:
+                pass
+            except BaseException as e:
+                logger.error(f"Pipeline stage '{name}' failed: {e}")
+                self.fail(e)
+
+        thread = threading.Thread(target=run, name=f"pipeline-{name}", daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
@@ -0,0 +1,175 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.embeddings import EMBED_MODEL, query_embedding_cache
+
+logger = logging.getLogger(__name__)
+
+# How long a prefetched file stays warm, and how many are kept in total
+PREFETCH_TTL = int(os.getenv("PREFETCH_TTL", "600"))  # seconds
+PREFETCH_MAX_FILES = int(os.getenv("PREFETCH_MAX_FILES", "256"))
+# Files are split into at most this many chunks for neighbour precomputation
+PREFETCH_MAX_CHUNKS = int(os.getenv("PREFETCH_MAX_CHUNKS", "64"))
+# Nearest chunks kept per file chunk
+PREFETCH_NEIGHBORS = int(os.getenv("PREFETCH_NEIGHBORS", "20"))
+# Selection lines shorter than this are too generic to locate a chunk by
+_MIN_LINE_CHARS = 8
+
+
+def _squash(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+class WarmFile:
+    """One file's chunks and each chunk's nearest neighbours in the collection.
+
+    Built by `warm_file` when the user opens a file; a selection that falls
+    inside these chunks is answered from the precomputed neighbours instead
+    of embedding it and querying the vector store. The neighbours are those
+    of the enclosing chunk, which is a close stand-in for the selection.
+    """
+
+    def __init__(self, chunks: List[Dict], neighbors: Dict[str, List[Tuple]]):
+        self.chunks = chunks          # [{'id', 'key', 'metadata'}] in file order
+        self.neighbors = neighbors    # chunk id -> [(id, document, metadata, distance)], nearest first
+        self.built_at = time.time()
+
+    def _chunks_for(self, query: str) -> List[Dict]:
+        key = _squash(query)
+        if not key:
+            return []
+        inside = [c for c in self.chunks if key in c['key']]
+        if inside:
+            return inside[:1]
+        # Selections spanning a chunk boundary: chunks wholly inside the selection,
+        # plus the ones holding its first and last lines
+        found = [c for c in self.chunks if c['key'] in key]
+        lines = [_squash(line) for line in query.splitlines()]
+        lines = [line for line in lines if len(line) >= _MIN_LINE_CHARS]
+        for line in lines[:1] + lines[-1:]:
+            found += [c for c in self.chunks if line in c['key'] and c not in found]
+        return found
+
+    def vector_results(self, query: str, n_results: int) -> Optional[Dict]:
+        """Chroma-shaped results for `query` from the neighbour lists, or None if it is not in this file"""
+        own = self._chunks_for(query)
+        if not own:
+            return None
+        own_ids = {c['id'] for c in own}
+        best: Dict[str, Tuple] = {}
+        for chunk in own:
+            for hit in self.neighbors.get(chunk['id'], []):
+                if hit[0] in own_ids:
+                    continue
+                if hit[0] not in best or hit[3] < best[hit[0]][3]:
+                    best[hit[0]] = hit
+        ranked = sorted(best.values(), key=lambda hit: hit[3])[:n_results]
+        return {
+            'ids': [[hit[0] for hit in ranked]],
+            'documents': [[hit[1] for hit in ranked]],
+            'metadatas': [[hit[2] for hit in ranked]],
+            'distances': [[hit[3] for hit in ranked]],
+        }
+
+
+def warm_file(collection, relative_path: str, index=None, n_neighbors: int = PREFETCH_NEIGHBORS,
+              max_chunks: int = PREFETCH_MAX_CHUNKS) -> WarmFile:
+    """Load a file's chunks and their neighbours, reusing the lists the chunk locator stores.
+
+    Lists missing from `index` (a LocatorIndex) are computed from the
+    chunks' stored embeddings in one batched query and stored back. Each
+    chunk's embedding also seeds the query-embedding cache, so selecting a
+    whole chunk that the warm lookup misses still skips the embedder.
+    """
+    fetched = collection.get(where={'relative_path': relative_path},
+                             include=['documents', 'metadatas', 'embeddings'])
+    rows = sorted(
+        zip(fetched['ids'], fetched['documents'], fetched['metadatas'], fetched['embeddings']),
+        key=lambda row: (row[2] or {}).get('chunk_index', 0),
+    )[:max_chunks]
+    chunks = [{'id': i, 'key': _squash(d), 'metadata': m} for i, d, m, _ in rows]
+    known = {i: (d, m) for i, d, m, _ in rows}
+    stored = index.get_neighbors([row[0] for row in rows]) if index is not None and rows else {}
+    missing = [row for row in rows if row[0] not in stored]
+    if missing:
+        # The chunk itself comes back as its own nearest hit
+        results = collection.query(query_embeddings=[list(row[3]) for row in missing], n_results=n_neighbors + 1)
+        computed = {}
+        for row, ids, docs, metas, dists in zip(missing, results['ids'], results['documents'],
+                                                results['metadatas'], results['distances']):
+            computed[row[0]] = [(i, float(d)) for i, d in zip(ids, dists) if i != row[0]]
+            known.update((i, (doc, meta)) for i, doc, meta in zip(ids, docs, metas))
+        if index is not None:
+            try:
+                index.put_neighbors(computed)
+            except Exception as e:
+                logger.warning(f"Could not store neighbours of {relative_path}: {e}")
+        stored.update(computed)
+
+    wanted = list({i for hits in stored.values() for i, _ in hits[:n_neighbors] if i not in known})
+    if wanted:
+        extra = collection.get(ids=wanted)
+        known.update((i, (doc, meta)) for i, doc, meta in zip(extra['ids'], extra['documents'], extra['metadatas']))
+    # Lists can name chunks deleted since they were stored; those are skipped
+    neighbors: Dict[str, List[Tuple]] = {
+        chunk_id: [(i, known[i][0], known[i][1], d) for i, d in hits[:n_neighbors] if i in known]
+        for chunk_id, hits in stored.items()
+    }
+
+    for _, document, _, embedding in rows:
+        if document:
+            query_embedding_cache.put(EMBED_MODEL, document, list(embedding))
+    return WarmFile(chunks, neighbors)
+
+
+class WarmCache:
+    """Per-session warm files with a short TTL and LRU eviction."""
+
+    def __init__(self, ttl: int, max_files: int):
+        self.ttl = ttl
+        self.max_files = max_files
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (expires_at, WarmFile)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(session_id: Optional[str], owner: str, repo: str, sha: str, file: str) -> tuple:
+        return (session_id or "", owner, repo, sha, file)
+
+    def get(self, key: tuple) -> Optional[WarmFile]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, warm: WarmFile):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, warm)
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'files': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+warm_cache = WarmCache(PREFETCH_TTL, PREFETCH_MAX_FILES)
@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Profile every request carrying this header (any non-empty value other than "0")
+PROFILE_HEADER = b"x-aura-profile"
+# Fraction of requests profiled without the header (0 disables)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Only requests at least this slow are written out
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "1000"))
+# Seconds between stack samples
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+# Profiles allowed to run at once; extra requests simply go unprofiled
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.expanduser("~"), ".aura", "profiles"))
+
+_slots = threading.BoundedSemaphore(PROFILE_MAX_CONCURRENT)
+
+
+def _collapse(frame) -> str:
+    """Root-first 'module:function' frames joined with ';' (collapsed stack format)"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        names.append(f"{module}:{code.co_name}".replace(" ", "_"))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """Samples every thread's Python stack at a fixed interval.
+
+    Counts are kept per collapsed stack, prefixed with the thread name, so
+    the output feeds straight into flamegraph.pl or speedscope. The event
+    loop is shared by all requests, so a profile shows everything the
+    process did while the request was in flight, not just that request.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or names.get(ident, "").startswith("profiler"):
+                    continue
+                thread = names.get(ident, str(ident)).replace(";", "_").replace(" ", "_")
+                self.samples[f"{thread};{_collapse(frame)}"] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.samples
+
+
+def write_profile(samples: Counter, route: str, duration: float) -> Optional[Path]:
+    if not samples:
+        return None
+    directory = Path(PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = route.strip("/").replace("/", "_") or "root"
+    path = directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{duration * 1000:.0f}ms.collapsed"
+    with open(path, "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    return path
+
+
+class ProfilingMiddleware:
+    """Profile opted-in requests for their whole lifetime, streamed body included.
+
+    A request is profiled when it sends `X-Aura-Profile: 1` or is picked by
+    PROFILE_SAMPLE_RATE; the stacks are written to PROFILE_DIR only if the
+    request took at least PROFILE_SLOW_MS.
+    """
+
+    def __init__(self, app, routes=()):
+        self.app = app
+        self.routes = set(routes)
+
+    def _wanted(self, scope) -> bool:
+        if self.routes and scope.get("path") not in self.routes:
+            return False
+        for name, value in scope.get("headers", []):
+            if name == PROFILE_HEADER:
+                return value not in (b"", b"0")
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope) or not _slots.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = SamplingProfiler()
+        profiler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            duration = time.perf_counter() - start
+            # Joining the sampler and writing the file stay off the event loop
+            threading.Thread(target=self._finish, args=(profiler, scope.get("path", ""), duration),
+                             name="profiler-writer", daemon=True).start()
+
+    @staticmethod
+    def _finish(profiler: SamplingProfiler, route: str, duration: float):
+        try:
+            samples = profiler.stop()
+        finally:
+            _slots.release()
+        if duration * 1000 < PROFILE_SLOW_MS:
+            return
+        try:
+            path = write_profile(samples, route, duration)
+            if path:
+                logger.info(f"Slow request {route} ({duration * 1000:.0f}ms) profiled to {path}")
+        except Exception as e:
+            logger.warning(f"Could not write profile: {e}")
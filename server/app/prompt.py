@@ -1,3 +1,6 @@
+import os
+import re
+
 SYSTEM_PROMPT = (
     "You are an expert code reviewer.\n"
     "Base ALL claims ONLY on the provided code and context.\n"
@@ -9,28 +12,27 @@ def build_user_prompt(repo:str, file:str, lang:str|None, selected:str, related_s
     import logging
     logger = logging.getLogger(__name__)
     
-    # Build context blocks from related snippets
+    # Build context blocks from related snippets (already packed, most relevant first)
     ctx_blocks = []
     if related_snippets:
         logger.info(f"Building context with {len(related_snippets)} related snippets")
-        for i, snippet in enumerate(related_snippets[:6], start=1):
-            # Handle both document-based and snippet-based formats
-            if 'documents' in snippet and snippet['documents']:
-                code_content = snippet['documents'][0]
-                metadata = snippet.get('metadatas', [{}])[0] if snippet.get('metadatas') else {}
-                file_path = metadata.get('relative_path', 'unknown')
-                similarity_score = snippet.get('similarity_score', 0)
+        for i, snippet in enumerate(related_snippets, start=1):
+            content = snippet['code']
+            location = snippet['file']
+            if snippet.get('start_line') is not None:
+                location += f":{snippet['start_line']}-{snippet['end_line']}"
+            similarity_score = snippet.get('similarity_score')
+            if snippet.get('symbol'):
+                relevance = f"definition of {snippet['symbol']}"
+            elif similarity_score is not None:
+                relevance = f"similarity: {similarity_score:.3f}"
             else:
-                code_content = snippet.get('code', snippet.get('content', ''))
-                file_path = snippet.get('file', snippet.get('relative_path', 'unknown'))
-                similarity_score = snippet.get('similarity_score', 0)
-            
-            content = truncate(code_content, MAX_CONTEXT_CHARS)
-            logger.info(f"Adding context snippet {i}: similarity {similarity_score:.3f}, length {len(content)} chars")
+                relevance = "lexical match"
+            logger.info(f"Adding context snippet {i}: {relevance}, length {len(content)} chars")
             
             ctx_blocks.append(
-                f"<<CONTEXT_SNIPPET {i} {file_path} (similarity: {similarity_score:.3f})>>\n"
-                f"{content}\n"
+                f"<<CONTEXT_SNIPPET {i} {location} ({relevance})>>\n"
+                f"{content.rstrip()}\n"
                 f"<<END_CONTEXT_SNIPPET>>"
             )
     
@@ -66,40 +68,145 @@ Keep the explanation clear and concise, suitable for a code review. Keep your re
 """
 
 MAX_SELECTED_CHARS = 8000    # ~2–3k tokens
-MAX_CONTEXT_CHARS  = 2000    # per snippet
+MAX_CONTEXT_CHARS  = 3000    # per snippet, after merging neighbours
+
+# Token budget for all context snippets together, and how many to retrieve
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "10"))
+# Definition chunks looked up by name for identifiers in the selection
+CONTEXT_DEFINITIONS = int(os.getenv("CONTEXT_DEFINITIONS", "4"))
+CHARS_PER_TOKEN = 4          # rough average for code under BPE tokenizers
+SNIPPET_OVERHEAD_TOKENS = 20 # snippet header/footer lines
+MIN_SNIPPET_CHARS = 200      # don't bother squeezing in smaller tails
+
+TRUNCATION_MARK = "\n…[truncated]"
 
 def truncate(s: str, limit: int) -> str:
-    return s if len(s) <= limit else s[:limit] + "\n…[truncated]"
+    return s if len(s) <= limit else s[:limit] + TRUNCATION_MARK
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _squash(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _normalize_snippet(snippet: dict, rank: int) -> dict:
+    """Flatten a search hit ({'documents', 'metadatas', 'distance'}) or legacy snippet"""
+    if 'documents' in snippet and snippet['documents']:
+        code = snippet['documents'][0]
+        metadata = (snippet.get('metadatas') or [{}])[0] or {}
+        file_path = metadata.get('relative_path', 'unknown')
+    else:
+        code = snippet.get('code', snippet.get('content', ''))
+        metadata = snippet
+        file_path = snippet.get('file', snippet.get('relative_path', 'unknown'))
+    distance = snippet.get('distance')
+    similarity = snippet.get('similarity_score')
+    if similarity is None and distance is not None:
+        # Squared L2 between unit vectors: d = 2 - 2cos
+        similarity = max(0.0, 1.0 - distance / 2)
+    return {
+        'code': code or '',
+        'file': file_path,
+        'start_line': metadata.get('start_line'),
+        'end_line': metadata.get('end_line'),
+        'distance': distance,
+        'similarity_score': similarity,
+        'symbol': snippet.get('symbol'),
+        'rank': rank,
+    }
+
+
+def _has_lines(snippet: dict) -> bool:
+    return snippet['start_line'] is not None and snippet['end_line'] is not None
 
 
-def build_messages(repo, file, lang, selected, related_snips=None):
+def _overlaps(a: dict, b: dict) -> bool:
+    return (a['file'] == b['file'] and _has_lines(a) and _has_lines(b)
+            and a['start_line'] <= b['end_line'] and b['start_line'] <= a['end_line'])
+
+
+def _adjacent(a: dict, b: dict) -> bool:
+    return (a['file'] == b['file'] and _has_lines(a) and _has_lines(b)
+            and (a['end_line'] + 1 == b['start_line'] or b['end_line'] + 1 == a['start_line']))
+
+
+def pack_context(snippets: list, selected: str, file: str = None, budget: int = CONTEXT_TOKEN_BUDGET) -> list:
+    """Choose the context snippets for a prompt within a token budget.
+
+    Definitions of names the selection uses come first. Other hits are
+    ranked by their real vector distance (retrieval order when some have
+    none, e.g. lexical-only matches). The selection's own chunk is
+    dropped, as are exact duplicates and chunks overlapping a better one.
+    Adjacent chunks of the same file are merged. Snippets are then added
+    most relevant first until `budget` tokens are used; the last one may be
+    truncated to fit.
+    """
+    selected_key = _squash(selected)
+    candidates = []
+    seen = set()
+    for rank, raw in enumerate(snippets or []):
+        snippet = _normalize_snippet(raw, rank)
+        body = _squash(snippet['code'])
+        if not body or body in seen:
+            continue
+        # Self-hits: the chunk the selection came from, or one wholly inside the selection
+        if selected_key and (body in selected_key or (selected_key in body and snippet['file'] == file)):
+            continue
+        seen.add(body)
+        candidates.append(snippet)
+
+    definitions = [s for s in candidates if s['symbol']]
+    candidates = [s for s in candidates if not s['symbol']]
+    if candidates and all(s['distance'] is not None for s in candidates):
+        candidates.sort(key=lambda s: s['distance'])
+    candidates = definitions + candidates
+
+    merged = []
+    for snippet in candidates:
+        if any(_overlaps(snippet, kept) for kept in merged):
+            continue
+        neighbour = next((kept for kept in merged if _adjacent(snippet, kept)), None)
+        if neighbour is None:
+            merged.append(snippet)
+            continue
+        # Keep the better-ranked position, join the code in line order
+        first, second = sorted((neighbour, snippet), key=lambda s: s['start_line'])
+        neighbour['code'] = first['code'].rstrip('\n') + '\n' + second['code']
+        neighbour['start_line'], neighbour['end_line'] = first['start_line'], second['end_line']
+
+    packed = []
+    used = 0
+    for snippet in merged:
+        code = truncate(snippet['code'], MAX_CONTEXT_CHARS)
+        remaining = budget - used - SNIPPET_OVERHEAD_TOKENS
+        if estimate_tokens(code) > remaining:
+            if remaining * CHARS_PER_TOKEN < MIN_SNIPPET_CHARS:
+                continue
+            # Leave room for the marker so the snippet still fits
+            code = truncate(code, remaining * CHARS_PER_TOKEN - len(TRUNCATION_MARK))
+        snippet['code'] = code
+        packed.append(snippet)
+        used += estimate_tokens(code) + SNIPPET_OVERHEAD_TOKENS
+    return packed
+
+
+def build_messages(repo, file, lang, selected, related_snips=None, context_budget=CONTEXT_TOKEN_BUDGET):
     import logging
     logger = logging.getLogger(__name__)
     
     selected = truncate(selected, MAX_SELECTED_CHARS)
     logger.info(f"Building messages for {repo}/{file}, selected text: {len(selected)} chars")
     
-    # Process and truncate related snippets
+    # Pick, dedupe and merge related snippets within the context token budget
     processed_snippets = []
     if related_snips:
-        logger.info(f"Processing {len(related_snips)} related snippets")
-        for s in related_snips[:6]:  # Limit to 6 snippets
-            if 'documents' in s and s['documents']:
-                # ChromaDB format
-                truncated_content = truncate(s['documents'][0], MAX_CONTEXT_CHARS)
-                processed_snippets.append({
-                    'documents': [truncated_content],
-                    'metadatas': s.get('metadatas', [{}]),
-                    'similarity_score': s.get('similarity_score', 0)
-                })
-            else:
-                # Legacy format
-                truncated_code = truncate(s.get('code', s.get('content', '')), MAX_CONTEXT_CHARS)
-                processed_snippets.append({
-                    **s, 
-                    "content": truncated_code,
-                    'similarity_score': s.get('similarity_score', 0)
-                })
+        processed_snippets = pack_context(related_snips, selected, file=file, budget=context_budget)
+        logger.info(f"Packed {len(processed_snippets)} of {len(related_snips)} related snippets "
+                    f"into ~{sum(estimate_tokens(s['code']) for s in processed_snippets)} tokens")
     
     user = build_user_prompt(
         repo=f"{repo}",
@@ -0,0 +1,146 @@
+import os
+import time
+import shutil
+import logging
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from app.ingest import get_supported_file_extensions
+
+logger = logging.getLogger(__name__)
+
+GIT_TIMEOUT = 300  # seconds
+
+# Where repositories are cloned from; point at a directory of bare repos
+# (file:///path) to run against a local stand-in for GitHub
+GIT_BASE_URL = os.getenv("AURA_GIT_BASE_URL", "https://github.com").rstrip("/")
+
+# full:     complete history and blobs
+# shallow:  only the tip commit (--depth 1)
+# blobless: tip commit, blobs fetched on checkout (--filter=blob:none)
+# sparse:   blobless, checking out only files ingestion can read
+CLONE_STRATEGIES = ("full", "shallow", "blobless", "sparse")
+DEFAULT_CLONE_STRATEGY = os.getenv("AURA_CLONE_STRATEGY", "shallow")
+
+
+def repos_dir() -> Path:
+    """Directory holding checkouts (~/.aura works both locally and in Docker)"""
+    path = Path.home() / ".aura"
+    path.mkdir(exist_ok=True)
+    return path
+
+
+def checkout_path(owner: str, repo: str) -> Path:
+    return repos_dir() / f"{owner}_{repo}"
+
+
+def git(args: List[str], cwd: Optional[Path] = None, timeout: int = GIT_TIMEOUT) -> str:
+    """Run a git command and return stdout, raising on failure"""
+    if not shutil.which("git"):
+        raise Exception("Git executable not found. Please ensure git is installed and in PATH.")
+    result = subprocess.run(
+        ["git", *args],
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+        cwd=str(cwd) if cwd else None,
+    )
+    if result.returncode != 0:
+        raise Exception(f"git {args[0]} failed: {result.stderr.strip()}")
+    return result.stdout
+
+
+def clone_url(owner: str, repo: str) -> str:
+    return f"{GIT_BASE_URL}/{owner}/{repo}.git"
+
+
+def dir_size(path: Path) -> int:
+    """Total size in bytes of the files under `path`"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def is_checkout(path: Path) -> bool:
+    return (path / ".git").exists()
+
+
+def head_commit(path: Path) -> str:
+    return git(["rev-parse", "HEAD"], cwd=path).strip()
+
+
+def clone(url: str, path: Path, strategy: str = DEFAULT_CLONE_STRATEGY) -> Dict:
+    """Fresh clone into `path`, replacing whatever is there.
+
+    Returns a report with the strategy used, wall time and `bytes`, the
+    on-disk size of the resulting .git/objects (a stand-in for the bytes
+    transferred, which git does not report). See bench/clone_bench.py for
+    a local run of every strategy.
+    """
+    if strategy not in CLONE_STRATEGIES:
+        raise ValueError(f"Unknown clone strategy '{strategy}', expected one of {', '.join(CLONE_STRATEGIES)}")
+    if path.exists():
+        shutil.rmtree(path)
+
+    start = time.time()
+    args = ["clone"]
+    if strategy in ("shallow", "blobless", "sparse"):
+        args += ["--depth", "1"]
+    if strategy in ("blobless", "sparse"):
+        args += ["--filter=blob:none"]
+    if strategy == "sparse":
+        args += ["--no-checkout"]
+    git(args + [url, str(path)], cwd=path.parent)
+
+    if strategy == "sparse":
+        patterns = sorted(f"*{ext}" for ext in get_supported_file_extensions())
+        git(["sparse-checkout", "set", "--no-cone", *patterns], cwd=path)
+        git(["checkout"], cwd=path)
+
+    report = {
+        'strategy': strategy,
+        'seconds': time.time() - start,
+        'bytes': dir_size(path / ".git" / "objects"),
+    }
+    logger.info(f"Cloned {url} ({strategy}) in {report['seconds']:.2f}s, {report['bytes']} bytes")
+    return report
+
+
+def fetch_latest(path: Path) -> Tuple[str, Dict]:
+    """Fetch the remote's default branch into an existing checkout and move to it.
+
+    Returns the new HEAD commit and a transfer report like `clone`'s, with
+    `bytes` the growth of .git/objects.
+    """
+    start = time.time()
+    before = dir_size(path / ".git" / "objects")
+    git(["fetch", "origin", "HEAD"], cwd=path)
+    git(["reset", "--hard", "FETCH_HEAD"], cwd=path)
+    report = {
+        'strategy': 'fetch',
+        'seconds': time.time() - start,
+        'bytes': max(0, dir_size(path / ".git" / "objects") - before),
+    }
+    return head_commit(path), report
+
+
+def changed_files(path: Path, old: str, new: str) -> Tuple[List[str], List[str]]:
+    """Return (added_or_modified, deleted) paths between two commits.
+
+    Renames are reported as a delete plus an add so stale chunks under the
+    old path get dropped.
+    """
+    out = git(["diff", "--name-status", "--no-renames", "-z", old, new], cwd=path)
+    fields = [f for f in out.split("\0") if f]
+    changed, deleted = [], []
+    for status, file_path in zip(fields[0::2], fields[1::2]):
+        if status.startswith("D"):
+            deleted.append(file_path)
+        else:
+            changed.append(file_path)
+    return changed, deleted
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # seconds
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+RESPONSE_CACHE_MAX_MB = float(os.getenv("RESPONSE_CACHE_MAX_MB", "64"))
+RESPONSE_CACHE_MAX_ENTRY_KB = float(os.getenv("RESPONSE_CACHE_MAX_ENTRY_KB", "256"))
+
+
+def cache_key(owner: str, repo: str, sha: str, file: str, selected_text: str, language: Optional[str] = None,
+              index_version: str = "") -> str:
+    """Stable key for an explanation of one selection at one commit.
+
+    `sha` is whatever the client sent, often a branch name, so
+    `index_version` (see ingest.index_version) ties the key to the index
+    the explanation was built from; re-indexing the repo retires its keys.
+    """
+    raw = json.dumps([owner, repo, sha, file, language or "", selected_text, index_version], ensure_ascii=False)
+    return "aura:select:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryResponseCache:
+    """In-process store of finished NDJSON streams with TTL and LRU eviction."""
+
+    backend = "memory"
+
+    def __init__(self, ttl: int, max_entries: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, body)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, key: str):
+        _, body = self._entries.pop(key)
+        self._bytes -= len(body)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, body = entry
+            if expires_at < time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return body
+
+    async def set(self, key: str, body: bytes):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.time() + self.ttl, body)
+            self._bytes += len(body)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+
+    def size(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes}
+
+
+class RedisResponseCache:
+    """Redis-backed store so every server process shares cached explanations.
+
+    TTLs are set per key; size-bounded eviction is left to the Redis
+    server's maxmemory policy.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: str, ttl: int):
+        import redis.asyncio as aioredis
+        self.ttl = ttl
+        self._redis = aioredis.Redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        try:
+            return await self._redis.get(key)
+        except Exception as e:
+            logger.warning(f"Redis response cache get failed: {e}")
+            return None
+
+    async def set(self, key: str, body: bytes):
+        try:
+            await self._redis.set(key, body, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Redis response cache set failed: {e}")
+
+    def size(self) -> Dict:
+        return {}
+
+
+class ResponseCache:
+    """Front for the configured backend that also tracks the hit ratio."""
+
+    def __init__(self, store, max_entry_bytes: int):
+        self.store = store
+        self.max_entry_bytes = max_entry_bytes
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[List[bytes]]:
+        """Return the cached NDJSON lines for `key`, or None on a miss"""
+        body = await self.store.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return body.splitlines(keepends=True)
+
+    async def set(self, key: str, lines: List[bytes]):
+        body = b"".join(lines)
+        if len(body) > self.max_entry_bytes:
+            return
+        await self.store.set(key, body)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.store.backend,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            **self.store.size(),
+        }
+
+
+def _build_cache() -> ResponseCache:
+    redis_url = os.getenv("REDIS_URL", "").strip()
+    store = None
+    if redis_url:
+        try:
+            store = RedisResponseCache(redis_url, RESPONSE_CACHE_TTL)
+            logger.info("Using Redis response cache")
+        except Exception as e:
+            logger.warning(f"Could not set up Redis response cache: {e}, using in-memory cache")
+    if store is None:
+        store = MemoryResponseCache(
+            ttl=RESPONSE_CACHE_TTL,
+            max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+            max_bytes=int(RESPONSE_CACHE_MAX_MB * 1024 * 1024),
+        )
+    return ResponseCache(store, max_entry_bytes=int(RESPONSE_CACHE_MAX_ENTRY_KB * 1024))
+
+
+response_cache = _build_cache()
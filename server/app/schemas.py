@@ -27,7 +27,22 @@ class SelectReq(BaseModel):
     file: str
     selected_text: str
     language: Optional[str] = None
-    context: Optional[Dict[str, Any]] = None
+    context: Optional[Dict[str, Any]] = None  # may carry 1-based 'start_line'/'end_line' of the selection
+    session_id: Optional[str] = None  # picks up this session's /prefetch of the file
+
+class PrefetchReq(BaseModel):
+    owner: str
+    repo: str
+    sha: str
+    file: str
+    session_id: Optional[str] = None
+
+class PrefetchResp(BaseModel):
+    success: bool
+    message: str
+    chunks: int = 0
+    cached: bool = False  # already warm for this session
+    expires_in: Optional[int] = None  # seconds
 
 class SelectResp(BaseModel):
     explanation: str
@@ -37,11 +52,23 @@ class CloneReq(BaseModel):
     owner: str
     repo: str
     url: str
+    mode: str = "auto"  # 'auto', 'full', 'update'
+    strategy: Optional[str] = None  # 'full', 'shallow', 'blobless', 'sparse'; server default if unset
 
 class CloneResp(BaseModel):
     success: bool
     message: str
     local_path: Optional[str] = None
+    mode: Optional[str] = None  # 'full' or 'update'
+    changed_files: Optional[int] = None
+    deleted_files: Optional[int] = None
+    strategy: Optional[str] = None  # clone strategy used, or 'fetch' for an update
+    clone_seconds: Optional[float] = None
+    # Size of .git/objects on disk after the clone (growth after a fetch), not
+    # bytes on the wire: packs are stored as received, but a partial clone
+    # also counts blobs fetched lazily on checkout
+    bytes_transferred: Optional[int] = None
+    job_id: Optional[str] = None
 
 class IngestRepoReq(BaseModel):
     owner: str
@@ -51,9 +78,10 @@ class IngestRepoResp(BaseModel):
     success: bool
     message: str
     collection_name: Optional[str] = None
+    job_id: Optional[str] = None
 
 class IngestStatusResp(BaseModel):
-    status: str  # 'not_started', 'starting', 'in_progress', 'completed', 'failed'
+    status: str  # 'not_started', 'queued', 'starting', 'in_progress', 'completed', 'partial', 'failed'
     stage: Optional[str] = None
     progress_percent: int = 0
     total_files: Optional[int] = None
@@ -63,4 +91,9 @@ class IngestStatusResp(BaseModel):
     current_file: Optional[str] = None
     collection_name: Optional[str] = None
     duration: Optional[float] = None
-    error: Optional[str] = None
\ No newline at end of file
+    error: Optional[str] = None
+    job_id: Optional[str] = None
+    job_state: Optional[str] = None  # 'queued', 'running', 'completed', 'failed'
+    mode: Optional[str] = None
+    resumed_files: Optional[int] = None  # files kept from an interrupted run of the same commit
+    embed_cache_hit_rate: Optional[float] = None
@@ -0,0 +1,129 @@
+import json
+import asyncio
+import logging
+from typing import Awaitable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """One in-progress answer shared by every identical request.
+
+    The producer publishes NDJSON lines; each subscriber gets a replay of the
+    lines published so far and then follows live ones. Every request holds
+    the flight from `SingleFlight.join` until its response is closed; when
+    the last one releases it before the answer is finished, the producer
+    task is cancelled, which closes the upstream model stream.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.lines: List[bytes] = []
+        self.done = False
+        self.error: Optional[str] = None  # set when no answer could be produced at all
+        self.terminated = False  # a final 'done' or 'error' line was published
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._changed = asyncio.Event()
+
+    def mark_ready(self):
+        """Retrieval and prompt are done; the answer is about to stream"""
+        self._ready.set()
+
+    async def wait_ready(self):
+        await self._ready.wait()
+
+    def publish(self, line: bytes, final: bool = False):
+        self.lines.append(line)
+        self.terminated = self.terminated or final
+        self._wake()
+
+    def fail(self, message: str):
+        """End the answer with an error: as the flight error if nothing was streamed yet, else as a final line"""
+        if not self.lines:
+            self.error = message
+        elif not self.terminated:
+            self.publish((json.dumps({"error": message}) + "\n").encode("utf-8"), final=True)
+
+    def hold(self):
+        self.subscribers += 1
+
+    def release(self):
+        """One request is done with the flight; cancel the producer if it was the last"""
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done and self.task is not None:
+            logger.info(f"Last subscriber left {self.key[-12:]}, cancelling upstream stream")
+            self.task.cancel()
+
+    def close(self):
+        self.done = True
+        self._ready.set()
+        self._wake()
+
+    def _wake(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self):
+        """Yield every line of the answer, replaying what was already published"""
+        index = 0
+        while True:
+            while index < len(self.lines):
+                yield self.lines[index]
+                index += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """Registry of in-progress flights keyed by request identity."""
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key: str) -> Tuple[Flight, bool]:
+        """Return the flight for `key` (held for the caller, see Flight.release) and whether the caller leads it"""
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.followers += 1
+            flight.hold()
+            return flight, False
+        flight = self._flights[key] = Flight(key)
+        self.leaders += 1
+        flight.hold()
+        return flight, True
+
+    def start(self, flight: Flight, producer: Awaitable):
+        """Run `producer` (which publishes into `flight`) as a task detached from any one request"""
+        flight.task = asyncio.create_task(self._run(flight, producer))
+
+    async def _run(self, flight: Flight, producer: Awaitable):
+        try:
+            await producer
+        except asyncio.CancelledError:
+            # Anyone still reading (e.g. replaying) gets a terminated answer
+            flight.fail("cancelled")
+            raise
+        except Exception as e:
+            logger.warning(f"Flight {flight.key[-12:]} failed: {e}")
+            flight.fail(str(e))
+        finally:
+            flight.close()
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def stats(self) -> Dict:
+        joined = self.leaders + self.followers
+        return {
+            'in_flight': len(self._flights),
+            'leaders': self.leaders,
+            'followers': self.followers,
+            'coalesced_ratio': self.followers / joined if joined else 0.0,
+        }
+
+
+select_flights = SingleFlight()
@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+def open_db(path: str) -> sqlite3.Connection:
+    """Open an SQLite file shared by this process's threads and by other processes.
+
+    Autocommit mode (transactions are explicit, see `transaction`), WAL so
+    an ingestion worker can write while the server reads, and a 30s busy
+    timeout for writers waiting on each other. Callers guard the
+    connection with their own lock.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection, lock: threading.Lock, immediate: bool = False):
+    """Hold `lock` and run the block in a transaction, rolled back if it raises.
+
+    `immediate` takes the write lock up front, so a read-modify-write
+    cannot be interleaved with another process's.
+    """
+    with lock:
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+class PathCache(Generic[T]):
+    """One `factory(path)` object per path and process, created on first use"""
+
+    def __init__(self, factory: Callable[[str], T]):
+        self._factory = factory
+        self._items: Dict[str, T] = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> T:
+        item = self._items.get(path) if self._pid == os.getpid() else None
+        if item is None:
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Connections must not cross a fork
+                    self._items, self._pid = {}, os.getpid()
+                item = self._items.get(path)
+                if item is None:
+                    item = self._items[path] = self._factory(path)
+        return item
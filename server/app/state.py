@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from app.sqlite_util import open_db, transaction
+
+logger = logging.getLogger(__name__)
+
+# Where ingestion status, job records and repo leases live: 'sqlite' (one
+# file on local disk, shared by every process on the host) or 'redis'
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite").lower()
+STATE_PATH = os.getenv("AURA_STATE_PATH", os.path.join(os.path.expanduser("~"), ".aura", "state.sqlite"))
+# Seconds an ingestion lease lasts without renewal
+LEASE_TTL = float(os.getenv("INGEST_LEASE_TTL", "60"))
+
+ACTIVE_JOB_STATES = ('queued', 'running')
+FINISHED_JOB_STATES = ('completed', 'failed')
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, default=str)
+
+
+class SQLiteStateStore:
+    """State shared by all server and worker processes on one host.
+
+    Status entries and job records are JSON documents updated inside
+    IMMEDIATE transactions, so concurrent merges from different processes
+    do not lose fields.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_db(path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS status (repo_key TEXT PRIMARY KEY, fields TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "  job_id TEXT PRIMARY KEY, state TEXT NOT NULL, finished_at REAL, record TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at);"
+            "CREATE TABLE IF NOT EXISTS leases (repo_key TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL);"
+        )
+
+    def _transaction(self, fn):
+        with transaction(self._conn, self._lock, immediate=True):
+            return fn(self._conn)
+
+    # Ingestion status -----------------------------------------------------
+
+    def get_status(self, repo_key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT fields FROM status WHERE repo_key = ?", (repo_key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_status(self, repo_key: str, fields: Dict, replace: bool = False):
+        def update(conn):
+            status = {}
+            if not replace:
+                row = conn.execute("SELECT fields FROM status WHERE repo_key = ?", (repo_key,)).fetchone()
+                status = json.loads(row[0]) if row else {}
+            status.update(fields)
+            conn.execute("INSERT OR REPLACE INTO status VALUES (?, ?)", (repo_key, _dumps(status)))
+        self._transaction(update)
+
+    # Jobs -----------------------------------------------------------------
+
+    def put_job(self, job: Dict):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?)",
+                               (job['job_id'], job['state'], job.get('finished_at'), _dumps(job)))
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_job(self, job_id: str, fields: Dict, unless_finished: bool = False) -> Optional[Dict]:
+        """Merge `fields` into a job; with `unless_finished`, leave completed/failed jobs alone"""
+        def update(conn):
+            row = conn.execute("SELECT record FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = json.loads(row[0])
+            if unless_finished and job['state'] in FINISHED_JOB_STATES:
+                return job
+            job.update(fields)
+            conn.execute("UPDATE jobs SET state = ?, finished_at = ?, record = ? WHERE job_id = ?",
+                         (job['state'], job.get('finished_at'), _dumps(job), job_id))
+            return job
+        return self._transaction(update)
+
+    def delete_job(self, job_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def active_jobs(self) -> List[Dict]:
+        """Queued and running jobs of every server process"""
+        marks = ",".join("?" * len(ACTIVE_JOB_STATES))
+        with self._lock:
+            rows = self._conn.execute(f"SELECT record FROM jobs WHERE state IN ({marks})",
+                                      ACTIVE_JOB_STATES).fetchall()
+        return [json.loads(record) for (record,) in rows]
+
+    def prune_jobs(self, keep: int):
+        """Drop all but the `keep` most recently finished jobs"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND job_id NOT IN "
+                "(SELECT job_id FROM jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT ?)",
+                (keep,),
+            )
+
+    # Leases ---------------------------------------------------------------
+
+    def acquire_lease(self, repo_key: str, holder: str, ttl: float = LEASE_TTL) -> bool:
+        """Take (or extend) the repo's lease for `holder`; False if someone else holds it"""
+        def acquire(conn):
+            now = time.time()
+            row = conn.execute("SELECT holder, expires_at FROM leases WHERE repo_key = ?", (repo_key,)).fetchone()
+            if row is not None and row[0] != holder and row[1] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (repo_key, holder, now + ttl))
+            return True
+        return self._transaction(acquire)
+
+    def renew_lease(self, repo_key: str, holder: str, ttl: float = LEASE_TTL) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE repo_key = ? AND holder = ?",
+                (time.time() + ttl, repo_key, holder),
+            )
+        return cursor.rowcount > 0
+
+    def release_lease(self, repo_key: str, holder: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE repo_key = ? AND holder = ?", (repo_key, holder))
+
+    def lease_holder(self, repo_key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT holder FROM leases WHERE repo_key = ? AND expires_at > ?", (repo_key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+
+class RedisStateStore:
+    """State shared by server processes on any number of hosts.
+
+    Status entries are hashes of JSON-encoded fields, so partial updates
+    are a plain HSET. Leases are keys set with NX and a TTL, renewed and
+    released only by their holder.
+
+    Only this state moves to Redis. A collection's lexical, locator and
+    symbol indexes and its ingestion checkpoint stay SQLite files under
+    vectordb.AURA_INDEX_DIR, so hosts sharing a Redis must also share that
+    directory (a shared volume, or the vector store's own).
+    """
+
+    backend = "redis"
+
+    _RENEW = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end return 0"
+    _RELEASE = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+
+    def __init__(self, url: str, prefix: str = "aura:"):
+        import redis
+        self._redis_module = redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._redis.ping()
+        self.prefix = prefix
+        self._renew = self._redis.register_script(self._RENEW)
+        self._release = self._redis.register_script(self._RELEASE)
+
+    def _key(self, kind: str, name: str) -> str:
+        return f"{self.prefix}{kind}:{name}"
+
+    def get_status(self, repo_key: str) -> Optional[Dict]:
+        fields = self._redis.hgetall(self._key("status", repo_key))
+        return {k: json.loads(v) for k, v in fields.items()} if fields else None
+
+    def update_status(self, repo_key: str, fields: Dict, replace: bool = False):
+        key = self._key("status", repo_key)
+        pipe = self._redis.pipeline(transaction=True)
+        if replace:
+            pipe.delete(key)
+        if fields:
+            pipe.hset(key, mapping={k: _dumps(v) for k, v in fields.items()})
+        pipe.execute()
+
+    def put_job(self, job: Dict):
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.set(self._key("job", job['job_id']), _dumps(job))
+        if job['state'] in ACTIVE_JOB_STATES:
+            pipe.sadd(self._key("jobs", "active"), job['job_id'])
+        pipe.execute()
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        raw = self._redis.get(self._key("job", job_id))
+        return json.loads(raw) if raw else None
+
+    def update_job(self, job_id: str, fields: Dict, unless_finished: bool = False) -> Optional[Dict]:
+        key = self._key("job", job_id)
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    raw = pipe.get(key)
+                    if raw is None:
+                        return None
+                    job = json.loads(raw)
+                    if unless_finished and job['state'] in FINISHED_JOB_STATES:
+                        return job
+                    job.update(fields)
+                    pipe.multi()
+                    pipe.set(key, _dumps(job))
+                    if job['state'] in FINISHED_JOB_STATES:
+                        pipe.srem(self._key("jobs", "active"), job_id)
+                        pipe.zadd(self._key("jobs", "finished"), {job_id: job.get('finished_at') or time.time()})
+                    pipe.execute()
+                    return job
+                except self._redis_module.WatchError:
+                    continue
+
+    def delete_job(self, job_id: str):
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.delete(self._key("job", job_id))
+        pipe.srem(self._key("jobs", "active"), job_id)
+        pipe.execute()
+
+    def active_jobs(self) -> List[Dict]:
+        job_ids = list(self._redis.smembers(self._key("jobs", "active")))
+        if not job_ids:
+            return []
+        records = self._redis.mget([self._key("job", job_id) for job_id in job_ids])
+        return [job for job in (json.loads(raw) for raw in records if raw) if job['state'] in ACTIVE_JOB_STATES]
+
+    def prune_jobs(self, keep: int):
+        finished = self._key("jobs", "finished")
+        stale = self._redis.zrange(finished, 0, -keep - 1) if keep else self._redis.zrange(finished, 0, -1)
+        if stale:
+            pipe = self._redis.pipeline()
+            pipe.delete(*[self._key("job", job_id) for job_id in stale])
+            pipe.zrem(finished, *stale)
+            pipe.execute()
+
+    def acquire_lease(self, repo_key: str, holder: str, ttl: float = LEASE_TTL) -> bool:
+        key = self._key("lease", repo_key)
+        if self._redis.set(key, holder, nx=True, px=int(ttl * 1000)):
+            return True
+        return bool(self._renew(keys=[key], args=[holder, int(ttl * 1000)]))
+
+    def renew_lease(self, repo_key: str, holder: str, ttl: float = LEASE_TTL) -> bool:
+        return bool(self._renew(keys=[self._key("lease", repo_key)], args=[holder, int(ttl * 1000)]))
+
+    def release_lease(self, repo_key: str, holder: str):
+        self._release(keys=[self._key("lease", repo_key)], args=[holder])
+
+    def lease_holder(self, repo_key: str) -> Optional[str]:
+        return self._redis.get(self._key("lease", repo_key))
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_state_store():
+    """Process-wide state store for the configured backend (one connection per process)"""
+    global _store, _store_pid
+    if _store is None or _store_pid != os.getpid():
+        with _store_lock:
+            if _store is None or _store_pid != os.getpid():
+                store = None
+                if STATE_BACKEND == 'redis':
+                    redis_url = os.getenv("REDIS_URL", "").strip()
+                    try:
+                        store = RedisStateStore(redis_url)
+                        logger.info("Using Redis state store")
+                    except Exception as e:
+                        logger.warning(f"Could not set up Redis state store: {e}, using SQLite at {STATE_PATH}")
+                if store is None:
+                    store = SQLiteStateStore(STATE_PATH)
+                _store, _store_pid = store, os.getpid()
+    return _store
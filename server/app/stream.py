@@ -1,21 +1,60 @@
+import asyncio
 from app import cerebras_client as cb
 
-async def stream_model(messages, temperature=0.2, max_tokens=700):
+# How often to poll the client connection while waiting on the model
+DISCONNECT_POLL_INTERVAL = 0.25
+
+async def _close_on_disconnect(upstream, is_disconnected, state):
+    """Close the upstream completion as soon as the client goes away."""
+    while True:
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+        if await is_disconnected():
+            state['disconnected'] = True
+            await upstream.close()
+            return
+
+async def stream_model(messages, temperature=0.2, max_tokens=700, is_disconnected=None, state=None):
     """
-    Stream model responses using Cerebras client.
+    Stream model responses using the async Cerebras client.
     Yield UTF-8 encoded bytes as they arrive.
+
+    If `is_disconnected` (e.g. `request.is_disconnected`) is given, the
+    upstream completion is cancelled as soon as it reports True, even while
+    we are still waiting on the next token.
+
+    `state`, if given, is filled with 'error' and 'disconnected' so callers
+    can tell a complete answer from a partial or failed one.
     """
+    upstream = None
+    watcher = None
+    if state is None:
+        state = {}
+    state.update({'error': None, 'disconnected': False})
     try:
-        # Use the existing stream_summary function from cerebras_client
-        stream = cb.stream_summary(messages, max_tokens=max_tokens, temperature=temperature)
-        
-        # Process the streaming response
-        for chunk in stream:
+        upstream = await cb.astream_summary(messages, max_tokens=max_tokens, temperature=temperature)
+        if is_disconnected is not None:
+            watcher = asyncio.create_task(_close_on_disconnect(upstream, is_disconnected, state))
+
+        # Process the streaming response without blocking the event loop
+        async for chunk in upstream:
+            if not chunk.choices:
+                continue
             piece = chunk.choices[0].delta.content or ""
             if piece:
                 yield piece.encode("utf-8")
-                
+
     except Exception as e:
+        if state['disconnected']:
+            # Upstream was closed under us because the client left
+            return
+        state['error'] = str(e)
         # Yield error as text
         error_msg = f"Error streaming response: {str(e)}"
         yield error_msg.encode("utf-8")
+
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        if upstream is not None:
+            # Runs on normal completion, errors and generator close (client gone)
+            await upstream.close()
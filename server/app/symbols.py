@@ -0,0 +1,312 @@
+import os
+import re
+import ast
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.sqlite_util import open_db, transaction, PathCache
+
+logger = logging.getLogger(__name__)
+
+# Identifiers from a selection looked up per /select
+MAX_LOOKUP_NAMES = int(os.getenv("SYMBOL_MAX_LOOKUP_NAMES", "12"))
+# Names defined in more places than this are too generic (e.g. `get`, `__init__`)
+# unless one of the definitions is in the selection's own file or its imports
+MAX_DEFINITIONS_PER_NAME = int(os.getenv("SYMBOL_MAX_DEFINITIONS_PER_NAME", "3"))
+
+PYTHON_EXTENSIONS = {'.py'}
+JS_EXTENSIONS = {'.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs'}
+GO_EXTENSIONS = {'.go'}
+JAVA_EXTENSIONS = {'.java'}
+
+# (name, kind, line); references carry the module they come from for imports
+Definition = Tuple[str, str, int]
+Reference = Tuple[str, str, Optional[str], int]
+
+_KEYWORDS = {
+    'if', 'else', 'elif', 'for', 'while', 'do', 'switch', 'case', 'catch', 'try', 'return', 'function',
+    'new', 'typeof', 'instanceof', 'await', 'yield', 'async', 'def', 'class', 'import', 'from', 'export',
+    'const', 'let', 'var', 'func', 'go', 'defer', 'select', 'range', 'type', 'interface', 'struct', 'map',
+    'make', 'len', 'super', 'this', 'self', 'None', 'True', 'False', 'null', 'true', 'false', 'nil',
+    'print', 'public', 'private', 'protected', 'static', 'final', 'void', 'int', 'str', 'list', 'dict',
+    'set', 'tuple', 'not', 'and', 'or', 'in', 'is', 'with', 'as', 'lambda', 'assert', 'raise', 'throw',
+    'sizeof', 'package', 'extends', 'implements', 'synchronized', 'string', 'bool', 'float', 'range',
+}
+
+_IDENTIFIER = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*")
+_CALL = re.compile(r"\b([A-Za-z_$][A-Za-z0-9_$]*)\s*\(")
+
+_JS_DEFINITIONS = [
+    (re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)", re.M), 'function'),
+    (re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)", re.M), 'class'),
+    (re.compile(r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=]+)?=\s*"
+                r"(?:async\s+)?(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|[A-Za-z_$][\w$]*\s*=>)", re.M), 'function'),
+    (re.compile(r"^\s*(?:export\s+)?(?:interface|type|enum)\s+([A-Za-z_$][\w$]*)", re.M), 'type'),
+    (re.compile(r"^[ \t]+(?:(?:public|private|protected|static|async|readonly|override)\s+)*"
+                r"([A-Za-z_$][\w$]*)\s*\([^)]*\)\s*(?::[^{]+)?\{", re.M), 'method'),
+]
+_JS_IMPORTS = [
+    re.compile(r"^\s*import\s+(?P<names>[^'\"]+?)\s+from\s+['\"](?P<module>[^'\"]+)['\"]", re.M),
+    re.compile(r"(?:const|let|var)\s+(?P<names>\{[^}]*\}|[A-Za-z_$][\w$]*)\s*=\s*require\(\s*['\"](?P<module>[^'\"]+)['\"]"),
+]
+_GO_DEFINITIONS = [
+    (re.compile(r"^func\s+(?:\([^)]*\)\s*)?([A-Za-z_]\w*)", re.M), 'function'),
+    (re.compile(r"^\s*type\s+([A-Za-z_]\w*)\s+\S", re.M), 'type'),
+]
+_GO_IMPORT = re.compile(r"^\s*(?:import\s+)?(?:([A-Za-z_]\w*)\s+)?\"([^\"]+)\"", re.M)
+_JAVA_DEFINITIONS = [
+    (re.compile(r"\b(?:class|interface|enum|record)\s+([A-Za-z_]\w*)"), 'class'),
+    (re.compile(r"^\s*(?:(?:public|private|protected|static|final|abstract|synchronized|native|default)\s+)*"
+                r"(?:<[^>]+>\s+)?[\w<>\[\],.? ]+\s+([A-Za-z_]\w*)\s*\([^;]*$", re.M), 'method'),
+]
+_JAVA_IMPORT = re.compile(r"^\s*import\s+(?:static\s+)?([\w.]+)(?:\.\*)?\s*;", re.M)
+
+
+def _line_of(text: str, offset: int) -> int:
+    return text.count("\n", 0, offset) + 1
+
+
+def _python_symbols(text: str) -> Tuple[List[Definition], List[Reference]]:
+    tree = ast.parse(text)
+    definitions: List[Definition] = []
+    references: List[Reference] = []
+
+    def visit(node, in_class: bool):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                definitions.append((child.name, 'method' if in_class else 'function', child.lineno))
+                visit(child, False)
+            elif isinstance(child, ast.ClassDef):
+                definitions.append((child.name, 'class', child.lineno))
+                visit(child, True)
+            else:
+                if isinstance(child, ast.Assign) and node is tree:
+                    for target in child.targets:
+                        if isinstance(target, ast.Name):
+                            definitions.append((target.id, 'variable', child.lineno))
+                elif isinstance(child, ast.Import):
+                    for alias in child.names:
+                        references.append(((alias.asname or alias.name).split('.')[0], 'import', alias.name,
+                                           child.lineno))
+                elif isinstance(child, ast.ImportFrom):
+                    module = '.' * child.level + (child.module or '')
+                    for alias in child.names:
+                        references.append((alias.asname or alias.name, 'import', module, child.lineno))
+                elif isinstance(child, ast.Call):
+                    func = child.func
+                    name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+                    if name:
+                        references.append((name, 'call', None, child.lineno))
+                visit(child, in_class)
+
+    visit(tree, False)
+    return definitions, references
+
+
+def _regex_symbols(text: str, patterns, imports) -> Tuple[List[Definition], List[Reference]]:
+    definitions: List[Definition] = []
+    for pattern, kind in patterns:
+        for match in pattern.finditer(text):
+            name = match.group(1)
+            if name not in _KEYWORDS:
+                definitions.append((name, kind, _line_of(text, match.start(1))))
+    references: List[Reference] = list(imports)
+    for match in _CALL.finditer(text):
+        name = match.group(1)
+        if name not in _KEYWORDS:
+            references.append((name, 'call', None, _line_of(text, match.start(1))))
+    return sorted(set(definitions), key=lambda d: d[2]), references
+
+
+def _js_imports(text: str) -> List[Reference]:
+    imports = []
+    for pattern in _JS_IMPORTS:
+        for match in pattern.finditer(text):
+            line = _line_of(text, match.start())
+            for name in _IDENTIFIER.findall(re.sub(r"\b\w+\s+as\s+", "", match.group('names'))):
+                if name not in ('type', 'as'):
+                    imports.append((name, 'import', match.group('module'), line))
+    return imports
+
+
+def _go_imports(text: str) -> List[Reference]:
+    imports = []
+    block = re.search(r"^import\s*\((.*?)^\)", text, re.M | re.S)
+    spans = [(block.start(1), block.group(1))] if block else []
+    spans += [(m.start(), m.group(0)) for m in re.finditer(r"^import\s+[^(\n]+$", text, re.M)]
+    for offset, body in spans:
+        for match in _GO_IMPORT.finditer(body):
+            module = match.group(2)
+            imports.append((match.group(1) or module.rsplit('/', 1)[-1], 'import', module,
+                            _line_of(text, offset + match.start())))
+    return imports
+
+
+def _java_imports(text: str) -> List[Reference]:
+    return [(m.group(1).rsplit('.', 1)[-1], 'import', m.group(1), _line_of(text, m.start()))
+            for m in _JAVA_IMPORT.finditer(text)]
+
+
+def extract_symbols(text: str, path: str) -> Tuple[List[Definition], List[Reference]]:
+    """Definitions and import/call references of one source file.
+
+    Python goes through `ast`; JS/TS, Go and Java use line-anchored
+    regexes. Other files (and Python that does not parse) yield nothing.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext in PYTHON_EXTENSIONS:
+            return _python_symbols(text)
+        if ext in JS_EXTENSIONS:
+            return _regex_symbols(text, _JS_DEFINITIONS, _js_imports(text))
+        if ext in GO_EXTENSIONS:
+            return _regex_symbols(text, _GO_DEFINITIONS, _go_imports(text))
+        if ext in JAVA_EXTENSIONS:
+            return _regex_symbols(text, _JAVA_DEFINITIONS, _java_imports(text))
+    except (SyntaxError, ValueError, RecursionError) as e:
+        logger.debug(f"No symbols for {path}: {e}")
+    return [], []
+
+
+def selection_names(text: str, limit: int = MAX_LOOKUP_NAMES) -> List[str]:
+    """Names worth resolving in a selection: called names, then capitalised ones (types, constants).
+
+    Other lowercase identifiers are mostly locals and parameters.
+    """
+    called = [m.group(1) for m in _CALL.finditer(text)]
+    capitalised = [name for name in _IDENTIFIER.findall(text) if name[0].isupper()]
+    names = []
+    for name in called + capitalised:
+        if len(name) > 1 and name not in _KEYWORDS and not name.startswith('__') and name not in names:
+            names.append(name)
+    return names[:limit]
+
+
+def _module_matches(module: Optional[str], relative_path: str) -> bool:
+    """Whether an import like `app.vectordb` or `./store/cache` could resolve to `relative_path`"""
+    if not module:
+        return False
+    module = module.lstrip('.').replace('.', '/') if '/' not in module else module.lstrip('./')
+    stem = os.path.splitext(relative_path)[0]
+    return bool(module) and (stem == module or stem.endswith('/' + module) or stem.endswith(module + '/index')
+                             or stem.endswith(module + '/__init__'))
+
+
+class SymbolIndex:
+    """Symbol table of a collection: where names are defined and what each file imports and calls.
+
+    Rows point at the chunk holding the definition or reference, so
+    /select can fetch definition chunks by ID. Like the lexical index it is
+    stored in SQLite next to the collection and replaced per file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_db(path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS defs ("
+            "  name TEXT NOT NULL, kind TEXT NOT NULL, relative_path TEXT NOT NULL, chunk_id TEXT, line INTEGER);"
+            "CREATE INDEX IF NOT EXISTS defs_name ON defs (name);"
+            "CREATE INDEX IF NOT EXISTS defs_path ON defs (relative_path);"
+            "CREATE TABLE IF NOT EXISTS refs ("
+            "  name TEXT NOT NULL, kind TEXT NOT NULL, module TEXT, relative_path TEXT NOT NULL,"
+            "  chunk_id TEXT, line INTEGER);"
+            "CREATE INDEX IF NOT EXISTS refs_name ON refs (name);"
+            "CREATE INDEX IF NOT EXISTS refs_path ON refs (relative_path);"
+        )
+
+    def add_file(self, relative_path: str, definitions: List[Definition], references: List[Reference],
+                 chunk_for_line):
+        """Replace a file's symbols; `chunk_for_line(line)` names the chunk holding a line"""
+        self.add_files([(relative_path, definitions, references, chunk_for_line)])
+
+    def add_files(self, files: Iterable[Tuple]):
+        """`add_file` for several (relative_path, definitions, references, chunk_for_line) in one transaction"""
+        with transaction(self._conn, self._lock):
+            for relative_path, definitions, references, chunk_for_line in files:
+                self._delete("relative_path = ?", (relative_path,))
+                self._conn.executemany(
+                    "INSERT INTO defs VALUES (?, ?, ?, ?, ?)",
+                    [(name, kind, relative_path, chunk_for_line(line), line)
+                     for name, kind, line in definitions],
+                )
+                self._conn.executemany(
+                    "INSERT INTO refs VALUES (?, ?, ?, ?, ?, ?)",
+                    [(name, kind, module, relative_path, chunk_for_line(line), line)
+                     for name, kind, module, line in references],
+                )
+
+    def _delete(self, where: str, params: Iterable):
+        self._conn.execute(f"DELETE FROM defs WHERE {where}", params)
+        self._conn.execute(f"DELETE FROM refs WHERE {where}", params)
+
+    def delete_paths(self, relative_paths: Iterable[str]):
+        with transaction(self._conn, self._lock):
+            for relative_path in relative_paths:
+                self._delete("relative_path = ?", (relative_path,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM defs")
+            self._conn.execute("DELETE FROM refs")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM defs").fetchone()[0]
+
+    def references(self, name: str, kind: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Where `name` is imported or called"""
+        query = "SELECT name, kind, module, relative_path, chunk_id, line FROM refs WHERE name = ?"
+        params = [name]
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        with self._lock:
+            rows = self._conn.execute(query + " LIMIT ?", params + [limit]).fetchall()
+        return [dict(zip(('name', 'kind', 'module', 'relative_path', 'chunk_id', 'line'), row)) for row in rows]
+
+    def definitions(self, names: List[str], relative_path: Optional[str] = None, limit: int = 4) -> List[Dict]:
+        """Definition sites for `names`, in the order the names are given.
+
+        A name defined in several places resolves to the definition in
+        `relative_path` itself or in a module that file imports the name
+        from; otherwise it is kept only if it has at most
+        MAX_DEFINITIONS_PER_NAME definitions.
+        """
+        if not names:
+            return []
+        marks = ",".join("?" * len(names))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT name, kind, relative_path, chunk_id, line FROM defs WHERE name IN ({marks})", names
+            ).fetchall()
+            imports = {}
+            if relative_path:
+                imports = dict(self._conn.execute(
+                    f"SELECT name, module FROM refs WHERE relative_path = ? AND kind = 'import' AND name IN ({marks})",
+                    [relative_path] + names,
+                ).fetchall())
+
+        by_name: Dict[str, List[Dict]] = {}
+        for row in rows:
+            by_name.setdefault(row[0], []).append(
+                dict(zip(('name', 'kind', 'relative_path', 'chunk_id', 'line'), row)))
+
+        found = []
+        for name in names:
+            sites = by_name.get(name, [])
+            preferred = [s for s in sites if s['relative_path'] == relative_path
+                         or _module_matches(imports.get(name), s['relative_path'])]
+            if preferred:
+                sites = preferred
+            elif len(sites) > MAX_DEFINITIONS_PER_NAME:
+                continue
+            found.extend(s for s in sites if s['chunk_id'])
+            if len(found) >= limit:
+                break
+        return found[:limit]
+
+
+get_index = PathCache(SymbolIndex).get
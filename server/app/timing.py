@@ -0,0 +1,74 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+_current: ContextVar[Optional["RequestTiming"]] = ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    """Per-request stage durations, rendered as a Server-Timing header or a dict.
+
+    Stages are kept in the order they first ran; a stage that runs more than
+    once accumulates.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.descriptions: Dict[str, str] = {}
+
+    def add(self, name: str, seconds: float, description: Optional[str] = None):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if description:
+            self.descriptions[name] = description
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def header(self, total: bool = True) -> str:
+        """Server-Timing header value, durations in milliseconds"""
+        parts = []
+        for name, seconds in self.stages.items():
+            desc = self.descriptions.get(name)
+            desc = f';desc="{desc}"' if desc else ""
+            parts.append(f"{name}{desc};dur={seconds * 1000:.1f}")
+        if total:
+            parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def as_dict(self) -> Dict[str, float]:
+        """Stage durations in milliseconds, plus the total so far"""
+        timings = {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+        timings['total'] = round(self.elapsed() * 1000, 1)
+        return timings
+
+
+def start() -> RequestTiming:
+    """Begin timing the current request; later `stage` calls in this context record into it"""
+    timing = RequestTiming()
+    _current.set(timing)
+    return timing
+
+
+def current() -> Optional[RequestTiming]:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str, histogram=None):
+    """Time a block into the current request's timing and, optionally, a metrics histogram.
+
+    Works from threadpool code too: run_in_threadpool copies the context, and
+    the RequestTiming object itself is shared.
+    """
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - begin
+        timing = _current.get()
+        if timing is not None:
+            timing.add(name, seconds)
+        if histogram is not None:
+            histogram.observe(seconds, stage=name)
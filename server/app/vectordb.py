@@ -1,86 +1,440 @@
 import os
+import time
+import threading
 import chromadb
+import ollama
 import logging
+from pathlib import Path
+from app.embeddings import embed_query
+from app import metrics
+from app import timing
+from app import lexical
+from app import prefetch
+from app import locator
+from app import symbols
+from app import checkpoint
+
+logger = logging.getLogger(__name__)
+
+# Which vector store backs collections: 'chroma' or the embedded 'numpy' store
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'chroma').lower()
+# Where the embedded store (and other per-collection indexes) keep their files
+AURA_INDEX_DIR = os.getenv('AURA_INDEX_DIR', os.path.join(os.path.expanduser('~'), '.aura', 'index'))
+
+# How often the background thread re-checks the Chroma HTTP server
+CHROMA_HEALTH_INTERVAL = float(os.getenv('CHROMA_HEALTH_INTERVAL', '15'))
+
+# Process-wide client state, guarded by _lock
+_lock = threading.Lock()
+_http_client = None
+_persistent_client = None
+_chroma_healthy = None  # None until the first health check has run
+_last_health_check = 0.0
+_health_thread = None
+_collections = {}
+_ollama_client = None
+_numpy_store = None
+
 
 def collection_name(repo: str, pr_number: int, commit: str) -> str:
     """Generate a collection name for ChromaDB based on repo, PR, and commit."""
     return f"{repo}_{pr_number}_{commit}".replace("/", "_").replace("-", "_")
 
-def get_or_create_collection(name: str):
-    """Get or create a ChromaDB collection."""
-    client = None
-    try:
-        # Try HTTP client first
-        chroma_host = os.getenv('CHROMA_HOST', 'localhost:8000')
-        host, port = chroma_host.split(':')
-        client = chromadb.HttpClient(host=host, port=int(port))
-        client.heartbeat()
-        logging.info(f"Connected to ChromaDB at {host}:{port}")
-    except Exception as http_error:
-        logging.warning(f"HTTP client failed: {http_error}, trying persistent client")
-        try:
-            # Fallback to persistent client
-            client = chromadb.PersistentClient(path="./chroma")
-            logging.info("Connected to ChromaDB via persistent client")
-        except Exception as persistent_error:
-            logging.error(f"Both HTTP and persistent clients failed. HTTP: {http_error}, Persistent: {persistent_error}")
-            raise Exception(f"Could not connect to ChromaDB. HTTP error: {http_error}, Persistent error: {persistent_error}")
-    
+
+def repo_collection_name(owner: str, repo: str) -> str:
+    """The collection a repository is ingested into and /select searches."""
+    return collection_name(f"{owner}/{repo}", 1, "main")
+
+
+def _check_chroma_health() -> bool:
+    """Heartbeat the Chroma HTTP server and record the result."""
+    global _http_client, _chroma_healthy, _last_health_check
+    healthy = False
     try:
-        # Try to get existing collection
-        collection = client.get_collection(name=name)
-        logging.info(f"Retrieved existing collection: {name}")
+        if _http_client is None:
+            chroma_host = os.getenv('CHROMA_HOST', 'localhost:8000')
+            host, port = chroma_host.split(':')
+            _http_client = chromadb.HttpClient(host=host, port=int(port))
+        _http_client.heartbeat()
+        healthy = True
+    except Exception as e:
+        if _chroma_healthy is not False:
+            logger.warning(f"ChromaDB HTTP server unavailable: {e}, using persistent client")
+        _http_client = None
+
+    with _lock:
+        if healthy != _chroma_healthy:
+            if healthy:
+                logger.info("Connected to ChromaDB HTTP server")
+            # Collection handles are bound to the client that produced them
+            _collections.clear()
+        _chroma_healthy = healthy
+        _last_health_check = time.time()
+    return healthy
+
+
+def _health_loop():
+    while True:
+        time.sleep(CHROMA_HEALTH_INTERVAL)
+        _check_chroma_health()
+
+
+def start_health_monitor():
+    """Start the background Chroma health refresher (idempotent)."""
+    global _health_thread
+    with _lock:
+        if _health_thread is not None:
+            return
+        _health_thread = threading.Thread(target=_health_loop, name="chroma-health", daemon=True)
+        _health_thread.start()
+
+
+def get_chroma_client():
+    """Return the shared Chroma client: HTTP when healthy, else the persistent fallback."""
+    global _persistent_client
+    if _chroma_healthy is None:
+        _check_chroma_health()
+        start_health_monitor()
+
+    if _chroma_healthy and _http_client is not None:
+        return _http_client
+
+    with _lock:
+        if _persistent_client is None:
+            try:
+                _persistent_client = chromadb.PersistentClient(path="./chroma")
+                logger.info("Connected to ChromaDB via persistent client")
+            except Exception as e:
+                logger.error(f"Both HTTP and persistent clients failed: {e}")
+                raise Exception(f"Could not connect to ChromaDB: {e}")
+        return _persistent_client
+
+
+def index_dir(name: str) -> Path:
+    """Directory holding on-disk indexes for a collection."""
+    return Path(AURA_INDEX_DIR) / name
+
+
+def get_store():
+    """Return the client for the configured vector backend.
+
+    Both backends expose the same collection API (get/create/delete
+    collection; upsert, delete, get, query, count, modify on collections).
+    """
+    global _numpy_store
+    if VECTOR_BACKEND != 'numpy':
+        return get_chroma_client()
+    if _numpy_store is None:
+        from app.vectorstore import NumpyStore
+        with _lock:
+            if _numpy_store is None:
+                _numpy_store = NumpyStore(Path(AURA_INDEX_DIR))
+                logger.info(f"Using embedded vector store at {AURA_INDEX_DIR}")
+    return _numpy_store
+
+
+def get_ollama_client():
+    """Return the shared Ollama client (keeps its HTTP connection pool alive)."""
+    global _ollama_client
+    if _ollama_client is None:
+        with _lock:
+            if _ollama_client is None:
+                ollama_host = os.getenv('OLLAMA_HOST', 'localhost:11434')
+                _ollama_client = ollama.Client(host=f'http://{ollama_host}')
+    return _ollama_client
+
+
+def get_chroma_health() -> dict:
+    """Return the cached Chroma health state."""
+    return {
+        'backend': VECTOR_BACKEND,
+        'http_healthy': bool(_chroma_healthy),
+        'last_check': _last_health_check,
+        'cached_collections': len(_collections),
+    }
+
+
+def invalidate_collection(name: str = None):
+    """Drop a cached collection handle (or all of them)."""
+    with _lock:
+        if name is None:
+            _collections.clear()
+        else:
+            _collections.pop(name, None)
+
+
+def get_collection(name: str):
+    """Get an existing collection, reusing a cached handle."""
+    collection = _collections.get(name)
+    if collection is not None:
+        return collection
+    collection = get_store().get_collection(name=name)
+    with _lock:
+        _collections[name] = collection
+    return collection
+
+
+def get_or_create_collection(name: str):
+    """Get or create a collection in the configured backend."""
+    collection = _collections.get(name)
+    if collection is not None:
         return collection
+
+    client = get_store()
+    try:
+        collection = client.get_or_create_collection(name=name)
     except Exception as e:
-        logging.info(f"Collection {name} not found, creating new one: {e}")
-        try:
-            # Create new collection if it doesn't exist
-            collection = client.create_collection(name=name)
-            logging.info(f"Created new collection: {name}")
-            return collection
-        except Exception as create_error:
-            logging.error(f"Failed to create collection {name}: {create_error}")
-            raise
-
-def search_similar_code(collection_name: str, query: str, n_results: int = 5):
-    """Search for similar code snippets in the collection."""
-    client = None
+        logger.error(f"Failed to get or create collection {name}: {e}")
+        raise
+    with _lock:
+        _collections[name] = collection
+    return collection
+
+
+def lexical_index(name: str) -> lexical.LexicalIndex:
+    """The BM25 index stored next to a collection."""
+    return lexical.get_index(str(index_dir(name) / "lexical.sqlite"))
+
+
+def locator_index(name: str) -> locator.LocatorIndex:
+    """The chunk locator stored next to a collection."""
+    return locator.get_index(str(index_dir(name) / "locator.sqlite"))
+
+
+def symbol_index(name: str) -> symbols.SymbolIndex:
+    """The symbol table stored next to a collection."""
+    return symbols.get_index(str(index_dir(name) / "symbols.sqlite"))
+
+
+def ingest_checkpoint(name: str) -> checkpoint.IngestCheckpoint:
+    """Progress of an unfinished ingestion into a collection."""
+    return checkpoint.get_checkpoint(str(index_dir(name) / "checkpoint.sqlite"))
+
+
+# Reciprocal rank fusion constant; larger values flatten the rank curve
+RRF_K = int(os.getenv('RRF_K', '60'))
+# Neighbours stored per located chunk
+LOCATOR_NEIGHBORS = int(os.getenv('LOCATOR_NEIGHBORS', '20'))
+
+
+def _lexical_results(collection, hits) -> dict:
+    """Chroma-shaped results for lexical hits, fetched by ID (no embedding needed)."""
+    ids = [chunk_id for chunk_id, _ in hits]
+    fetched = collection.get(ids=ids) if ids else {'ids': [], 'documents': [], 'metadatas': []}
+    by_id = {i: (d, m) for i, d, m in zip(fetched['ids'], fetched['documents'], fetched['metadatas'])}
+    ids = [i for i in ids if i in by_id]
+    return {
+        'ids': [ids],
+        'documents': [[by_id[i][0] for i in ids]],
+        'metadatas': [[by_id[i][1] for i in ids]],
+        'distances': [[None for _ in ids]],
+    }
+
+
+def _fuse(collection, vector_results, hits, n_results: int) -> dict:
+    """Merge vector and lexical rankings with reciprocal rank fusion.
+
+    Vector hits keep their distances; chunks found only lexically are
+    fetched by ID and have a distance of None.
+    """
+    scores = {}
+    for rank, chunk_id in enumerate(vector_results['ids'][0]):
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+    for rank, (chunk_id, _) in enumerate(hits):
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:n_results]
+
+    known = {
+        chunk_id: (doc, meta, dist)
+        for chunk_id, doc, meta, dist in zip(vector_results['ids'][0], vector_results['documents'][0],
+                                             vector_results['metadatas'][0], vector_results['distances'][0])
+    }
+    missing = [(i, 0.0) for i in ranked if i not in known]
+    if missing:
+        extra = _lexical_results(collection, missing)
+        for chunk_id, doc, meta in zip(extra['ids'][0], extra['documents'][0], extra['metadatas'][0]):
+            known[chunk_id] = (doc, meta, None)
+    ranked = [i for i in ranked if i in known]
+    return {
+        'ids': [ranked],
+        'documents': [[known[i][0] for i in ranked]],
+        'metadatas': [[known[i][1] for i in ranked]],
+        'distances': [[known[i][2] for i in ranked]],
+        'scores': [[scores[i] for i in ranked]],
+    }
+
+
+def _locate_chunks(collection, index: locator.LocatorIndex, query: str, relative_path: str = None,
+                   line_range=None) -> list:
+    """IDs of the indexed chunks a selection was taken from, or [] if it is not indexed text"""
+    if relative_path and line_range:
+        # The chunk holding the whole range, else the chunks it spans
+        own = (index.file_chunks(relative_path, *line_range, covering=True)[:1]
+               or index.file_chunks(relative_path, *line_range))
+        if own:
+            return own
+    key = locator.squash(query)
+    if not key:
+        return []
+    file_chunks = index.file_chunks(relative_path) if relative_path else []
+    if file_chunks:
+        # Only the selection's own file is searched; a short selection has no lines to look up
+        shared = index.chunks_with_lines(query, relative_path)
+        candidates = shared or file_chunks
+    else:
+        shared = candidates = index.chunks_with_lines(query)
+    if not candidates:
+        return []
+    fetched = collection.get(ids=candidates)
+    documents = dict(zip(fetched['ids'], fetched['documents']))
+    inside = [i for i in candidates if key in locator.squash(documents.get(i))]
+    if inside:
+        return inside[:1]
+    # A selection across a chunk boundary: the chunks sharing its lines
+    return shared[:3]
+
+
+def _located_results(collection, collection_name: str, query: str, n_results: int,
+                     relative_path: str = None, line_range=None):
+    """Chroma-shaped results from the stored neighbours of the chunks holding `query`.
+
+    Neighbours are computed from the chunks' stored embeddings the first
+    time a chunk is located, not at ingestion: most chunks are never
+    selected, and lists built mid-ingestion would miss the chunks written
+    after them. The locator keeps them until the files they depend on are
+    rewritten. Returns None when the selection is not found.
+    """
+    index = locator_index(collection_name)
+    own = _locate_chunks(collection, index, query, relative_path, line_range)
+    if not own:
+        return None
+    neighbors = index.get_neighbors(own)
+    missing = [i for i in own if i not in neighbors]
+    if missing:
+        fetched = collection.get(ids=missing, include=['embeddings'])
+        found = collection.query(query_embeddings=[list(e) for e in fetched['embeddings']],
+                                 n_results=LOCATOR_NEIGHBORS + 1)
+        computed = {
+            chunk_id: [(i, float(d)) for i, d in zip(ids, distances) if i != chunk_id]
+            for chunk_id, ids, distances in zip(fetched['ids'], found['ids'], found['distances'])
+        }
+        index.put_neighbors(computed)
+        neighbors.update(computed)
+
+    best = {}
+    for chunk_id in own:
+        for i, distance in neighbors.get(chunk_id, []):
+            if i not in own and (i not in best or distance < best[i]):
+                best[i] = distance
+    ranked = sorted(best, key=best.get)[:n_results]
+    fetched = collection.get(ids=ranked) if ranked else {'ids': [], 'documents': [], 'metadatas': []}
+    by_id = {i: (d, m) for i, d, m in zip(fetched['ids'], fetched['documents'], fetched['metadatas'])}
+    ranked = [i for i in ranked if i in by_id]
+    return {
+        'ids': [ranked],
+        'documents': [[by_id[i][0] for i in ranked]],
+        'metadatas': [[by_id[i][1] for i in ranked]],
+        'distances': [[best[i] for i in ranked]],
+    }
+
+
+def search_similar_code(collection_name: str, query: str, n_results: int = 5, warm=None,
+                        relative_path: str = None, line_range=None):
+    """Search for code related to `query` with BM25 and vector retrieval.
+
+    A selection that is a single identifier is answered from the lexical
+    index alone when it has matches, skipping the query embedding; anything
+    else fuses both rankings. The vector ranking skips the embedder too when
+    the selection is indexed text: from a prefetched `warm` file (see
+    prefetch), else from the stored neighbours of the chunk the locator
+    finds it in (by `relative_path` and `line_range`, or by its lines).
+    Results are Chroma-shaped (nested per query).
+    """
     try:
-        # Try HTTP client first
-        chroma_host = os.getenv('CHROMA_HOST', 'localhost:8000')
-        host, port = chroma_host.split(':')
-        client = chromadb.HttpClient(host=host, port=int(port))
-        client.heartbeat()
-        logging.info(f"Connected to ChromaDB at {host}:{port}")
-    except Exception as http_error:
-        logging.warning(f"HTTP client failed: {http_error}, trying persistent client")
+        collection = get_collection(collection_name)
+
+        hits = []
         try:
-            # Fallback to persistent client
-            client = chromadb.PersistentClient(path="./chroma")
-            logging.info("Connected to ChromaDB via persistent client")
-        except Exception as persistent_error:
-            logging.error(f"Both HTTP and persistent clients failed. HTTP: {http_error}, Persistent: {persistent_error}")
-            raise Exception(f"Could not connect to ChromaDB. HTTP error: {http_error}, Persistent error: {persistent_error}")
-    
-    try:
-        collection = client.get_collection(name=collection_name)
-        
-        # Use Ollama for embedding the query
-        import ollama
-        ollama_host = os.getenv('OLLAMA_HOST', 'localhost:11434')
-        ollama_client = ollama.Client(host=f'http://{ollama_host}')
-        
-        # Generate embedding for the query
-        response = ollama_client.embed(model="mxbai-embed-large", input=query)
-        query_embedding = response["embeddings"]
-        
-        # Search for similar documents
-        results = collection.query(
-            query_embeddings=query_embedding,
-            n_results=n_results
-        )
-        
+            with timing.stage('lexical_query', metrics.select_stage):
+                hits = lexical_index(collection_name).search(query, n_results * 2)
+        except Exception as e:
+            logger.warning(f"Lexical search failed for {collection_name}: {e}")
+
+        if hits and lexical.is_identifier(query):
+            metrics.select_retrieval.inc(mode='lexical')
+            with timing.stage('context_fetch', metrics.select_stage):
+                return _lexical_results(collection, hits[:n_results])
+
+        wanted = n_results * 2 if hits else n_results
+        results = None
+        if warm is not None:
+            with timing.stage('warm_lookup', metrics.select_stage):
+                results = warm.vector_results(query, wanted)
+        mode = 'warm' if results is not None else 'vector'
+
+        if results is None:
+            try:
+                with timing.stage('locate', metrics.select_stage):
+                    results = _located_results(collection, collection_name, query, wanted,
+                                               relative_path, line_range)
+                if results is not None:
+                    mode = 'located'
+            except Exception as e:
+                logger.warning(f"Chunk locator failed for {collection_name}: {e}")
+
+        if results is None:
+            # Generate embedding for the query (repeat selections hit the LRU)
+            with timing.stage('query_embed', metrics.select_stage):
+                query_embedding = embed_query(get_ollama_client(), query)
+
+            # Search for similar documents
+            with timing.stage('vector_query', metrics.select_stage):
+                results = collection.query(query_embeddings=[query_embedding], n_results=wanted)
+
+        if hits:
+            metrics.select_retrieval.inc(mode='hybrid' if mode == 'vector' else f'{mode}_hybrid')
+            with timing.stage('context_fetch', metrics.select_stage):
+                return _fuse(collection, results, hits, n_results)
+
+        metrics.select_retrieval.inc(mode=mode)
         return results
     except Exception as e:
-        print(f"Error searching collection {collection_name}: {e}")
+        # The handle may be stale (collection re-created, server restarted)
+        invalidate_collection(collection_name)
+        logger.exception(f"Error searching collection {collection_name}: {e}")
+        return None
+
+
+def warm_file(collection_name: str, relative_path: str):
+    """Load a file's chunk neighbours for later selections in it (see prefetch.WarmFile)"""
+    return prefetch.warm_file(get_collection(collection_name), relative_path, locator_index(collection_name))
+
+
+def find_definitions(collection_name: str, query: str, relative_path: str = None, limit: int = 4):
+    """Chunks defining the names a selection calls or references, by symbol table lookup.
+
+    Chroma-shaped like search results, plus the resolved name of each hit
+    under 'symbols'. Returns None if the collection cannot be read.
+    """
+    try:
+        with timing.stage('symbol_lookup', metrics.select_stage):
+            sites = symbol_index(collection_name).definitions(
+                symbols.selection_names(query), relative_path=relative_path, limit=limit)
+            ids = list(dict.fromkeys(site['chunk_id'] for site in sites))
+            if not ids:
+                return {'ids': [[]], 'documents': [[]], 'metadatas': [[]], 'symbols': [[]]}
+            fetched = get_collection(collection_name).get(ids=ids)
+        by_id = {i: (d, m) for i, d, m in zip(fetched['ids'], fetched['documents'], fetched['metadatas'])}
+        names = {}
+        for site in sites:
+            names.setdefault(site['chunk_id'], site['name'])
+        ids = [i for i in ids if i in by_id]
+        return {
+            'ids': [ids],
+            'documents': [[by_id[i][0] for i in ids]],
+            'metadatas': [[by_id[i][1] for i in ids]],
+            'symbols': [[names[i] for i in ids]],
+        }
+    except Exception as e:
+        logger.warning(f"Symbol lookup failed for {collection_name}: {e}")
         return None
@@ -0,0 +1,410 @@
+import os
+import json
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: only one process may write a collection
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Row storage precision for the embedded store ('float32' or 'float16')
+NUMPY_STORE_DTYPE = os.getenv("NUMPY_STORE_DTYPE", "float32")
+# Rows multiplied per block when scoring float16 matrices
+_SCORE_BLOCK = 65536
+
+
+def _matches(metadata: Dict, where: Optional[Dict]) -> bool:
+    """Chroma-style equality filter: {'key': value} or {'$and': [...]}"""
+    if not where:
+        return True
+    for key, expected in where.items():
+        if key == '$and':
+            if not all(_matches(metadata, clause) for clause in expected):
+                return False
+        elif isinstance(expected, dict) and '$in' in expected:
+            if metadata.get(key) not in expected['$in']:
+                return False
+        elif metadata.get(key) != expected:
+            return False
+    return True
+
+
+class NumpyCollection:
+    """A collection kept as a memory-mapped matrix plus a metadata journal.
+
+    Files under the collection directory:
+      header.json    dimension, dtype, row capacity and collection metadata
+      vectors.bin    `capacity x dim` row-major matrix, memory-mapped
+      journal.jsonl  append-only log of row puts and deletes (ids, documents,
+                     metadatas); replayed on load and compacted when stale
+      write.lock     held (flock) by whichever process is writing
+
+    Exposes the subset of Chroma's Collection API the server uses (upsert,
+    add, delete, get, query, count, modify, metadata) so it can be swapped
+    in without touching callers. Distances are squared L2, like Chroma's
+    default space. Writes from another process (ingestion workers) are
+    picked up on the next read by checking the journal size. Every write,
+    and compaction, happens under the cross-process write lock on the
+    latest state, so readers never rewrite the journal under a writer.
+    """
+
+    def __init__(self, name: str, path: Path, dtype: str = NUMPY_STORE_DTYPE, create: bool = False):
+        self.name = name
+        self.path = path
+        self._lock = threading.RLock()
+        if create:
+            path.mkdir(parents=True, exist_ok=True)
+            self._write_header({'dim': None, 'dtype': dtype, 'capacity': 0, 'metadata': None})
+            (path / "journal.jsonl").touch()
+        elif not (path / "header.json").exists():
+            raise ValueError(f"Collection {name} does not exist.")
+        self._load()
+
+    # -- persistence -------------------------------------------------------
+
+    def _write_header(self, header: Dict):
+        tmp = self.path / "header.json.tmp"
+        tmp.write_text(json.dumps(header))
+        os.replace(tmp, self.path / "header.json")
+        self._header_mtime = (self.path / "header.json").stat().st_mtime_ns
+
+    def _header(self) -> Dict:
+        return {'dim': self._dim, 'dtype': self._dtype.name, 'capacity': self._capacity, 'metadata': self._metadata}
+
+    def _map(self):
+        self._vectors = None
+        if self._dim and self._capacity:
+            self._vectors = np.memmap(self.path / "vectors.bin", dtype=self._dtype, mode='r+',
+                                      shape=(self._capacity, self._dim))
+
+    def _load(self):
+        self._header_mtime = (self.path / "header.json").stat().st_mtime_ns
+        header = json.loads((self.path / "header.json").read_text())
+        self._dim = header['dim']
+        self._dtype = np.dtype(header['dtype'])
+        self._capacity = header['capacity']
+        self.metadata = header.get('metadata')
+        self._map()
+
+        self._ids: List[Optional[str]] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._journal_entries = 0
+        journal = self.path / "journal.jsonl"
+        with open(journal, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn write at the tail
+                entry = json.loads(line)
+                self._journal_entries += 1
+                if entry['op'] == 'put':
+                    self._set_row(entry['row'], entry['id'], entry['document'], entry['metadata'])
+                elif entry['op'] == 'del':
+                    self._clear_row(entry['id'])
+            self._journal_pos = f.tell()
+            self._journal_ino = os.fstat(f.fileno()).st_ino
+
+        self._free = [row for row, row_id in enumerate(self._ids) if row_id is None]
+        self._norms = np.zeros(self._capacity, dtype=np.float32)
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        if self._vectors is not None and self._ids:
+            used = len(self._ids)
+            self._norms[:used] = self._row_norms(0, used)
+            self._alive[:used] = [row_id is not None for row_id in self._ids]
+
+    @contextmanager
+    def _writing(self):
+        """Hold the write lock with the latest state loaded; compact the journal on the way out if stale"""
+        with self._lock:
+            try:
+                lock_file = open(self.path / "write.lock", 'a')
+            except FileNotFoundError:
+                raise ValueError(f"Collection {self.name} does not exist.")
+            with lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._refresh()
+                yield
+                if self._journal_entries > 2 * len(self._id_to_row) + 1000:
+                    self._compact()
+
+    def _compact(self):
+        """Rewrite the journal with only the live rows (under the write lock)"""
+        tmp = self.path / "journal.jsonl.tmp"
+        with open(tmp, 'w') as f:
+            for row_id, row in self._id_to_row.items():
+                f.write(json.dumps({'op': 'put', 'row': row, 'id': row_id,
+                                    'document': self._documents[row], 'metadata': self._metadatas[row]}) + "\n")
+        os.replace(tmp, self.path / "journal.jsonl")
+        stat = (self.path / "journal.jsonl").stat()
+        self._journal_pos, self._journal_ino = stat.st_size, stat.st_ino
+        self._journal_entries = len(self._id_to_row)
+
+    def _append(self, entries: List[Dict]):
+        with open(self.path / "journal.jsonl", 'a') as f:
+            f.write(''.join(json.dumps(entry) + "\n" for entry in entries))
+            f.flush()
+            self._journal_pos = f.tell()
+        self._journal_entries += len(entries)
+
+    def _refresh(self):
+        """Reload if another process has written to (or compacted) the collection"""
+        try:
+            journal = (self.path / "journal.jsonl").stat()
+            header_mtime = (self.path / "header.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            raise ValueError(f"Collection {self.name} does not exist.")
+        if (journal.st_size != self._journal_pos or journal.st_ino != self._journal_ino
+                or header_mtime != self._header_mtime):
+            self._load()
+
+    # -- row bookkeeping ---------------------------------------------------
+
+    def _set_row(self, row: int, row_id: str, document, metadata):
+        while len(self._ids) <= row:
+            self._ids.append(None)
+            self._documents.append(None)
+            self._metadatas.append(None)
+        old = self._ids[row]
+        if old is not None and old != row_id:
+            self._id_to_row.pop(old, None)
+        self._ids[row] = row_id
+        self._documents[row] = document
+        self._metadatas[row] = metadata
+        self._id_to_row[row_id] = row
+
+    def _clear_row(self, row_id: str) -> Optional[int]:
+        row = self._id_to_row.pop(row_id, None)
+        if row is not None:
+            self._ids[row] = None
+            self._documents[row] = None
+            self._metadatas[row] = None
+        return row
+
+    def _row_norms(self, start: int, end: int) -> np.ndarray:
+        block = np.asarray(self._vectors[start:end], dtype=np.float32)
+        return np.einsum('ij,ij->i', block, block)
+
+    def _grow(self, needed: int):
+        capacity = max(1024, self._capacity)
+        while capacity < needed:
+            capacity *= 2
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self.path / "vectors.bin", 'ab') as f:
+            f.truncate(capacity * self._dim * self._dtype.itemsize)
+        self._norms = np.concatenate([self._norms, np.zeros(capacity - self._capacity, dtype=np.float32)])
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - self._capacity, dtype=bool)])
+        self._capacity = capacity
+        self._write_header(self._header())
+        self._map()
+
+    # -- Chroma-compatible API ---------------------------------------------
+
+    @property
+    def metadata(self) -> Optional[Dict]:
+        with self._lock:
+            self._refresh()
+            return self._metadata
+
+    @metadata.setter
+    def metadata(self, value: Optional[Dict]):
+        self._metadata = value
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._id_to_row)
+
+    def modify(self, name: Optional[str] = None, metadata: Optional[Dict] = None):
+        with self._writing():
+            if metadata is not None:
+                self.metadata = metadata
+                self._write_header(self._header())
+
+    def upsert(self, ids: List[str], embeddings, documents: Optional[List[str]] = None,
+               metadatas: Optional[List[Dict]] = None):
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        with self._writing():
+            if self._dim is None:
+                self._dim = int(matrix.shape[1])
+                self._write_header(self._header())
+            elif matrix.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match collection dimension {self._dim}")
+
+            rows = []
+            for row_id in ids:
+                row = self._id_to_row.get(row_id)
+                if row is None:
+                    row = self._free.pop() if self._free else len(self._ids)
+                    if row >= len(self._ids):
+                        self._ids.append(None)
+                        self._documents.append(None)
+                        self._metadatas.append(None)
+                rows.append(row)
+            if max(rows) >= self._capacity:
+                self._grow(max(rows) + 1)
+
+            # Vectors first, journal second: a crash in between leaves the old
+            # journal pointing at rows it never claimed
+            index = np.asarray(rows)
+            self._vectors[index] = matrix.astype(self._dtype)
+            self._vectors.flush()
+            stored = np.asarray(self._vectors[index], dtype=np.float32)
+            self._norms[index] = np.einsum('ij,ij->i', stored, stored)
+            self._alive[index] = True
+
+            entries = []
+            for i, (row, row_id) in enumerate(zip(rows, ids)):
+                document = documents[i] if documents else None
+                metadata = metadatas[i] if metadatas else None
+                self._set_row(row, row_id, document, metadata)
+                entries.append({'op': 'put', 'row': row, 'id': row_id, 'document': document, 'metadata': metadata})
+            self._append(entries)
+
+    add = upsert
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        with self._writing():
+            targets = set(ids or [])
+            if where:
+                targets.update(
+                    row_id for row_id, row in self._id_to_row.items()
+                    if _matches(self._metadatas[row] or {}, where)
+                )
+            entries = []
+            for row_id in targets:
+                row = self._clear_row(row_id)
+                if row is not None:
+                    self._alive[row] = False
+                    self._free.append(row)
+                    entries.append({'op': 'del', 'id': row_id})
+            if entries:
+                self._append(entries)
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None, include=None) -> Dict:
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                rows = [self._id_to_row[i] for i in ids if i in self._id_to_row]
+            else:
+                rows = sorted(self._id_to_row.values())
+            rows = [r for r in rows if _matches(self._metadatas[r] or {}, where)]
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+            result = {
+                'ids': [self._ids[r] for r in rows],
+                'documents': [self._documents[r] for r in rows],
+                'metadatas': [self._metadatas[r] for r in rows],
+            }
+            if include and 'embeddings' in include:
+                result['embeddings'] = [np.asarray(self._vectors[r], dtype=np.float32).tolist() for r in rows]
+            return result
+
+    def _scores(self, queries: np.ndarray, used: int) -> np.ndarray:
+        """Inner products of every stored row with every query, as float32"""
+        if self._dtype == np.float32:
+            return np.asarray(self._vectors[:used]) @ queries.T
+        out = np.empty((used, queries.shape[0]), dtype=np.float32)
+        for start in range(0, used, _SCORE_BLOCK):
+            end = min(start + _SCORE_BLOCK, used)
+            out[start:end] = np.asarray(self._vectors[start:end], dtype=np.float32) @ queries.T
+        return out
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None, include=None) -> Dict:
+        """Exact top-k by squared L2 distance, in Chroma's nested result shape"""
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        with self._lock:
+            self._refresh()
+            used = len(self._ids)
+            result = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+            if self._vectors is None or not self._id_to_row:
+                for key in result:
+                    result[key] = [[] for _ in queries]
+                return result
+
+            mask = self._alive[:used].copy()
+            if where:
+                mask &= np.array([row_id is not None and _matches(self._metadatas[r] or {}, where)
+                                  for r, row_id in enumerate(self._ids)], dtype=bool)
+            # ||x - q||^2 = ||x||^2 + ||q||^2 - 2 x.q
+            distances = (self._norms[:used, None] + np.einsum('ij,ij->i', queries, queries)[None, :]
+                         - 2 * self._scores(queries, used))
+            distances[~mask] = np.inf
+
+            k = min(n_results, int(mask.sum()))
+            for j in range(queries.shape[0]):
+                column = distances[:, j]
+                top = np.argpartition(column, k - 1)[:k] if k else np.array([], dtype=int)
+                top = top[np.argsort(column[top])]
+                result['ids'].append([self._ids[r] for r in top])
+                result['documents'].append([self._documents[r] for r in top])
+                result['metadatas'].append([self._metadatas[r] for r in top])
+                result['distances'].append([float(max(column[r], 0.0)) for r in top])
+            return result
+
+
+class NumpyStore:
+    """Embedded vector store: one NumpyCollection directory per collection.
+
+    Mirrors the Chroma client methods the server uses so vectordb can hand
+    out either backend.
+    """
+
+    def __init__(self, root: Path, dtype: str = NUMPY_STORE_DTYPE):
+        self.root = root
+        self.dtype = dtype
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+        root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, name: str) -> Path:
+        return self.root / name / "vectors"
+
+    def heartbeat(self) -> int:
+        return 1
+
+    def get_collection(self, name: str) -> NumpyCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None or not (collection.path / "header.json").exists():
+                collection = NumpyCollection(name, self._path(name), self.dtype)
+                self._collections[name] = collection
+            return collection
+
+    def create_collection(self, name: str, metadata: Optional[Dict] = None) -> NumpyCollection:
+        with self._lock:
+            if (self._path(name) / "header.json").exists():
+                raise ValueError(f"Collection {name} already exists.")
+            collection = NumpyCollection(name, self._path(name), self.dtype, create=True)
+            if metadata:
+                collection.modify(metadata=metadata)
+            self._collections[name] = collection
+            return collection
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict] = None) -> NumpyCollection:
+        try:
+            return self.get_collection(name)
+        except ValueError:
+            return self.create_collection(name, metadata)
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+            path = self._path(name)
+            if not path.exists():
+                raise ValueError(f"Collection {name} does not exist.")
+            shutil.rmtree(path)
@@ -0,0 +1 @@
+"""Benchmarks for the ingestion pipeline and the /select path (run from server/)."""
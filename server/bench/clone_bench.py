@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Clone strategy benchmark and check.
+
+Builds a synthetic repository with some history, publishes it as a local
+bare repo and points AURA_GIT_BASE_URL at it, so `repos.clone` runs
+against a stand-in for GitHub without the network. Every strategy
+(full, shallow, blobless, sparse) clones it; then a commit that modifies,
+adds, deletes and renames files is pushed, and each checkout is updated
+with `repos.fetch_latest` and diffed with `repos.changed_files`. Reports
+wall time and object store size per strategy, and fails if a checkout
+does not land on the pushed commit or reports the wrong files.
+
+    cd server
+    python -m bench.clone_bench --files 500 --history 5 --out results/clone.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+from pathlib import Path
+
+from bench.synthetic import DEFAULT_MIX, generate_repo, parse_mix
+from bench.ingest_bench import _git_commit
+
+OWNER, REPO = 'bench', 'clone'
+AUTHOR = ['-c', 'user.name=Aura Bench', '-c', 'user.email=bench@example.com']
+
+
+def _publish(workdir: Path, args) -> Path:
+    """Create the source repo (with `args.history` commits) and its bare copy under workdir/remote"""
+    from app import repos
+    source = workdir / 'source'
+    generate_repo(str(source), files=args.files, avg_chars=args.avg_chars, mix=parse_mix(args.mix), seed=args.seed)
+    repos.git(['init', '-q', '-b', 'main'], cwd=source)
+    files = sorted(p for p in source.rglob('*') if p.is_file() and '.git' not in p.parts)
+    for i in range(args.history):
+        # Earlier commits only change a slice of files, so full clones carry real history
+        if i:
+            for path in files[i::max(args.history, 2)]:
+                if path.suffix in ('.py', '.ts', '.js', '.go', '.java', '.md'):
+                    path.write_text(path.read_text() + f"\n// revision {i}\n")
+        repos.git(['add', '-A'], cwd=source)
+        repos.git([*AUTHOR, 'commit', '-q', '-m', f'revision {i}'], cwd=source)
+
+    bare = workdir / 'remote' / OWNER / f'{REPO}.git'
+    bare.parent.mkdir(parents=True)
+    repos.git(['clone', '-q', '--bare', str(source), str(bare)])
+    # Partial clones need the server side to accept object filters
+    repos.git(['config', 'uploadpack.allowFilter', 'true'], cwd=bare)
+    repos.git(['remote', 'add', 'bench', str(bare)], cwd=source)
+    return source
+
+
+def _push_update(source: Path) -> dict:
+    """Push a commit touching every kind of change; return what changed_files should report"""
+    from app import repos
+    files = sorted(p.relative_to(source).as_posix() for p in source.rglob('*.py') if '.git' not in p.parts)
+    modified, deleted, renamed = files[0], files[1], files[2]
+    added = 'pkg_new/added_module.py'
+
+    path = source / modified
+    path.write_text(path.read_text() + "\n# pushed by clone_bench\n")
+    (source / 'pkg_new').mkdir(exist_ok=True)
+    (source / added).write_text("def added():\n    return 'added by clone_bench'\n")
+    repos.git(['rm', '-q', deleted], cwd=source)
+    renamed_to = renamed.replace('.py', '_moved.py')
+    repos.git(['mv', renamed, renamed_to], cwd=source)
+    repos.git(['add', '-A'], cwd=source)
+    repos.git([*AUTHOR, 'commit', '-q', '-m', 'pushed update'], cwd=source)
+    repos.git(['push', '-q', 'bench', 'HEAD:main'], cwd=source)
+    return {
+        'commit': repos.head_commit(source),
+        # Renames come back as a delete plus an add
+        'changed': sorted([modified, added, renamed_to]),
+        'deleted': sorted([deleted, renamed]),
+    }
+
+
+def run(args, workdir: Path) -> dict:
+    from app import repos
+    t0 = time.time()
+    source = _publish(workdir, args)
+    print(f"Published {args.files} files with {args.history} commits in {time.time() - t0:.1f}s")
+    url = repos.clone_url(OWNER, REPO)
+
+    checkouts = workdir / 'checkouts'
+    checkouts.mkdir()
+    strategies = {}
+    for strategy in args.strategies:
+        path = checkouts / strategy
+        report = repos.clone(url, path, strategy=strategy)
+        strategies[strategy] = {
+            'clone_seconds': report['seconds'],
+            'object_bytes': report['bytes'],
+            'checkout_files': sum(1 for p in path.rglob('*') if p.is_file() and '.git' not in p.parts),
+            'head': repos.head_commit(path),
+        }
+
+    expected = _push_update(source)
+    failures = []
+    for strategy, result in strategies.items():
+        path = checkouts / strategy
+        old = result['head']
+        new, report = repos.fetch_latest(path)
+        changed, deleted = repos.changed_files(path, old, new)
+        result.update({
+            'fetch_seconds': report['seconds'],
+            'fetch_object_bytes': report['bytes'],
+            'changed_files': len(changed),
+            'deleted_files': len(deleted),
+        })
+        if new != expected['commit']:
+            failures.append(f"{strategy}: fetched {new[:12]}, pushed {expected['commit'][:12]}")
+        if sorted(changed) != expected['changed'] or sorted(deleted) != expected['deleted']:
+            failures.append(f"{strategy}: changed {sorted(changed)} deleted {sorted(deleted)}, "
+                            f"expected {expected['changed']} / {expected['deleted']}")
+        if strategy == 'sparse' and any((path / 'assets').glob('*.png')):
+            failures.append("sparse: checked out files ingestion cannot read")
+    return {'strategies': strategies, 'failures': failures}
+
+
+def print_results(strategies: dict):
+    print(f"{'strategy':<10} {'clone s':>8} {'objects':>12} {'files':>6} {'fetch s':>8} {'fetched':>10} {'changed':>8} {'deleted':>8}")
+    for strategy, r in strategies.items():
+        print(f"{strategy:<10} {r['clone_seconds']:>8.2f} {r['object_bytes']:>12,} {r['checkout_files']:>6} "
+              f"{r['fetch_seconds']:>8.2f} {r['fetch_object_bytes']:>10,} {r['changed_files']:>8} {r['deleted_files']:>8}")
+    print("(objects/fetched: size of .git/objects on disk after the clone, and its growth from the fetch)")
+
+
+def main(argv=None):
+    workdir = Path(tempfile.mkdtemp(prefix='aura-clone-bench-'))
+    # app.repos reads this when first imported
+    os.environ['AURA_GIT_BASE_URL'] = f"file://{workdir / 'remote'}"
+    from app import repos
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=300, help='number of synthetic files')
+    parser.add_argument('--avg-chars', type=int, default=4000, help='average file size in characters')
+    parser.add_argument('--mix', default=','.join(f"{k[1:]}:{v}" for k, v in DEFAULT_MIX.items()),
+                        help='language mix, e.g. py:0.5,ts:0.3,md:0.2')
+    parser.add_argument('--history', type=int, default=5, help='commits before the cloned tip')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--strategies', nargs='+', choices=repos.CLONE_STRATEGIES, default=list(repos.CLONE_STRATEGIES))
+    parser.add_argument('--out', help='write JSON results to this file')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary work directory')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    keep = False
+    try:
+        args = parser.parse_args(argv)
+        keep = args.keep
+        logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                            format='%(asctime)s - %(levelname)s - %(message)s')
+        if repos.GIT_BASE_URL != os.environ['AURA_GIT_BASE_URL']:
+            raise SystemExit("app.repos was imported before the benchmark could point it at the local remote")
+        outcome = run(args, workdir)
+    finally:
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(outcome['strategies'])
+    for failure in outcome['failures']:
+        print(f"FAIL {failure}")
+
+    results = {
+        'benchmark': 'clone',
+        'commit': _git_commit(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('out', 'keep', 'verbose')},
+        **outcome,
+    }
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {args.out}")
+    return not outcome['failures']
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,43 @@
+import time
+import hashlib
+import threading
+
+import numpy as np
+
+
+class FakeEmbedder:
+    """Deterministic stand-in for the Ollama client's `embed` call.
+
+    Each text maps to a unit vector seeded from its sha1, so identical text
+    always gets the same embedding and runs are reproducible. `latency` is
+    slept once per request and `per_item_latency` once per input, which
+    roughly models a local embedding server's fixed and per-token costs.
+    """
+
+    def __init__(self, dim: int = 1024, latency: float = 0.0, per_item_latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.calls = 0
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def vector(self, text: str) -> list:
+        seed = int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'little')
+        v = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        v /= np.linalg.norm(v)
+        return v.tolist()
+
+    def embed(self, model: str, input):
+        texts = [input] if isinstance(input, str) else list(input)
+        with self._lock:
+            self.calls += 1
+            self.items += len(texts)
+        delay = self.latency + self.per_item_latency * len(texts)
+        if delay:
+            time.sleep(delay)
+        return {'model': model, 'embeddings': [self.vector(text) for text in texts]}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'calls': self.calls, 'items': self.items}
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Ingestion throughput benchmark.
+
+Generates a synthetic repository, runs `ingest_repo` against it with a
+deterministic fake embedder in place of Ollama, and reports per-stage
+timings (walk, load, chunk, embed, write), files/s, chunks/s and peak
+memory. Results are written as JSON so runs can be compared across commits:
+
+    cd server
+    python -m bench.ingest_bench --files 2000 --out results/ingest.json
+    python -m bench.ingest_bench --files 2000 --baseline results/ingest.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+
+from bench.fake_embedder import FakeEmbedder
+from bench.synthetic import DEFAULT_MIX, generate_repo, parse_mix
+
+# Metrics compared against a baseline: name -> True if higher is better
+COMPARED = {
+    'files_per_second': True,
+    'chunks_per_second': True,
+    'duration': False,
+    'peak_rss_mb': False,
+    'time_to_first_chunk': False,
+}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def _configure(args, workdir: Path, embedder: FakeEmbedder):
+    """Point the app at the fake embedder and a throwaway vector store"""
+    from app import chunkpool, embeddings, state, vectordb
+
+    state.STATE_PATH = str(workdir / 'state.sqlite')
+    vectordb._ollama_client = embedder
+    vectordb.VECTOR_BACKEND = args.backend
+    vectordb.AURA_INDEX_DIR = str(workdir / 'index')
+    if args.backend == 'chroma':
+        import chromadb
+        vectordb._chroma_healthy = False  # skip the HTTP server probe
+        vectordb._persistent_client = chromadb.PersistentClient(path=str(workdir / 'chroma'))
+
+    embeddings.EMBED_CACHE_PATH = str(workdir / 'embeddings.sqlite')
+    embeddings.EMBED_CACHE_MB = args.embed_cache_mb
+    if args.batch_size:
+        embeddings.EMBED_BATCH_SIZE = args.batch_size
+    if args.concurrency:
+        embeddings.EMBED_CONCURRENCY = args.concurrency
+    if args.chunk_workers:
+        chunkpool.CHUNK_WORKERS = args.chunk_workers
+
+
+def run_once(repo_path: str, embedder: FakeEmbedder, run: int) -> dict:
+    from app import ingest
+
+    calls_before = embedder.stats()
+    result = ingest.ingest_repo(repo_path=repo_path, owner='bench', repo='synthetic', commit=f'run{run}')
+    if not result['success']:
+        raise Exception(f"Ingestion failed: {result.get('error')}")
+    calls = embedder.stats()
+    duration = result['duration']
+    embedding = result['embedding'] or {}
+    return {
+        'run': run,
+        'duration': duration,
+        'files': result['total_documents'],
+        'chunks': result['total_chunks'],
+        'written_chunks': result['successful_chunks'],
+        'files_per_second': result['total_documents'] / duration if duration else 0.0,
+        'chunks_per_second': result['successful_chunks'] / duration if duration else 0.0,
+        'time_to_first_chunk': result['time_to_first_chunk'],
+        'peak_rss_mb': result['peak_rss_mb'],
+        'stage_seconds': result['stage_seconds'],
+        'embed_cache_hit_rate': embedding.get('cache_hit_rate', 0.0),
+        'embedder_calls': calls['calls'] - calls_before['calls'],
+        'embedder_items': calls['items'] - calls_before['items'],
+    }
+
+
+def summarize(runs: list) -> dict:
+    summary = {key: statistics.median(r[key] for r in runs) for key in COMPARED}
+    stages = sorted({name for r in runs for name in r['stage_seconds']})
+    summary['stage_seconds'] = {
+        name: statistics.median(r['stage_seconds'].get(name, 0.0) for r in runs) for name in stages
+    }
+    return summary
+
+
+def compare(summary: dict, baseline_path: str):
+    baseline = json.loads(Path(baseline_path).read_text())['summary']
+    print(f"\nAgainst {baseline_path}:")
+    for key, higher_is_better in COMPARED.items():
+        old, new = baseline.get(key), summary.get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        better = change > 0 if higher_is_better else change < 0
+        marker = '' if abs(change) < 5 else (' (better)' if better else ' (WORSE)')
+        print(f"  {key:22s} {old:12.3f} -> {new:12.3f}  {change:+6.1f}%{marker}")
+
+
+def print_run(r: dict):
+    stages = ', '.join(f"{k} {v:.2f}s" for k, v in sorted(r['stage_seconds'].items()))
+    print(f"run {r['run']}: {r['files']} files, {r['written_chunks']} chunks in {r['duration']:.2f}s "
+          f"({r['files_per_second']:.0f} files/s, {r['chunks_per_second']:.0f} chunks/s), "
+          f"first chunk {r['time_to_first_chunk'] or 0:.2f}s, peak RSS {r['peak_rss_mb']:.0f} MB, "
+          f"embedder calls {r['embedder_calls']}, cache hit rate {r['embed_cache_hit_rate']:.0%}")
+    print(f"       stage time: {stages}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=1000, help='number of synthetic files')
+    parser.add_argument('--avg-chars', type=int, default=4000, help='average file size in characters')
+    parser.add_argument('--mix', default=','.join(f"{k[1:]}:{v}" for k, v in DEFAULT_MIX.items()),
+                        help='language mix, e.g. py:0.5,ts:0.3,md:0.2')
+    parser.add_argument('--duplicates', type=float, default=0.0, help='fraction of files that are copies')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repo', help='benchmark an existing checkout instead of a synthetic repo')
+    parser.add_argument('--runs', type=int, default=1, help='ingest the same tree this many times')
+    parser.add_argument('--dim', type=int, default=1024, help='fake embedding dimension')
+    parser.add_argument('--embed-latency', type=float, default=0.0, help='seconds per embed request')
+    parser.add_argument('--embed-item-latency', type=float, default=0.0, help='seconds per embedded chunk')
+    parser.add_argument('--batch-size', type=int, help='initial embed batch size')
+    parser.add_argument('--concurrency', type=int, help='embed requests in flight')
+    parser.add_argument('--chunk-workers', type=int, help='processes reading and chunking files (1 = in-process)')
+    parser.add_argument('--backend', choices=['numpy', 'chroma'], default='numpy')
+    parser.add_argument('--embed-cache-mb', type=float, default=0,
+                        help='enable the on-disk embedding cache with this budget (runs after the first hit it)')
+    parser.add_argument('--out', help='write JSON results to this file')
+    parser.add_argument('--baseline', help='compare against a previous JSON result')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary work directory')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    workdir = Path(tempfile.mkdtemp(prefix='aura-bench-'))
+    embedder = FakeEmbedder(dim=args.dim, latency=args.embed_latency, per_item_latency=args.embed_item_latency)
+    try:
+        _configure(args, workdir, embedder)
+
+        if args.repo:
+            repo_path = args.repo
+            repo_info = {'path': repo_path}
+        else:
+            repo_path = str(workdir / 'repo')
+            t0 = time.time()
+            repo_info = generate_repo(repo_path, files=args.files, avg_chars=args.avg_chars,
+                                      mix=parse_mix(args.mix), duplicate_ratio=args.duplicates, seed=args.seed)
+            print(f"Generated {repo_info['files']} files ({repo_info['total_chars'] / 1e6:.1f}M chars) "
+                  f"in {time.time() - t0:.1f}s")
+
+        runs = []
+        for i in range(args.runs):
+            runs.append(run_once(repo_path, embedder, i))
+            print_run(runs[-1])
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = summarize(runs)
+    results = {
+        'benchmark': 'ingest',
+        'commit': _git_commit(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('out', 'baseline', 'keep', 'verbose')},
+        'repo': repo_info,
+        'runs': runs,
+        'summary': summary,
+    }
+
+    if args.baseline:
+        compare(summary, args.baseline)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {args.out}")
+    return results
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
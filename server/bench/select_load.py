@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""End-to-end /select load generator.
+
+By default it starts everything it needs:
+  - a stub Ollama/Cerebras process (bench.stubs) with tunable latency
+  - an embedded vector store seeded with synthetic chunks (VECTOR_BACKEND=numpy)
+  - the server itself (uvicorn app.app:app) wired to both
+
+It then drives /select with a fixed number of concurrent clients
+(--concurrency) or at a fixed arrival rate (--rate). It reports p50/p95/p99
+of time to the first NDJSON delta and of total stream time, plus the error
+rate. Use --url to load an already running server instead.
+
+    cd server
+    python -m bench.select_load --concurrency 32 --requests 500 --out results/select.json
+    python -m bench.select_load --rate 50 --duration 30 --ttft 0.5
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from bench.fake_embedder import FakeEmbedder
+from bench.synthetic import generate_file
+from bench.ingest_bench import _git_commit
+
+OWNER, REPO = 'bench', 'select'
+SESSION_ID = 'bench-session'
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def seed_index(index_dir: str, chunks: int, dim: int, seed: int = 0) -> Tuple[List[str], List[str]]:
+    """Fill the embedded store with synthetic chunks; returns their texts and file paths"""
+    from app.chunker import chunk_text
+    from app.vectordb import repo_collection_name
+    from app.vectorstore import NumpyStore
+    from app.lexical import LexicalIndex
+    from app.locator import LocatorIndex
+
+    rng = random.Random(seed)
+    embedder = FakeEmbedder(dim=dim)
+    name = repo_collection_name(OWNER, REPO)
+    collection = NumpyStore(Path(index_dir)).get_or_create_collection(name)
+    # The side indexes ingestion keeps next to the collection
+    lexical_index = LexicalIndex(str(Path(index_dir) / name / 'lexical.sqlite'))
+    locator_index = LocatorIndex(str(Path(index_dir) / name / 'locator.sqlite'))
+    texts, paths, ids, metadatas = [], [], [], []
+    file_index = 0
+    while len(texts) < chunks:
+        ext = rng.choice(['.py', '.ts', '.go'])
+        path = f"pkg/file_{file_index}{ext}"
+        for i, (text, start, end) in enumerate(chunk_text(generate_file(rng, ext, 6000), path)):
+            texts.append(text)
+            paths.append(path)
+            ids.append(f"{path}::{i}")
+            metadatas.append({'relative_path': path, 'file_type': ext, 'chunk_index': i,
+                              'start_line': start, 'end_line': end})
+        file_index += 1
+    texts, paths, ids, metadatas = texts[:chunks], paths[:chunks], ids[:chunks], metadatas[:chunks]
+    for i in range(0, len(texts), 1000):
+        collection.upsert(ids=ids[i:i + 1000], documents=texts[i:i + 1000], metadatas=metadatas[i:i + 1000],
+                          embeddings=[embedder.vector(t) for t in texts[i:i + 1000]])
+        lexical_index.add(ids[i:i + 1000], texts[i:i + 1000], paths[i:i + 1000])
+        locator_index.add(ids[i:i + 1000], texts[i:i + 1000], metadatas[i:i + 1000])
+    return texts, paths
+
+
+def selections(texts: List[str], count: int, distinct: int, seed: int = 0,
+               paths: Optional[List[str]] = None) -> List[Dict]:
+    """Request bodies; `distinct` > 0 cycles through that many unique selections.
+
+    With `paths` (one per text) each body names the file its selection came
+    from, as the extension would; otherwise every body uses pkg/file_0.py.
+    """
+    rng = random.Random(seed)
+    pool = distinct or count
+    bodies = []
+    for i in range(pool):
+        index = rng.randrange(len(texts))
+        lines = texts[index].splitlines() or ['pass']
+        start = rng.randrange(len(lines))
+        selected = '\n'.join(lines[start:start + rng.randint(1, 8)])
+        if not distinct:
+            # Keep every request a cache miss
+            selected += f"\n# req {i}"
+        bodies.append({'owner': OWNER, 'repo': REPO, 'sha': 'main',
+                       'file': paths[index] if paths else 'pkg/file_0.py',
+                       'selected_text': selected, 'language': 'python', 'session_id': SESSION_ID})
+    return [bodies[i % pool] for i in range(count)]
+
+
+async def one_request(client: httpx.AsyncClient, url: str, body: Dict) -> Dict:
+    result = {'ttft': None, 'total': None, 'status': None, 'error': None, 'deltas': 0, 'cache': None}
+    start = time.perf_counter()
+    try:
+        async with client.stream('POST', f"{url}/select", json=body) as response:
+            result['status'] = response.status_code
+            result['cache'] = response.headers.get('x-aura-cache')
+            if response.status_code != 200:
+                result['error'] = f"HTTP {response.status_code}"
+                await response.aread()
+            elif not response.headers.get('content-type', '').startswith('application/x-ndjson'):
+                # /select answered with the non-streaming fallback explanation
+                result['error'] = 'fallback response'
+                await response.aread()
+            else:
+                done = False
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    if 'delta' in event:
+                        if result['ttft'] is None:
+                            result['ttft'] = time.perf_counter() - start
+                        if event['delta'].startswith('Error streaming response'):
+                            result['error'] = event['delta']
+                        result['deltas'] += 1
+                    elif 'error' in event:
+                        result['error'] = event['error']
+                    elif event.get('done'):
+                        done = True
+                if not done and not result['error']:
+                    result['error'] = 'stream ended without done'
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['total'] = time.perf_counter() - start
+    return result
+
+
+async def prefetch_files(url: str, bodies: List[Dict], timeout: float) -> int:
+    """POST /prefetch once per file the bodies select in; returns how many files were warmed"""
+    files = sorted({b['file'] for b in bodies})
+    warmed = 0
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        for file in files:
+            response = await client.post(f"{url}/prefetch", json={
+                'owner': OWNER, 'repo': REPO, 'sha': 'main', 'file': file, 'session_id': SESSION_ID})
+            warmed += bool(response.status_code == 200 and response.json().get('success'))
+    return warmed
+
+
+async def run_load(url: str, bodies: List[Dict], concurrency: int, rate: float,
+                   duration: Optional[float], timeout: float) -> List[Dict]:
+    results = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        deadline = time.perf_counter() + duration if duration else None
+
+        def more(i: int) -> bool:
+            if deadline is not None:
+                return time.perf_counter() < deadline
+            return i < len(bodies)
+
+        if rate:
+            # Open loop: arrivals do not wait for earlier requests to finish
+            tasks = []
+            i = 0
+            start = time.perf_counter()
+            while more(i):
+                tasks.append(asyncio.create_task(one_request(client, url, bodies[i % len(bodies)])))
+                i += 1
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            results = await asyncio.gather(*tasks)
+        else:
+            counter = iter(range(sys.maxsize))
+
+            async def worker():
+                while True:
+                    i = next(counter)
+                    if not more(i):
+                        return
+                    results.append(await one_request(client, url, bodies[i % len(bodies)]))
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return list(results)
+
+
+def summarize(results: List[Dict], wall: float) -> Dict:
+    ok = [r for r in results if not r['error']]
+    summary = {
+        'requests': len(results),
+        'errors': len(results) - len(ok),
+        'error_rate': (len(results) - len(ok)) / len(results) if results else 0.0,
+        'wall_seconds': wall,
+        'throughput_rps': len(results) / wall if wall else 0.0,
+        'cache_hits': sum(1 for r in results if r['cache'] == 'hit'),
+        'coalesced': sum(1 for r in results if r['cache'] == 'coalesced'),
+    }
+    for name in ('ttft', 'total'):
+        values = [r[name] for r in ok if r[name] is not None]
+        for pct in (50, 95, 99):
+            summary[f'{name}_p{pct}'] = percentile(values, pct)
+        summary[f'{name}_max'] = max(values) if values else None
+    errors = {}
+    for r in results:
+        if r['error']:
+            errors[r['error'][:120]] = errors.get(r['error'][:120], 0) + 1
+    summary['error_kinds'] = errors
+    return summary
+
+
+def _wait_for(url: str, proc: subprocess.Popen, what: str, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise Exception(f"{what} exited with code {proc.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise Exception(f"{what} did not come up at {url}")
+
+
+def start_stack(args, workdir: Path) -> tuple:
+    """Start the stubs and the server; returns (server url, stub url, processes)"""
+    stub_port, server_port = _free_port(), _free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    log = open(workdir / 'processes.log', 'w')
+    stub = subprocess.Popen(
+        [sys.executable, '-m', 'bench.stubs', '--port', str(stub_port), '--dim', str(args.dim),
+         '--embed-latency', str(args.embed_latency), '--ttft', str(args.ttft),
+         '--token-interval', str(args.token_interval), '--tokens', str(args.tokens),
+         '--error-rate', str(args.stub_error_rate)],
+        stdout=log, stderr=subprocess.STDOUT,
+    )
+    _wait_for(f"{stub_url}/stats", stub, 'stub server')
+
+    env = dict(
+        os.environ,
+        OLLAMA_HOST=f"127.0.0.1:{stub_port}",
+        CEREBRAS_BASE_URL=stub_url,
+        CEREBRAS_API_KEY='stub',
+        VECTOR_BACKEND='numpy',
+        AURA_INDEX_DIR=str(workdir / 'index'),
+        AURA_STATE_PATH=str(workdir / 'state.sqlite'),
+        CHROMA_HOST='127.0.0.1:9',  # nothing listens here; the numpy backend never asks
+        EMBED_CACHE_MB='0',
+    )
+    if not args.response_cache:
+        env['RESPONSE_CACHE_MAX_ENTRIES'] = '0'
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.app:app', '--host', '127.0.0.1', '--port', str(server_port),
+         '--log-level', 'warning', '--workers', str(args.workers)],
+        stdout=log, stderr=subprocess.STDOUT, env=env,
+    )
+    server_url = f"http://127.0.0.1:{server_port}"
+    _wait_for(f"{server_url}/cache/stats", server, 'server')
+    return server_url, stub_url, [server, stub]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='load an already running server (no stubs are started)')
+    parser.add_argument('--concurrency', type=int, default=16, help='closed-loop clients')
+    parser.add_argument('--rate', type=float, default=0, help='open-loop arrivals per second (overrides --concurrency)')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--duration', type=float, help='run for this many seconds instead of --requests')
+    parser.add_argument('--distinct', type=int, default=0, help='unique selections to cycle through (0 = all unique)')
+    parser.add_argument('--warmup', type=int, default=5, help='requests sent (and discarded) before measuring')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--chunks', type=int, default=5000, help='chunks seeded into the vector store')
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--embed-latency', type=float, default=0.02)
+    parser.add_argument('--ttft', type=float, default=0.3, help='stub model time to first token')
+    parser.add_argument('--token-interval', type=float, default=0.01)
+    parser.add_argument('--tokens', type=int, default=100)
+    parser.add_argument('--stub-error-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    parser.add_argument('--response-cache', action='store_true', help='leave the /select response cache on')
+    parser.add_argument('--prefetch', action='store_true', help='POST /prefetch for every selected file first')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write JSON results to this file')
+    parser.add_argument('--keep', action='store_true', help='keep the work directory (index, process logs)')
+    args = parser.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix='aura-select-'))
+    processes = []
+    stub_url = None
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+            texts = [generate_file(random.Random(args.seed), '.py', 4000)]
+        else:
+            texts, paths = seed_index(str(workdir / 'index'), args.chunks, args.dim, args.seed)
+            url, stub_url, processes = start_stack(args, workdir)
+            print(f"Seeded {len(texts)} chunks; server at {url}, stubs at {stub_url}")
+
+        total = args.requests if not args.duration else max(args.requests, 10000)
+        bodies = selections(texts, total, args.distinct, args.seed, paths=None if args.url else paths)
+        if args.prefetch:
+            warmed = asyncio.run(prefetch_files(url, bodies, args.timeout))
+            print(f"Prefetched {warmed} files")
+        if args.warmup:
+            asyncio.run(run_load(url, bodies[:args.warmup], min(args.warmup, args.concurrency), 0, None, args.timeout))
+
+        start = time.perf_counter()
+        results = asyncio.run(run_load(url, bodies, args.concurrency, args.rate, args.duration, args.timeout))
+        summary = summarize(results, time.perf_counter() - start)
+        stub_stats = httpx.get(f"{stub_url}/stats").json() if stub_url else None
+    finally:
+        for proc in processes:
+            proc.terminate()
+        for proc in processes:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if args.keep:
+            print(f"Work directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    fmt = lambda v: f"{v * 1000:8.1f}ms" if v is not None else '       n/a'
+    mode = f"rate {args.rate}/s" if args.rate else f"concurrency {args.concurrency}"
+    print(f"\n{summary['requests']} requests ({mode}) in {summary['wall_seconds']:.1f}s, "
+          f"{summary['throughput_rps']:.1f} req/s, error rate {summary['error_rate']:.1%}")
+    if summary['cache_hits'] or summary['coalesced']:
+        print(f"  {summary['cache_hits']} response cache hits, {summary['coalesced']} coalesced onto in-flight answers")
+    if stub_stats:
+        print(f"  upstream: {stub_stats['completions']} completions, {stub_stats['embed_requests']} embed requests")
+    print(f"  {'':6s} {'p50':>10s} {'p95':>10s} {'p99':>10s} {'max':>10s}")
+    for name in ('ttft', 'total'):
+        print(f"  {name:6s} {fmt(summary[f'{name}_p50'])} {fmt(summary[f'{name}_p95'])} "
+              f"{fmt(summary[f'{name}_p99'])} {fmt(summary[f'{name}_max'])}")
+    for error, count in summary['error_kinds'].items():
+        print(f"  {count:5d} x {error}")
+
+    if args.out:
+        results_doc = {
+            'benchmark': 'select',
+            'commit': _git_commit(),
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'config': {k: v for k, v in vars(args).items() if k not in ('out', 'keep')},
+            'summary': summary,
+            'stubs': stub_stats,
+        }
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(results_doc, indent=2))
+        print(f"\nResults written to {args.out}")
+    return summary
+
+
+if __name__ == '__main__':
+    summary = main()
+    sys.exit(0 if summary and summary['error_rate'] < 1 else 1)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Stub Ollama and Cerebras endpoints with tunable latency.
+
+Serves the two upstream APIs the /select path depends on from one process:
+
+  POST /api/embed            Ollama embeddings (FakeEmbedder vectors)
+  POST /v1/chat/completions  Cerebras/OpenAI-style SSE completion stream
+
+Point the server at it with OLLAMA_HOST=127.0.0.1:<port> and
+CEREBRAS_BASE_URL=http://127.0.0.1:<port>.
+
+    python -m bench.stubs --port 9900 --ttft 0.3 --token-interval 0.01
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from bench.fake_embedder import FakeEmbedder
+
+_WORDS = "the function reads the selected value and returns a cached result for later calls".split()
+
+
+def create_app(dim: int = 1024, embed_latency: float = 0.0, embed_item_latency: float = 0.0,
+               ttft: float = 0.3, token_interval: float = 0.01, tokens: int = 100,
+               jitter: float = 0.1, error_rate: float = 0.0) -> FastAPI:
+    """Build the stub app; every latency is in seconds and `jitter` is relative (0.1 = +/-10%)"""
+    app = FastAPI()
+    embedder = FakeEmbedder(dim=dim)
+    counters = {'embed_requests': 0, 'completions': 0, 'failed_completions': 0}
+
+    def jittered(seconds: float) -> float:
+        return max(0.0, seconds * random.uniform(1 - jitter, 1 + jitter))
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        texts = body.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        counters['embed_requests'] += 1
+        await asyncio.sleep(jittered(embed_latency + embed_item_latency * len(texts)))
+        return embedder.embed(body.get("model", "stub"), texts)
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        counters['completions'] += 1
+        if random.random() < error_rate:
+            counters['failed_completions'] += 1
+            return JSONResponse({"error": {"message": "stub overloaded", "type": "server_error"}}, status_code=503)
+
+        model = body.get("model", "stub")
+        limit = min(tokens, body.get("max_completion_tokens") or tokens)
+        created = int(time.time())
+
+        async def events():
+            await asyncio.sleep(jittered(ttft))
+            for i in range(limit):
+                if i:
+                    await asyncio.sleep(jittered(token_interval))
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "system_fingerprint": "stub",
+                    "choices": [{"index": 0, "delta": {"content": _WORDS[i % len(_WORDS)] + " "},
+                                 "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {
+                "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created, "model": model,
+                "system_fingerprint": "stub",
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    def stats():
+        return counters
+
+    @app.api_route("/{path:path}", methods=["GET", "HEAD", "POST"])
+    def anything(path: str):
+        # Client SDKs probe arbitrary endpoints (e.g. connection warm-up)
+        return {}
+
+    return app
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9900)
+    parser.add_argument('--dim', type=int, default=1024, help='embedding dimension')
+    parser.add_argument('--embed-latency', type=float, default=0.02, help='seconds per embed request')
+    parser.add_argument('--embed-item-latency', type=float, default=0.0, help='seconds per embedded text')
+    parser.add_argument('--ttft', type=float, default=0.3, help='seconds before the first completion token')
+    parser.add_argument('--token-interval', type=float, default=0.01, help='seconds between tokens')
+    parser.add_argument('--tokens', type=int, default=100, help='tokens per completion')
+    parser.add_argument('--jitter', type=float, default=0.1, help='relative latency jitter')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of completions that fail')
+    args = parser.parse_args(argv)
+
+    app = create_app(dim=args.dim, embed_latency=args.embed_latency, embed_item_latency=args.embed_item_latency,
+                     ttft=args.ttft, token_interval=args.token_interval, tokens=args.tokens,
+                     jitter=args.jitter, error_rate=args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import os
+import random
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# Default language mix: extension -> weight
+DEFAULT_MIX = {'.py': 0.4, '.ts': 0.25, '.go': 0.15, '.java': 0.1, '.md': 0.1}
+
+_WORDS = [
+    'user', 'repo', 'commit', 'chunk', 'index', 'cache', 'token', 'stream', 'config', 'request',
+    'response', 'session', 'buffer', 'vector', 'query', 'result', 'status', 'worker', 'queue', 'batch',
+    'parse', 'load', 'store', 'fetch', 'build', 'merge', 'split', 'resolve', 'update', 'render',
+]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse 'py:0.5,ts:0.3,md:0.2' into {'.py': 0.5, ...}"""
+    mix = {}
+    for part in spec.split(','):
+        ext, _, weight = part.partition(':')
+        ext = ext.strip()
+        mix[ext if ext.startswith('.') else f'.{ext}'] = float(weight or 1)
+    return mix
+
+
+def _name(rng: random.Random, parts: int = 2) -> str:
+    return '_'.join(rng.choice(_WORDS) for _ in range(parts))
+
+
+def _camel(rng: random.Random, parts: int = 2) -> str:
+    words = [rng.choice(_WORDS) for _ in range(parts)]
+    return words[0] + ''.join(w.title() for w in words[1:])
+
+
+def _body(rng: random.Random, indent: str, statement: str) -> List[str]:
+    lines = []
+    for _ in range(rng.randint(3, 12)):
+        lines.append(indent + statement.format(a=_name(rng), b=_name(rng), n=rng.randint(0, 999)))
+    return lines
+
+
+def _python_unit(rng: random.Random) -> List[str]:
+    if rng.random() < 0.3:
+        lines = [f"class {_camel(rng).title()}:", f'    """{_name(rng, 4).replace("_", " ")}"""', ""]
+        for _ in range(rng.randint(2, 5)):
+            lines.append(f"    def {_name(rng)}(self, {_name(rng, 1)}, {_name(rng, 1)}=None):")
+            lines += _body(rng, "        ", "{a} = self.{b}({n})")
+            lines.append("        return None")
+            lines.append("")
+        return lines
+    lines = [f"def {_name(rng)}({_name(rng, 1)}, {_name(rng, 1)}):",
+             f'    """{_name(rng, 5).replace("_", " ")}"""']
+    lines += _body(rng, "    ", "{a} = {b}({n})")
+    lines.append(f"    return {_name(rng)}")
+    return lines
+
+
+def _ts_unit(rng: random.Random) -> List[str]:
+    lines = [f"export function {_camel(rng)}({_camel(rng, 1)}: string, {_camel(rng, 1)}: number): void {{"]
+    lines += _body(rng, "  ", "const {a} = {b}({n});")
+    if rng.random() < 0.5:
+        lines += ["  if (" + _camel(rng) + ") {", "    return;", "  }"]
+    lines.append("}")
+    return lines
+
+
+def _go_unit(rng: random.Random) -> List[str]:
+    lines = [f"func {_camel(rng).title()}({_camel(rng, 1)} string, {_camel(rng, 1)} int) error {{"]
+    lines += _body(rng, "\t", "{a} := {b}({n})")
+    lines += ["\treturn nil", "}"]
+    return lines
+
+
+def _java_unit(rng: random.Random) -> List[str]:
+    lines = [f"    public void {_camel(rng)}(String {_camel(rng, 1)}, int {_camel(rng, 1)}) {{"]
+    lines += _body(rng, "        ", "int {a} = {b}({n});")
+    lines.append("    }")
+    return lines
+
+
+def _markdown_unit(rng: random.Random) -> List[str]:
+    lines = [f"## {_name(rng, 3).replace('_', ' ').title()}", ""]
+    for _ in range(rng.randint(2, 6)):
+        lines.append(' '.join(rng.choice(_WORDS) for _ in range(rng.randint(8, 20))) + '.')
+    lines.append("")
+    return lines
+
+
+_UNITS = {
+    '.py': (_python_unit, ["import os", "import sys", ""]),
+    '.ts': (_ts_unit, ["import { readFile } from 'fs';", ""]),
+    '.go': (_go_unit, ["package main", "", 'import "fmt"', ""]),
+    '.java': (_java_unit, ["package bench;", "", "public class Generated {"]),
+    '.md': (_markdown_unit, ["# Generated", ""]),
+}
+
+
+def generate_file(rng: random.Random, ext: str, target_chars: int) -> str:
+    unit, header = _UNITS.get(ext, _UNITS['.py'])
+    lines = list(header)
+    size = sum(len(line) + 1 for line in lines)
+    while size < target_chars:
+        block = unit(rng) + [""]
+        lines += block
+        size += sum(len(line) + 1 for line in block)
+    if ext == '.java':
+        lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_repo(root: str, files: int = 1000, avg_chars: int = 4000,
+                  mix: Dict[str, float] = None, duplicate_ratio: float = 0.0,
+                  files_per_dir: int = 50, seed: int = 0) -> Dict:
+    """Write a synthetic repository under `root`.
+
+    File sizes vary around `avg_chars` (x0.25 to x2), extensions follow
+    `mix`, and `duplicate_ratio` of files are byte-for-byte copies of
+    earlier ones (vendored code, forks). The same seed always produces the
+    same tree.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    extensions = list(mix)
+    weights = [mix[ext] for ext in extensions]
+    root_path = Path(root)
+    written: List[Tuple[str, str]] = []
+    total_chars = 0
+
+    for i in range(files):
+        ext = rng.choices(extensions, weights)[0]
+        directory = root_path / f"pkg{i // files_per_dir:03d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        if written and rng.random() < duplicate_ratio:
+            src_ext, content = rng.choice(written)
+            ext = src_ext
+        else:
+            size = int(avg_chars * rng.uniform(0.25, 2.0))
+            content = generate_file(rng, ext, size)
+            written.append((ext, content))
+        (directory / f"{_name(rng)}_{i}{ext}").write_text(content)
+        total_chars += len(content)
+
+    # Noise the ingester should skip
+    (root_path / "node_modules" / "dep").mkdir(parents=True, exist_ok=True)
+    (root_path / "node_modules" / "dep" / "index.js").write_text("module.exports = {};\n")
+    (root_path / "assets").mkdir(exist_ok=True)
+    (root_path / "assets" / "logo.png").write_bytes(os.urandom(256))
+
+    return {'files': files, 'total_chars': total_chars, 'mix': mix,
+            'duplicate_ratio': duplicate_ratio, 'seed': seed}
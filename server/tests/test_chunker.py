@@ -0,0 +1,65 @@
+import ast
+
+import pytest
+
+from app.chunker import chunk_text
+
+
+def assert_tiles(chunks, text):
+    """Chunks cover the file in order, without gaps or overlap (blank runs aside)"""
+    lines = text.splitlines(keepends=True)
+    assert ''.join(code for code, _, _ in chunks).strip() == text.strip()
+    for code, start, end in chunks:
+        assert code == ''.join(lines[start - 1:end])
+    for (_, _, end), (_, start, _) in zip(chunks, chunks[1:]):
+        assert start == end + 1
+
+
+def test_small_file_is_one_chunk():
+    assert chunk_text("x = 1\ny = 2\n", "a.py") == [("x = 1\ny = 2\n", 1, 2)]
+    assert chunk_text("", "a.py") == []
+
+
+def test_python_splits_on_statements_and_recurses_into_large_classes():
+    methods = "".join(f"    def m{i}(self):\n        return {i} * 12345678901234567890\n\n" for i in range(40))
+    text = "import os\n\nclass Big:\n" + methods + "\n# trailing comment\n"
+    chunks = chunk_text(text, "big.py", max_chars=400)
+    assert_tiles(chunks, text)
+    assert all(len(code) <= 400 for code, _, _ in chunks)
+    # Chunks end on method boundaries, including the last one stretched over trailing lines
+    for code, _, _ in chunks[1:]:
+        body = code.strip().splitlines()
+        assert not body[0].startswith("        return")
+
+
+def test_brace_scanner_ignores_braces_in_strings_and_comments():
+    functions = "".join(
+        f"function f{i}() {{\n  const s = \"}}\"; // }}\n  /* {{ */ return {i};\n}}\n" for i in range(30)
+    )
+    chunks = chunk_text(functions, "a.js", max_chars=200)
+    assert_tiles(chunks, functions)
+    for code, _, _ in chunks:
+        assert code.startswith("function") and code.rstrip().endswith("}")
+
+
+def test_markdown_splits_on_headings():
+    text = "".join(f"# Section {i}\n\n" + "words " * 30 + "\n\n" for i in range(10))
+    chunks = chunk_text(text, "README.md", max_chars=300)
+    assert_tiles(chunks, text)
+    assert all(code.startswith("# Section") for code, _, _ in chunks)
+
+
+def test_other_files_split_on_column_zero_lines():
+    blocks = "".join(f"section_{i}:\n  key: value {i}\n  other: {'x' * 40}\nend\n" for i in range(20))
+    chunks = chunk_text(blocks, "config.yaml", max_chars=250)
+    assert_tiles(chunks, blocks)
+    # `end` closes a block instead of starting one
+    assert all(code.startswith("section_") for code, _, _ in chunks)
+
+
+def test_invalid_python_falls_back_to_line_units():
+    text = "".join(f"def f{i}(:\n    pass\n" for i in range(50))
+    with pytest.raises(SyntaxError):
+        ast.parse(text)
+    chunks = chunk_text(text, "broken.py", max_chars=200)
+    assert_tiles(chunks, text)
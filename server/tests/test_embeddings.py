@@ -0,0 +1,45 @@
+from app.embeddings import BatchSizer, DiskEmbeddingCache
+
+
+def test_batch_sizer_grows_while_fast_and_halves_when_slow():
+    sizer = BatchSizer(initial=16, min_size=2, max_size=64, target_latency=1.0)
+    sizer.observe(16, 0.1)
+    assert sizer.size == 20
+    sizer.observe(20, 0.7)  # between half the target and the target: hold
+    assert sizer.size == 20
+    sizer.observe(20, 2.0)
+    assert sizer.size == 10
+
+
+def test_batch_sizer_ignores_tail_batches():
+    sizer = BatchSizer(initial=16, min_size=2, max_size=64, target_latency=1.0)
+    sizer.observe(3, 5.0)
+    assert sizer.size == 16
+
+
+def test_batch_sizer_stays_within_bounds():
+    sizer = BatchSizer(initial=100, min_size=4, max_size=32, target_latency=1.0)
+    assert sizer.size == 32
+    for _ in range(10):
+        sizer.observe(sizer.size, 0.01)
+    assert sizer.size == 32
+    for _ in range(10):
+        sizer.failed()
+    assert sizer.size == 4
+
+
+def test_disk_cache_round_trip(tmp_path):
+    cache = DiskEmbeddingCache(str(tmp_path / "embeddings.sqlite"), max_bytes=1 << 20)
+    cache.put_many("model", ["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+    assert cache.get_many("model", ["b", "c", "a"]) == [[3.0, 4.0], None, [1.0, 2.0]]
+    # Keys are per model
+    assert cache.get_many("other", ["a"]) == [None]
+    assert cache.stats()['hits'] == 2
+
+
+def test_disk_cache_errors_are_misses(tmp_path):
+    cache = DiskEmbeddingCache(str(tmp_path / "embeddings.sqlite"), max_bytes=1 << 20)
+    cache.put_many("model", ["a"], [[1.0]])
+    cache._conn.execute("DROP TABLE embeddings")
+    assert cache.get_many("model", ["a", "b"]) == [None, None]
+    cache.put_many("model", ["a"], [[1.0]])
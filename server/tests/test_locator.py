@@ -0,0 +1,57 @@
+from app.locator import LocatorIndex
+
+
+def record(index, chunks):
+    """chunks: {chunk_id: (text, start_line, end_line)}"""
+    index.add(
+        list(chunks),
+        [text for text, _, _ in chunks.values()],
+        [{'relative_path': i.rpartition('::')[0], 'start_line': s, 'end_line': e} for i, (_, s, e) in chunks.items()],
+    )
+
+
+def make_index(tmp_path):
+    index = LocatorIndex(str(tmp_path / "locator.sqlite"))
+    record(index, {
+        'a.py::0': ("def alpha_function():\n    return compute_alpha()\n", 1, 2),
+        'a.py::1': ("def beta_function():\n    return compute_beta()\n", 3, 4),
+        'b.py::0': ("def alpha_function():\n    return compute_alpha()\n", 1, 2),
+        'c.py::0': ("def gamma_function():\n    return compute_gamma()\n", 1, 2),
+    })
+    index.put_neighbors({
+        'a.py::0': [('b.py::0', 0.1), ('c.py::0', 0.5)],
+        'c.py::0': [('a.py::1', 0.4)],
+        'b.py::0': [('c.py::0', 0.2)],
+    })
+    return index
+
+
+def test_lookups_by_lines_and_line_range(tmp_path):
+    index = make_index(tmp_path)
+    assert set(index.chunks_with_lines("return compute_alpha()")) == {'a.py::0', 'b.py::0'}
+    assert index.chunks_with_lines("return compute_alpha()", 'b.py') == ['b.py::0']
+    assert index.file_chunks('a.py') == ['a.py::0', 'a.py::1']
+    assert index.file_chunks('a.py', 2, 3) == ['a.py::0', 'a.py::1']
+    assert index.file_chunks('a.py', 2, 3, covering=True) == []
+    assert index.file_chunks('a.py', 3, 4, covering=True) == ['a.py::1']
+
+
+def test_rewriting_a_file_drops_lists_that_depend_on_it(tmp_path):
+    index = make_index(tmp_path)
+    record(index, {'a.py::1': ("def beta_function():\n    return compute_beta(1)\n", 3, 4)})
+    # a's own list goes, and so does c's, which holds a.py::1; b's does not mention a.py
+    assert set(index.get_neighbors(['a.py::0', 'b.py::0', 'c.py::0'])) == {'b.py::0'}
+
+
+def test_deleting_a_file_drops_only_dependent_lists(tmp_path):
+    index = make_index(tmp_path)
+    index.delete_paths(['b.py'])
+    assert set(index.get_neighbors(['a.py::0', 'b.py::0', 'c.py::0'])) == {'c.py::0'}
+    assert index.chunks_with_lines("return compute_alpha()") == ['a.py::0']
+
+
+def test_clear_neighbors_keeps_chunks(tmp_path):
+    index = make_index(tmp_path)
+    index.clear_neighbors()
+    assert index.get_neighbors(['a.py::0', 'c.py::0']) == {}
+    assert index.count() == 4
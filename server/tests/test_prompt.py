@@ -0,0 +1,60 @@
+from app import prompt
+
+
+def hit(code, file, start, end, distance=None, **extra):
+    return {'code': code, 'file': file, 'start_line': start, 'end_line': end, 'distance': distance, **extra}
+
+
+def test_drops_duplicates_and_the_selections_own_chunk():
+    selected = "def own():\n    return 1\n"
+    packed = prompt.pack_context([
+        hit("def own():\n    return 1\n\nx = 2\n", "a.py", 1, 4, 0.1),
+        hit("def other():\n    pass\n", "b.py", 1, 2, 0.2),
+        hit("def   other():\n  pass", "c.py", 5, 6, 0.3),
+    ], selected, file="a.py")
+    assert [s['file'] for s in packed] == ["b.py"]
+
+
+def test_ranks_by_distance_with_definitions_first():
+    packed = prompt.pack_context([
+        hit("far = 1\n", "a.py", 1, 1, 0.9),
+        hit("near = 1\n", "b.py", 1, 1, 0.1),
+        hit("def used():\n    pass\n", "c.py", 1, 2, 0.5, symbol="used"),
+    ], "used()")
+    assert [s['file'] for s in packed] == ["c.py", "b.py", "a.py"]
+
+
+def test_keeps_retrieval_order_when_a_distance_is_missing():
+    packed = prompt.pack_context([
+        hit("lexical = 1\n", "a.py", 1, 1, None),
+        hit("vector = 1\n", "b.py", 1, 1, 0.1),
+    ], "something else")
+    assert [s['file'] for s in packed] == ["a.py", "b.py"]
+
+
+def test_merges_adjacent_chunks_and_drops_overlapping_ones():
+    packed = prompt.pack_context([
+        hit("second = 2\n", "a.py", 11, 20, 0.1),
+        hit("first = 1\n", "a.py", 1, 10, 0.2),
+        hit("overlap = 3\n", "a.py", 5, 15, 0.3),
+    ], "unrelated")
+    assert len(packed) == 1
+    assert (packed[0]['start_line'], packed[0]['end_line']) == (1, 20)
+    assert packed[0]['code'] == "first = 1\nsecond = 2\n"
+
+
+def test_stays_within_the_token_budget():
+    snippets = [hit(f"v{i} = '{'x' * 2000}'\n", f"f{i}.py", 1, 1, i / 10) for i in range(5)]
+    budget = 800
+    packed = prompt.pack_context(snippets, "unrelated", budget=budget)
+    used = sum(prompt.estimate_tokens(s['code']) + prompt.SNIPPET_OVERHEAD_TOKENS for s in packed)
+    assert packed and used <= budget
+    # The snippet that did not fit whole is truncated rather than dropped
+    assert packed[-1]['code'].endswith("[truncated]")
+
+
+def test_skips_tails_too_small_to_be_useful():
+    snippets = [hit("a" * 400, "a.py", 1, 1, 0.1), hit("b" * 400, "b.py", 1, 1, 0.2)]
+    budget = prompt.estimate_tokens("a" * 400) + 2 * prompt.SNIPPET_OVERHEAD_TOKENS + 10
+    packed = prompt.pack_context(snippets, "unrelated", budget=budget)
+    assert [s['file'] for s in packed] == ["a.py"]
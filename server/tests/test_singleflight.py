@@ -0,0 +1,114 @@
+import asyncio
+
+from app.singleflight import SingleFlight
+
+
+async def collect(flight):
+    return [line async for line in flight.subscribe()]
+
+
+def test_followers_join_the_leaders_flight_and_replay_its_lines():
+    async def scenario():
+        flights = SingleFlight()
+        leader, leads = flights.join("k")
+        gate = asyncio.Event()
+
+        async def produce():
+            leader.publish(b"one\n")
+            await gate.wait()
+            leader.publish(b"two\n", final=True)
+
+        flights.start(leader, produce())
+        await asyncio.sleep(0)
+        follower, follows_leads = flights.join("k")
+        reader = asyncio.create_task(collect(follower))
+        gate.set()
+        lines = await reader
+        return leads, follows_leads, follower is leader, lines, flights.stats()
+
+    leads, follower_leads, same, lines, stats = asyncio.run(scenario())
+    assert leads and not follower_leads and same
+    assert lines == [b"one\n", b"two\n"]
+    assert stats['in_flight'] == 0
+    assert stats['leaders'] == 1 and stats['followers'] == 1
+
+
+def test_flight_is_forgotten_once_finished():
+    async def scenario():
+        flights = SingleFlight()
+        first, _ = flights.join("k")
+
+        async def produce():
+            first.publish(b"done\n", final=True)
+
+        flights.start(first, produce())
+        await first.task
+        second, leads = flights.join("k")
+        return second is first, leads
+
+    same, leads = asyncio.run(scenario())
+    assert not same and leads
+
+
+def test_last_release_cancels_the_producer():
+    async def scenario():
+        flights = SingleFlight()
+        flight, _ = flights.join("k")
+        follower, _ = flights.join("k")
+        started = asyncio.Event()
+
+        async def produce():
+            flight.publish(b"partial\n")
+            started.set()
+            await asyncio.sleep(3600)
+
+        flights.start(flight, produce())
+        await started.wait()
+        flight.release()
+        still_running = not flight.task.done()
+        follower.release()
+        try:
+            await flight.task
+        except asyncio.CancelledError:
+            pass
+        return still_running, flight.task.cancelled(), flight.lines[-1], flights.stats()['in_flight']
+
+    still_running, cancelled, last, in_flight = asyncio.run(scenario())
+    assert still_running and cancelled
+    # Readers replaying the flight see it terminated
+    assert b"cancelled" in last
+    assert in_flight == 0
+
+
+def test_producer_error_before_any_output_fails_the_flight():
+    async def scenario():
+        flights = SingleFlight()
+        flight, _ = flights.join("k")
+
+        async def produce():
+            raise RuntimeError("upstream down")
+
+        flights.start(flight, produce())
+        await flight.task
+        return flight.error, flight.done, flight.lines
+
+    error, done, lines = asyncio.run(scenario())
+    assert error == "upstream down" and done and lines == []
+
+
+def test_producer_error_after_output_ends_the_stream_with_an_error_line():
+    async def scenario():
+        flights = SingleFlight()
+        flight, _ = flights.join("k")
+
+        async def produce():
+            flight.publish(b"partial\n")
+            raise RuntimeError("upstream down")
+
+        flights.start(flight, produce())
+        await flight.task
+        return flight.error, await collect(flight)
+
+    error, lines = asyncio.run(scenario())
+    assert error is None
+    assert lines == [b"partial\n", b'{"error": "upstream down"}\n']
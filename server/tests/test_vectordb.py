@@ -0,0 +1,54 @@
+from app import vectordb
+from app.vectordb import RRF_K
+
+
+class FakeCollection:
+    """Just enough of a collection for fetching chunks by ID"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.requested = []
+
+    def get(self, ids):
+        self.requested.append(list(ids))
+        ids = [i for i in ids if i in self.documents]
+        return {'ids': ids, 'documents': [self.documents[i] for i in ids],
+                'metadatas': [{'relative_path': i.split('::')[0]} for i in ids]}
+
+
+def vector_results(ids, distances):
+    return {
+        'ids': [ids],
+        'documents': [[f"doc {i}" for i in ids]],
+        'metadatas': [[{'relative_path': i.split('::')[0]} for i in ids]],
+        'distances': [distances],
+    }
+
+
+def test_fuse_ranks_by_reciprocal_rank():
+    collection = FakeCollection({'c.py::0': "doc c.py::0"})
+    vector = vector_results(['a.py::0', 'b.py::0'], [0.1, 0.2])
+    fused = vectordb._fuse(collection, vector, [('b.py::0', 9.0), ('c.py::0', 5.0)], n_results=10)
+
+    # b is found by both searches, so it overtakes a
+    assert fused['ids'][0] == ['b.py::0', 'a.py::0', 'c.py::0']
+    assert fused['scores'][0] == [1 / (RRF_K + 2) + 1 / (RRF_K + 1), 1 / (RRF_K + 1), 1 / (RRF_K + 2)]
+
+
+def test_fuse_fetches_only_lexical_only_hits_and_keeps_vector_distances():
+    collection = FakeCollection({'c.py::0': "doc c.py::0"})
+    vector = vector_results(['a.py::0'], [0.3])
+    fused = vectordb._fuse(collection, vector, [('a.py::0', 2.0), ('c.py::0', 1.0)], n_results=10)
+
+    assert collection.requested == [['c.py::0']]
+    distances = dict(zip(fused['ids'][0], fused['distances'][0]))
+    assert distances == {'a.py::0': 0.3, 'c.py::0': None}
+    assert fused['documents'][0] == ["doc a.py::0", "doc c.py::0"]
+
+
+def test_fuse_truncates_and_drops_hits_missing_from_the_collection():
+    collection = FakeCollection({})
+    vector = vector_results(['a.py::0', 'b.py::0', 'c.py::0'], [0.1, 0.2, 0.3])
+    fused = vectordb._fuse(collection, vector, [('gone.py::0', 1.0)], n_results=3)
+    # gone.py ranks second but has no stored chunk; c.py is cut by n_results
+    assert fused['ids'][0] == ['a.py::0', 'b.py::0']
@@ -37,10 +37,12 @@ if [ $? -eq 0 ]; then
     echo "   - Select some code"
     echo "   - See the tooltip with explanation!"
     echo ""
-    echo "3. To ingest a repository for full context:"
-    echo "   curl -X POST 'http://localhost:8787/ingest' \\"
+    echo "3. To clone and index a repository for full context:"
+    echo "   curl -X POST 'http://localhost:8787/clone' \\"
     echo "     -H 'Content-Type: application/json' \\"
-    echo "     -d '{\"repo\": \"microsoft/vscode\", \"prNumber\": 1, \"head_sha\": \"main\"}'"
+    echo "     -d '{\"owner\": \"microsoft\", \"repo\": \"vscode\", \"url\": \"https://github.com/microsoft/vscode\"}'"
+    echo "   Then follow progress with:"
+    echo "   curl 'http://localhost:8787/ingest/status?owner=microsoft&repo=vscode'"
     echo ""
     echo "4. To stop the server:"
     echo "   docker-compose down"